@@ -0,0 +1,115 @@
+"""Read-only connections for the reports and exports, apart from the transactional traffic.
+
+The reports (aged balance, purchases) and the Parquet export read large parts
+of the database. Instead of the thread pool of the request handlers, they run:
+- on read-only connections (mode=ro and PRAGMA query_only), kept open between
+  reports, with a larger page cache and memory-mapped reads;
+- in their own thread pool of WORKERS threads: at most WORKERS reports run at
+  the same time and the next ones wait for a free slot, so the reports never
+  take all the threads of the handlers writing the bons and versements.
+
+A reader doesn't block the writers only in WAL mode: the database is switched
+to it at startup (see prepare_database in main.py).
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import concurrent.futures
+
+import query_trace
+
+# Reports running at the same time (one connection and one thread each)
+WORKERS = int(os.getenv("VITAL_ANALYTICS_WORKERS", "2"))
+# Page cache of each connection, and size of the file mapped in memory
+CACHE_MB = int(os.getenv("VITAL_ANALYTICS_CACHE_MB", "64"))
+MMAP_MB = int(os.getenv("VITAL_ANALYTICS_MMAP_MB", "1024"))
+
+
+def connect_read_only(db_path):
+    """Open a read-only connection to the database, set up for large reads."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False,
+                           factory=query_trace.connection_factory())
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA query_only = ON")
+    cursor.execute(f"PRAGMA cache_size = -{CACHE_MB * 1024}")
+    cursor.execute(f"PRAGMA mmap_size = {MMAP_MB * 1024 * 1024}")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class AnalyticsPool:
+    """Runs the reports in their own threads, on read-only connections, WORKERS at a time."""
+
+    def __init__(self, connect, workers=WORKERS):
+        self.connect = connect
+        self.workers = workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analytics")
+        self._slots = asyncio.Semaphore(workers)
+        self._connections = []
+        self._lock = threading.Lock()
+
+    async def run(self, fn, *args):
+        """Return fn(cursor, *args), run in the pool on one of its connections."""
+        async with self._slots:
+            return await asyncio.wrap_future(self._executor.submit(self._run, fn, args))
+
+    async def call(self, fn, *args):
+        """Return fn(*args), run in the pool (for a task opening its own connections, like the export)."""
+        async with self._slots:
+            return await asyncio.wrap_future(self._executor.submit(fn, *args))
+
+    async def stream(self, fn, *args):
+        """Yield the chunks of the generator fn(cursor, *args), each one read in the pool.
+
+        The slot and the connection are kept until the last chunk is sent."""
+        async with self._slots:
+            conn = self._take()
+            chunks = fn(conn.cursor(), *args)
+            future = None
+            try:
+                while True:
+                    future = self._executor.submit(next, chunks, None)
+                    chunk = await asyncio.wrap_future(future)
+                    if chunk is None:
+                        break
+                    yield chunk
+            finally:
+                # An interrupted download may leave a read running: the connection
+                # is given back after it, with its statement ended
+                self._executor.submit(self._end_stream, chunks, conn, future)
+
+    def _run(self, fn, args):
+        # Taken and given back in the thread of the pool: a cancelled request
+        # doesn't give back a connection still in use
+        conn = self._take()
+        try:
+            return fn(conn.cursor(), *args)
+        finally:
+            self._give_back(conn)
+
+    def _end_stream(self, chunks, conn, future):
+        if future is not None:
+            concurrent.futures.wait([future])
+        chunks.close()
+        self._give_back(conn)
+
+    def _take(self):
+        with self._lock:
+            if self._connections:
+                return self._connections.pop()
+        return self.connect()
+
+    def _give_back(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._connections.append(conn)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
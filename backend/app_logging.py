@@ -0,0 +1,151 @@
+"""Structured JSON logging with a non-blocking, queue-based handler.
+
+Handlers only put log records on an in-memory queue. A background thread
+(the QueueListener) formats them as JSON lines and writes them to stdout,
+so request handlers never do synchronous I/O when they log.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+
+# Log level of the application loggers (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = os.getenv("VITAL_LOG_LEVEL", "INFO").upper()
+
+# Fraction of debug payloads that are actually logged (0.0 to 1.0)
+PAYLOAD_SAMPLE_RATE = float(os.getenv("VITAL_LOG_PAYLOAD_SAMPLE", "0.05"))
+
+# Maximum number of records waiting to be written; extra records are dropped
+QUEUE_SIZE = int(os.getenv("VITAL_LOG_QUEUE_SIZE", "10000"))
+
+# Request ID of the request being handled (set by the middleware in main.py)
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+_listener = None
+_dropped_records = 0
+
+
+def new_request_id() -> str:
+    """Generate a short unique request ID."""
+    return uuid.uuid4().hex[:16]
+
+
+class RequestIdFilter(logging.Filter):
+    """Attach the current request ID to every log record."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a log record as a single JSON line.
+
+    Extra structured fields can be passed with extra={"fields": {...}}."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Already rendered by NonBlockingQueueHandler.prepare()
+            entry["exception"] = record.exc_text
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full."""
+
+    def enqueue(self, record):
+        global _dropped_records
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped_records += 1
+
+    def prepare(self, record):
+        # Resolve the message in the caller thread (arguments may change later),
+        # but leave the JSON formatting to the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_text = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """Configure the 'vital' loggers once. Safe to call several times."""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    # The listener thread does the formatting and the actual write to stdout
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root_logger = logging.getLogger("vital")
+    root_logger.setLevel(LOG_LEVEL)
+    root_logger.addHandler(queue_handler)
+    root_logger.propagate = False
+
+
+def stop_logging():
+    """Flush the queue and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return an application logger (a child of the 'vital' logger)."""
+    return logging.getLogger(f"vital.{name}")
+
+
+def log_payload(logger: logging.Logger, message: str, **fields):
+    """Log a request/response payload at DEBUG level, for a sample of the calls only.
+
+    Nothing is queued when DEBUG is disabled or the call is not sampled."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= PAYLOAD_SAMPLE_RATE:
+        return
+    logger.debug(message, extra={"fields": fields})
+
+
+def get_logging_stats():
+    """Return the number of records dropped because the queue was full."""
+    return {"dropped_records": _dropped_records}
@@ -0,0 +1,437 @@
+"""Online backup of the SQLite database with WAL shipping and point-in-time restore.
+
+When VITAL_BACKUP_DIR is set, the database runs in WAL mode and one worker
+process runs a WalShipper thread which:
+
+1. takes a snapshot of the database with the SQLite online backup API, a few
+   pages at a time, so that writers are not blocked (a "generation");
+2. every few seconds, copies the frames appended to the -wal file since the
+   last copy into a segment file of the current generation;
+3. when the -wal file gets big, checkpoints it itself, and starts a new
+   generation when it can't prove that no frame was missed.
+
+The automatic checkpoints must be disabled on every connection to the
+database (PRAGMA wal_autocheckpoint = 0, see connect_db in main.py): SQLite
+could otherwise reset the WAL before its frames are shipped, and each reset
+would force a new snapshot.
+
+Layout of the backup directory:
+
+    <dir>/<generation>/snapshot.sqlite
+    <dir>/<generation>/<period>-<salt>/header.bin        (header of the -wal file)
+    <dir>/<generation>/<period>-<salt>/<seq>-<ms>.frames (frames shipped at <ms>)
+
+The restore command copies the snapshot of the last generation before the
+chosen time and replays the segments shipped up to that time:
+
+    python backup.py restore --dir /data/backups --output restored.sqlite --time "2025-01-15 14:30"
+"""
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no shipping lock (single process in development)
+    fcntl = None
+
+# Backups are disabled unless a directory is configured
+BACKUP_DIR = os.getenv("VITAL_BACKUP_DIR")
+
+# Seconds between two WAL copies (the maximum data loss)
+SHIP_INTERVAL = float(os.getenv("VITAL_BACKUP_INTERVAL", "10"))
+
+# Size of the current WAL period from which the shipper checkpoints it
+CHECKPOINT_BYTES = int(float(os.getenv("VITAL_BACKUP_CHECKPOINT_MB", "4")) * 1024 * 1024)
+
+# A new snapshot is taken after this many hours; older generations are deleted
+SNAPSHOT_HOURS = float(os.getenv("VITAL_BACKUP_SNAPSHOT_HOURS", "24"))
+KEEP_GENERATIONS = int(os.getenv("VITAL_BACKUP_KEEP", "7"))
+
+# Pages copied per step of the online backup, and pause between two steps
+BACKUP_STEP_PAGES = 256
+BACKUP_STEP_SLEEP = 0.005
+
+WAL_HEADER_SIZE = 32
+FRAME_HEADER_SIZE = 24
+
+
+def online_backup(db_path, destination):
+    """Copy a live database to `destination` with the online backup API. Returns the number of pages."""
+    temporary = destination + ".tmp"
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(temporary)
+    try:
+        # Copying a few pages per step releases the lock between the steps
+        source.backup(target, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP)
+        pages = target.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        target.close()
+        source.close()
+    os.replace(temporary, destination)
+    return pages
+
+
+def read_wal_header(wal_path):
+    """Return the 32-byte header of a -wal file, or None if the file is empty or missing."""
+    try:
+        with open(wal_path, "rb") as file:
+            header = file.read(WAL_HEADER_SIZE)
+    except FileNotFoundError:
+        return None
+    return header if len(header) == WAL_HEADER_SIZE else None
+
+
+def read_committed_frames(wal_path, header, offset):
+    """Read the frames of the current WAL period from `offset` up to the last commit.
+
+    Frames left over from an older period (different salt) end the reading.
+    Returns the frame bytes."""
+    page_size = struct.unpack(">I", header[8:12])[0]
+    frame_size = FRAME_HEADER_SIZE + page_size
+    salt = header[16:24]
+    with open(wal_path, "rb") as file:
+        file.seek(offset)
+        data = file.read()
+
+    committed = 0
+    position = 0
+    while position + frame_size <= len(data):
+        frame_header = data[position:position + FRAME_HEADER_SIZE]
+        if frame_header[8:16] != salt:
+            break
+        position += frame_size
+        # A frame with a database size is the last frame of a transaction
+        if struct.unpack(">I", frame_header[4:8])[0] != 0:
+            committed = position
+    return data[:committed]
+
+
+def _write_file(path, data):
+    """Write a file atomically and durably."""
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+class WalShipper:
+    """Background thread taking snapshots and shipping the WAL of a database."""
+
+    def __init__(self, db_path, backup_dir, logger):
+        self.db_path = db_path
+        self.wal_path = db_path + "-wal"
+        self.backup_dir = backup_dir
+        self.logger = logger
+        self.conn = None
+        self._lock_file = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        # Current generation and WAL period
+        self.generation_dir = None
+        self.generation_started = None
+        self.period_dir = None
+        self.period_index = 0
+        self.salt = None
+        self.offset = WAL_HEADER_SIZE
+        self.segment = 0
+        # Set after a complete checkpoint: the next WAL period follows without gap
+        self.expect_restart = False
+        # PRAGMA data_version during the last copy
+        self.shipped_version = None
+        # Status shown by /api/backup
+        self.stats = {"segments": 0, "bytes": 0, "checkpoints": 0, "generations": 0,
+                      "last_ship": None, "last_error": None}
+
+    def start(self):
+        """Start shipping, unless another worker process already does. Returns True if started."""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        if fcntl is not None:
+            self._lock_file = open(os.path.join(self.backup_dir, "shipper.lock"), "w")
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                self._lock_file = None
+                return False
+
+        # This connection stays open: SQLite checkpoints and deletes the -wal file
+        # when the last connection to the database is closed
+        self.conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA wal_autocheckpoint = 0")
+        self.new_generation("start")
+        self._thread = threading.Thread(target=self._loop, name="wal-shipper", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.ship()
+        self.conn.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    def _loop(self):
+        while not self._stop_event.wait(SHIP_INTERVAL):
+            try:
+                self.ship()
+                if self.offset >= CHECKPOINT_BYTES and not self.expect_restart:
+                    self.checkpoint()
+                if time.time() - self.generation_started >= SNAPSHOT_HOURS * 3600:
+                    self.new_generation("schedule")
+                self.stats["last_error"] = None
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                self.logger.error(f"Error shipping the WAL: {str(e)}")
+
+    def new_generation(self, reason):
+        """Take a new snapshot and ship the current WAL period again from its start."""
+        name = datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        generation_dir = os.path.join(self.backup_dir, name)
+        os.makedirs(generation_dir)
+        started = time.time()
+        # An open read transaction keeps the other connections from resetting the WAL
+        # during the snapshot, so the period read here is the one the snapshot ends in
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            header = read_wal_header(self.wal_path)
+            pages = online_backup(self.db_path, os.path.join(generation_dir, "snapshot.sqlite"))
+        finally:
+            self.conn.execute("COMMIT")
+        _write_file(os.path.join(generation_dir, "generation.json"),
+                    json.dumps({"created_at": started, "reason": reason, "pages": pages}).encode("utf-8"))
+
+        # The frames of the current period are all still in the -wal file: replaying
+        # them on the snapshot gives the same pages, so shipping restarts at the first frame
+        self.generation_dir = generation_dir
+        self.generation_started = started
+        self.period_index = 0
+        self.salt = None
+        if header is not None:
+            self._start_period(header)
+        self.stats["generations"] += 1
+        self.logger.info("backup_generation", extra={"fields": {
+            "generation": name, "reason": reason, "pages": pages,
+            "duration_ms": round((time.time() - started) * 1000, 3)}})
+        self.ship()
+        self._delete_old_generations()
+
+    def _follows_checkpoint(self, header):
+        """Check that a new WAL period directly follows our last checkpoint.
+
+        SQLite increments the first salt of the -wal header at each reset: any
+        other value means a period was written and reset without us."""
+        salt1 = struct.unpack(">I", header[16:20])[0]
+        return self.expect_restart and salt1 == (struct.unpack(">I", self.salt[0:4])[0] + 1) & 0xFFFFFFFF
+
+    def _start_period(self, header):
+        self.period_index += 1
+        self.salt = header[16:24]
+        self.offset = WAL_HEADER_SIZE
+        self.segment = 0
+        self.expect_restart = False
+        self.period_dir = os.path.join(self.generation_dir, f"{self.period_index:04d}-{self.salt.hex()}")
+        os.makedirs(self.period_dir)
+        _write_file(os.path.join(self.period_dir, "header.bin"), header)
+
+    def ship(self):
+        """Copy the committed frames appended since the last call. Returns the number of bytes."""
+        gap = False
+        # The write lock makes sure no transaction is being written while the file is read
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.shipped_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            header = read_wal_header(self.wal_path)
+            if header is None:
+                return 0
+            if self.salt is None or (header[16:24] != self.salt and self._follows_checkpoint(header)):
+                self._start_period(header)
+            elif header[16:24] != self.salt:
+                # The WAL was reset by someone else: frames may have been checkpointed without us
+                gap = True
+            else:
+                frames = read_committed_frames(self.wal_path, header, self.offset)
+                if frames:
+                    self.segment += 1
+                    shipped_ms = int(time.time() * 1000)
+                    _write_file(os.path.join(self.period_dir, f"{self.segment:08d}-{shipped_ms}.frames"), frames)
+                    self.offset += len(frames)
+                    self.stats["segments"] += 1
+                    self.stats["bytes"] += len(frames)
+                    self.stats["last_ship"] = shipped_ms / 1000
+                return len(frames)
+        finally:
+            self.conn.execute("ROLLBACK")
+
+        if gap:
+            self.logger.warning("WAL reset outside of the shipper, taking a new snapshot")
+            self.new_generation("gap")
+            return 0
+        # A new period was just started: ship its frames
+        return self.ship()
+
+    def checkpoint(self):
+        """Ship, then checkpoint the -wal file so that the next transaction restarts it.
+
+        RESTART is used rather than TRUNCATE: the next period then has the
+        salt of the previous one plus one, which proves that none was missed."""
+        self.ship()
+        # data_version changes when another connection commits
+        version_before = self.shipped_version
+        busy = self.conn.execute("PRAGMA wal_checkpoint(RESTART)").fetchone()[0]
+        version_after = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if busy:
+            # Readers still use the WAL: nothing was reset, try again later
+            return
+        self.stats["checkpoints"] += 1
+        if version_after != version_before:
+            # Another connection committed between the last copy and the checkpoint:
+            # its frames may have been checkpointed without being shipped
+            self.new_generation("checkpoint")
+        else:
+            self.expect_restart = True
+
+    def _delete_old_generations(self):
+        generations = list_generations(self.backup_dir)
+        for generation in generations[:-KEEP_GENERATIONS]:
+            shutil.rmtree(generation["path"], ignore_errors=True)
+
+
+def list_generations(backup_dir):
+    """Return the complete generations of a backup directory, oldest first."""
+    generations = []
+    for name in sorted(os.listdir(backup_dir)):
+        path = os.path.join(backup_dir, name)
+        info_path = os.path.join(path, "generation.json")
+        if not os.path.isfile(info_path):
+            continue
+        with open(info_path, encoding="utf-8") as file:
+            info = json.load(file)
+        segments = [segment for _, segment in _list_segments(path)]
+        last = max([int(segment.split("-")[1].split(".")[0]) for segment in segments], default=None)
+        generations.append({"name": name, "path": path, "created_at": info["created_at"],
+                            "reason": info.get("reason"), "segments": len(segments),
+                            "last_segment_at": last / 1000 if last else None})
+    return generations
+
+
+def _list_segments(generation_path):
+    """Return (period directory, segment file name) of a generation, in shipping order."""
+    segments = []
+    for period in sorted(os.listdir(generation_path)):
+        period_path = os.path.join(generation_path, period)
+        if os.path.isdir(period_path):
+            for name in sorted(os.listdir(period_path)):
+                if name.endswith(".frames"):
+                    segments.append((period_path, name))
+    return segments
+
+
+def restore(backup_dir, output, as_of=None):
+    """Rebuild the database as of `as_of` (epoch seconds, None = latest) into `output`.
+
+    Returns a summary of what was replayed."""
+    as_of = time.time() if as_of is None else as_of
+    candidates = [generation for generation in list_generations(backup_dir) if generation["created_at"] <= as_of]
+    if not candidates:
+        raise ValueError("Aucune sauvegarde antérieure à cette date")
+    generation = candidates[-1]
+
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(output + suffix):
+            os.remove(output + suffix)
+    shutil.copyfile(os.path.join(generation["path"], "snapshot.sqlite"), output)
+
+    # Group the segments shipped before as_of by WAL period
+    periods = {}
+    for period_path, name in _list_segments(generation["path"]):
+        shipped_ms = int(name.split("-")[1].split(".")[0])
+        if shipped_ms <= as_of * 1000:
+            periods.setdefault(period_path, []).append(name)
+
+    replayed = 0
+    last_segment = None
+    for period_path in sorted(periods):
+        with open(os.path.join(period_path, "header.bin"), "rb") as file:
+            wal = [file.read()]
+        for name in periods[period_path]:
+            with open(os.path.join(period_path, name), "rb") as file:
+                wal.append(file.read())
+            replayed += 1
+            last_segment = name
+        # SQLite replays a -wal file found next to the database when it opens it
+        with open(output + "-wal", "wb") as file:
+            file.write(b"".join(wal))
+        conn = sqlite3.connect(output)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+
+    # Leave a standalone database file
+    conn = sqlite3.connect(output)
+    conn.execute("PRAGMA journal_mode = DELETE")
+    integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    conn.close()
+    return {"generation": generation["name"], "segments": replayed,
+            "last_segment": last_segment, "integrity": integrity}
+
+
+def _parse_time(text):
+    """Parse "YYYY-MM-DD HH:MM[:SS]" (local time) into epoch seconds."""
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online backup and point-in-time restore of the database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Copy a live database with the online backup API")
+    snapshot_parser.add_argument("--db", required=True, help="Database to copy")
+    snapshot_parser.add_argument("--output", required=True, help="Backup file")
+
+    list_parser = subparsers.add_parser("list", help="List the generations of a backup directory")
+    list_parser.add_argument("--dir", default=BACKUP_DIR, required=BACKUP_DIR is None)
+
+    restore_parser = subparsers.add_parser("restore", help="Rebuild the database as of a given time")
+    restore_parser.add_argument("--dir", default=BACKUP_DIR, required=BACKUP_DIR is None)
+    restore_parser.add_argument("--output", required=True, help="Restored database file")
+    restore_parser.add_argument("--time", default=None, help='Local time, e.g. "2025-01-15 14:30" (default: latest)')
+
+    args = parser.parse_args()
+    if args.command == "snapshot":
+        pages = online_backup(args.db, args.output)
+        print(f"{pages} pages copied to {args.output}")
+    elif args.command == "list":
+        for generation in list_generations(args.dir):
+            created = datetime.datetime.fromtimestamp(generation["created_at"])
+            last = (datetime.datetime.fromtimestamp(generation["last_segment_at"])
+                    if generation["last_segment_at"] else created)
+            print(f"{generation['name']}  {created:%Y-%m-%d %H:%M:%S} -> {last:%Y-%m-%d %H:%M:%S}  "
+                  f"{generation['segments']} segments ({generation['reason']})")
+    elif args.command == "restore":
+        as_of = _parse_time(args.time) if args.time else None
+        try:
+            summary = restore(args.dir, args.output, as_of)
+        except ValueError as e:
+            sys.exit(str(e))
+        print(f"Restored {args.output} from generation {summary['generation']}, "
+              f"{summary['segments']} segments replayed, integrity: {summary['integrity']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Compression of the API responses (gzip, and Brotli or zstd when installed).
+
+Large JSON lists compress 5 to 10 times, which matters for the agents using
+the app on slow mobile links. The middleware:
+
+- only compresses the text types of COMPRESSIBLE_TYPES, and leaves alone
+  the responses that are already encoded (precompressed static assets);
+- doesn't compress responses smaller than MINIMUM_SIZE, where the CPU time
+  isn't worth the few bytes saved;
+- works with streamed responses (CSV exports...): every chunk is compressed
+  and flushed as it comes, so the client receives the data progressively and
+  the whole response is never held in memory.
+
+The encoding is the first of PREFERRED_ENCODINGS that the client accepts and
+that is available. Brotli and zstd need the optional "brotli" and
+"zstandard" packages; gzip always works.
+"""
+
+import os
+import zlib
+
+from static_assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional
+    zstandard = None
+
+# Responses smaller than this are sent as they are
+MINIMUM_SIZE = int(os.getenv("VITAL_COMPRESSION_MIN_SIZE", "1024"))
+
+# Fast levels: the response is compressed on every request
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+PREFERRED_ENCODINGS = ["br", "zstd", "gzip"]
+
+COMPRESSIBLE_TYPES = ["application/json", "text/csv", "text/plain", "text/html", "text/css",
+                      "application/javascript", "text/javascript", "image/svg+xml"]
+
+
+class GzipEncoder:
+    def __init__(self, level=GZIP_LEVEL):
+        # wbits 16 + MAX_WBITS: gzip header and trailer instead of raw zlib
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data, flush=False):
+        output = self._compressor.compress(data)
+        if flush:
+            output += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return output
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, quality=BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data, flush=False):
+        output = self._compressor.process(data)
+        if flush:
+            output += self._compressor.flush()
+        return output
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level=ZSTD_LEVEL):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data, flush=False):
+        output = self._compressor.compress(data)
+        if flush:
+            output += self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return output
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encoders():
+    """Encoder class of every encoding usable in this process."""
+    encoders = {"gzip": GzipEncoder}
+    if brotli is not None:
+        encoders["br"] = BrotliEncoder
+    if zstandard is not None:
+        encoders["zstd"] = ZstdEncoder
+    return encoders
+
+
+ENCODERS = available_encoders()
+
+
+def choose_encoding(accept_encoding):
+    """Encoding to use for a request, or None when the client accepts none of ours."""
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in PREFERRED_ENCODINGS:
+        if encoding in ENCODERS and encoding in accepted:
+            return encoding
+    return None
+
+
+def is_compressible(headers):
+    """Whether a response (list of raw ASGI headers) may be compressed."""
+    content_type = ""
+    for name, value in headers:
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type":
+            content_type = value.decode("latin-1").split(";")[0].strip().lower()
+    return content_type in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing the responses, buffered or streamed."""
+
+    def __init__(self, app, minimum_size=MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    """Wrap `send` for one response.
+
+    The start of the body is held until MINIMUM_SIZE bytes are known (or the
+    body ends), to decide whether compressing is worth it. A body that is
+    complete at that point gets a Content-Length; a longer stream is
+    compressed chunk by chunk."""
+
+    def __init__(self, send, encoding, minimum_size):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.pending = []
+        self.pending_size = 0
+        # None until decided, then True (compress) or False (pass through)
+        self.compressing = None
+        self.encoder = None
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            if message["status"] in (204, 304) or not is_compressible(message["headers"]):
+                self.compressing = False
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body" or self.compressing is False:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressing:
+            # Streaming mode: flush every chunk so the client gets it now
+            chunk = self.encoder.compress(body, flush=more_body)
+            if not more_body:
+                chunk += self.encoder.finish()
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        self.pending.append(body)
+        self.pending_size += len(body)
+        if more_body and self.pending_size < self.minimum_size:
+            return
+
+        held = b"".join(self.pending)
+        self.pending = []
+        if self.pending_size < self.minimum_size:
+            # The whole body is small: send it as it is
+            self.compressing = False
+            await self._send(self.start_message)
+            await self._send({"type": "http.response.body", "body": held, "more_body": False})
+            return
+
+        self.compressing = True
+        self.encoder = ENCODERS[self.encoding]()
+        if more_body:
+            chunk = self.encoder.compress(held, flush=True)
+            await self._send_start(None)
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            chunk = self.encoder.compress(held) + self.encoder.finish()
+            await self._send_start(len(chunk))
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": False})
+
+    async def _send_start(self, content_length):
+        """Send the response start with the headers of the compressed body."""
+        headers = []
+        vary = None
+        for name, value in self.start_message["headers"]:
+            if name == b"content-length":
+                continue
+            if name == b"vary":
+                vary = value
+                continue
+            if name == b"etag" and not value.startswith(b"W/"):
+                # The compressed bytes differ from the original ones: the ETag can only be weak
+                value = b"W/" + value
+            headers.append((name, value))
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        if vary is None:
+            vary = b"Accept-Encoding"
+        elif b"accept-encoding" not in vary.lower():
+            vary += b", Accept-Encoding"
+        headers.append((b"vary", vary))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("latin-1")))
+        await self._send({**self.start_message, "headers": headers})
@@ -0,0 +1,69 @@
+"""Background job moving the expired contracts to 'Terminé'.
+
+A contract expires the day after its date_fin. The job finds the expired
+'Actif' and 'Pause' contracts with a partial index on the ISO form of
+date_fin, and updates them in batches with set-based statements:
+
+- Contrat_Forfait.etat becomes 'Terminé',
+- the client's mirrored contract columns are reset when it has no other
+  open contract (same rule as update_contrat_forfait),
+- the contract is removed from the passage schedule.
+
+Only open contracts are selected, so running the job twice does nothing the
+second time.
+"""
+
+import datetime
+
+from scheduling import iso_date_sql
+
+# Contracts updated per transaction, so the write lock is held briefly
+BATCH_SIZE = 1000
+
+# Must be written exactly like the index idx_contrat_fin_ouvert (migration 0004) for SQLite to use it
+_DATE_FIN_ISO = iso_date_sql("date_fin")
+_OPEN_CONTRACT = "etat IN ('Actif', 'Pause')"
+
+
+def expire_contracts(conn, today=None):
+    """Move the contracts that ended before `today` to 'Terminé'. Returns the number of contracts."""
+    if today is None:
+        today = datetime.date.today()
+    cursor = conn.cursor()
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS Expired_Batch (id INTEGER PRIMARY KEY, client_id INTEGER)")
+
+    total = 0
+    while True:
+        # BEGIN IMMEDIATE takes the write lock now, so the batch can't change before the updates
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("DELETE FROM temp.Expired_Batch")
+            cursor.execute(f"""
+                INSERT INTO temp.Expired_Batch (id, client_id)
+                SELECT id, client_id FROM Contrat_Forfait
+                WHERE {_OPEN_CONTRACT} AND {_DATE_FIN_ISO} < ?
+                LIMIT ?
+            """, (today.isoformat(), BATCH_SIZE))
+            count = cursor.rowcount
+
+            cursor.execute("""
+                UPDATE Contrat_Forfait SET etat = 'Terminé'
+                WHERE id IN (SELECT id FROM temp.Expired_Batch)
+            """)
+            # Clients without any other open contract no longer mirror a contract
+            cursor.execute(f"""
+                UPDATE Client_Forfait
+                SET etat_contrat = NULL, debut_contrat = NULL, fin_contrat = NULL
+                WHERE id IN (SELECT client_id FROM temp.Expired_Batch)
+                  AND NOT EXISTS (SELECT 1 FROM Contrat_Forfait c
+                                  WHERE c.client_id = Client_Forfait.id AND c.{_OPEN_CONTRACT})
+            """)
+            cursor.execute("DELETE FROM Passage_Schedule WHERE contrat_id IN (SELECT id FROM temp.Expired_Batch)")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        total += count
+        if count < BATCH_SIZE:
+            return {"contrats_termines": total}
@@ -0,0 +1,37 @@
+"""Authentication of the debug and diagnosis endpoints."""
+
+import hmac
+import os
+from fastapi import HTTPException, Request
+
+# Token required by the /api/debug endpoints (header X-Debug-Token or Authorization: Bearer)
+DEBUG_TOKEN = os.getenv("VITAL_DEBUG_TOKEN")
+
+
+def get_request_token(request: Request):
+    """Read the debug token sent with a request, if any."""
+    token = request.headers.get("X-Debug-Token")
+    if token:
+        return token
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        return authorization[len("Bearer "):]
+    return None
+
+
+def is_debug_authorized(request: Request) -> bool:
+    """Check the debug token of a request.
+
+    Without a configured token, the debug endpoints are only open in DEV."""
+    if not DEBUG_TOKEN:
+        return os.getenv("VITAL_ENV") == "DEV"
+    token = get_request_token(request)
+    if token is None:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), DEBUG_TOKEN.encode("utf-8"))
+
+
+def require_debug_token(request: Request):
+    """FastAPI dependency protecting the debug endpoints."""
+    if not is_debug_authorized(request):
+        raise HTTPException(status_code=401, detail="Jeton de débogage invalide ou manquant")
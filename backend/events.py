@@ -0,0 +1,209 @@
+"""Change feed sent to the browsers with Server-Sent Events (/api/events).
+
+Every change of a business table is written to Change_Log by triggers, in
+the same transaction as the change (migration 0006_change_log). Each worker
+process runs one EventHub that reads the new log rows and broadcasts them
+to the browsers connected to this process. Reading the shared log is what
+makes changes made by one worker reach the browsers connected to another.
+
+An event is compact: {"table": ..., "id": ..., "op": ..., "version": ...}.
+The version is the id of the log row, also sent as the SSE event id: a
+browser that reconnects sends it back in Last-Event-ID and receives the
+changes it missed. If they are no longer in the log, it receives a "reset"
+event and must reload its data.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from app_logging import get_logger
+
+# Seconds between two reads of the log. Writes of this process wake the hub up right away.
+POLL_INTERVAL = float(os.getenv("VITAL_EVENTS_POLL_INTERVAL", "1"))
+
+# A comment line is sent when nothing happened for this long, so that proxies keep the stream open
+HEARTBEAT_SECONDS = 15
+
+# Log rows are kept this long (a browser offline for longer receives "reset")
+RETENTION_SECONDS = 24 * 3600
+
+MAX_SUBSCRIBERS = 100
+# Events waiting for a slow browser; beyond this it is disconnected (and will resume with Last-Event-ID)
+QUEUE_SIZE = 1000
+# Rows read per query, and missed events replayed at most on reconnection
+BATCH_SIZE = 500
+MAX_REPLAY = 1000
+
+logger = get_logger("events")
+
+
+def read_changes(cursor, after_id, limit=BATCH_SIZE):
+    """Log rows with an id greater than `after_id`, as events."""
+    cursor.execute("""
+        SELECT id, table_name, row_id, op FROM Change_Log WHERE id > ? ORDER BY id LIMIT ?
+    """, (after_id, limit))
+    return [{"table": row[1], "id": row[2], "op": row[3], "version": row[0]} for row in cursor.fetchall()]
+
+
+def purge_change_log(conn):
+    """Delete the log rows older than RETENTION_SECONDS (job "purge_journal_changements")."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM Change_Log WHERE created_at < ?", (time.time() - RETENTION_SECONDS,))
+    deleted = cursor.rowcount
+    conn.commit()
+    return {"supprimes": deleted}
+
+
+def format_event(event):
+    """An event in the text/event-stream format."""
+    return f"id: {event['version']}\ndata: {json.dumps(event)}\n\n"
+
+
+class Subscriber:
+    def __init__(self, tables):
+        # None: all the tables
+        self.tables = tables
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+        # Last event broadcast when it subscribed: the later ones arrive in its queue
+        self.start_id = 0
+
+    def wants(self, event):
+        return self.tables is None or event["table"] in self.tables
+
+
+class EventHub:
+    """Broadcast the new Change_Log rows to the subscribers of this process."""
+
+    def __init__(self, connect):
+        self.connect = connect
+        self.subscribers = set()
+        self.last_id = 0
+        self._conn = None
+        self._wake_event = None
+        self._task = None
+
+    def start(self):
+        self._wake_event = asyncio.Event()
+        self._conn = self.connect()
+        cursor = self._conn.cursor()
+        # Only the changes made from now on are broadcast
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM Change_Log")
+        self.last_id = cursor.fetchone()[0]
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def wake(self):
+        """Read the log now (called after a write request of this process)."""
+        if self._wake_event is not None:
+            self._wake_event.set()
+
+    def _read_new(self):
+        return read_changes(self._conn.cursor(), self.last_id)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake_event.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake_event.clear()
+            try:
+                while True:
+                    events = await run_in_threadpool(self._read_new)
+                    if not events:
+                        break
+                    self.last_id = events[-1]["version"]
+                    self._broadcast(events)
+                    if len(events) < BATCH_SIZE:
+                        break
+            except Exception as e:
+                logger.error(f"Error reading the change log: {str(e)}")
+
+    def _broadcast(self, events):
+        for subscriber in list(self.subscribers):
+            for event in events:
+                if not subscriber.wants(event):
+                    continue
+                try:
+                    subscriber.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # Too slow: its stream ends once the queue is read, the browser
+                    # then reconnects and gets the rest of the changes from the log
+                    subscriber.overflowed = True
+                    self.subscribers.discard(subscriber)
+                    break
+
+    def subscribe(self, tables):
+        if len(self.subscribers) >= MAX_SUBSCRIBERS:
+            return None
+        subscriber = Subscriber(tables)
+        subscriber.start_id = self.last_id
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def _read_missed(self, after_id, until_id):
+        """Events after `after_id` up to `until_id`, or None when some of them were purged."""
+        if until_id - after_id > MAX_REPLAY:
+            return None
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            # Ids have no gaps (AUTOINCREMENT, and a rolled back change rolls back its id too)
+            cursor.execute("SELECT MIN(id) FROM Change_Log")
+            oldest = cursor.fetchone()[0]
+            if oldest is None or oldest > after_id + 1:
+                return None
+            return [event for event in read_changes(cursor, after_id, MAX_REPLAY) if event["version"] <= until_id]
+        finally:
+            conn.close()
+
+    async def stream(self, subscriber, last_event_id):
+        """Text of the SSE stream of one subscriber (an async generator)."""
+        try:
+            start_id = subscriber.start_id
+            # Reconnect after 3 s if the stream is cut
+            yield "retry: 3000\n\n"
+            if last_event_id is not None and last_event_id < start_id:
+                # Events committed while the browser was disconnected; the later ones are already queued
+                missed = await run_in_threadpool(self._read_missed, last_event_id, start_id)
+                if missed is None:
+                    yield f"event: reset\ndata: {json.dumps({'version': start_id})}\n\n"
+                else:
+                    for event in missed:
+                        if subscriber.wants(event):
+                            yield format_event(event)
+            # Where the feed of this stream starts (sent back in Last-Event-ID when reconnecting)
+            yield f"id: {max(start_id, last_event_id or 0)}\n\n"
+
+            while True:
+                if subscriber.overflowed and subscriber.queue.empty():
+                    return
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                # Another worker may have sent this event already before the browser reconnected here
+                if last_event_id is None or event["version"] > last_event_id:
+                    yield format_event(event)
+        finally:
+            self.unsubscribe(subscriber)
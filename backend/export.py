@@ -0,0 +1,265 @@
+"""Export of the business tables to Parquet files, for offline analytics.
+
+    python export.py --db ../database/prod/db.sqlite --dir /data/export
+
+Layout of the export directory:
+
+    <dir>/manifest.json
+    <dir>/<table>/base-<run>.parquet   (all the rows of the table at run <run>)
+    <dir>/<table>/delta-<run>.parquet  (rows inserted, updated or deleted since the previous run)
+
+The first run writes a base file per table. The next runs read Change_Log
+(migration 0006_change_log) from the version of the previous run: a table
+without changes is left as it is, a changed table gets a delta file with the
+current version of its changed rows and, for the deleted rows, only their id
+with _supprime = true. To read a table: its base file, then its delta files
+in order, keeping the last version of each id and dropping the deleted ones.
+A new base is written instead, and the old files removed, when the deltas of
+a table reach COMPACT_RATIO of its base or when the change log doesn't go
+back to the previous run anymore (purged).
+
+Rows are read with fetchmany() in batches of BATCH_ROWS and written as Arrow
+record batches, so the memory used doesn't depend on the size of a table.
+A run reads one snapshot of the database (a single read transaction). The
+dd/mm/yyyy dates become Parquet dates and the REAL amounts decimals with two
+digits; the INTEGER amounts (dinars) stay integers.
+
+pyarrow is optional: without it the export is unavailable.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.parquet
+except ImportError:  # pyarrow is optional
+    pyarrow = None
+
+import analytics
+from app_logging import get_logger
+
+EXPORT_DIR = os.getenv("VITAL_EXPORT_DIR", "../database/export")
+
+TABLES = ["Client_Forfait", "Contrat_Forfait", "Bon_Passage_Forfait", "Bon_Passage_Forfait_Produits",
+          "Bon_Passage_Forfait_Services", "Versement_Forfait", "Bon_Achats", "Produits_Bon_Achat",
+          "Versement_Bon_Achat", "Inventaire"]
+
+# dd/mm/yyyy text columns
+DATE_COLUMNS = {"date", "date_debut", "date_fin", "debut_contrat", "fin_contrat"}
+# REAL columns holding amounts in dinars and centimes
+MONEY_PREFIXES = ("montant", "prix")
+
+# Rows per fetchmany() call and per record batch
+BATCH_ROWS = 50000
+# Deltas rewritten as a new base when they hold this many rows per row of the base
+COMPACT_RATIO = 0.2
+
+logger = get_logger("export")
+
+# One export at a time per process
+_export_lock = threading.Lock()
+
+
+class ExportBusy(Exception):
+    pass
+
+
+def load_manifest(directory):
+    """Manifest of the last run, None before the first one."""
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def export_database(db_path, directory=EXPORT_DIR, full=False):
+    """Export the tables to `directory`, incrementally from the previous run unless `full`.
+
+    Returns the summary of the run. Raises ExportBusy when an export is already running."""
+    if not _export_lock.acquire(blocking=False):
+        raise ExportBusy()
+    try:
+        return _export(db_path, directory, full)
+    finally:
+        _export_lock.release()
+
+
+def _export(db_path, directory, full):
+    started = time.time()
+    manifest = load_manifest(directory) or {"run": 0, "version": 0, "tables": {}}
+    run = manifest["run"] + 1
+
+    conn = analytics.connect_read_only(db_path)
+    # Plain tuples: the rows go to Arrow by position
+    conn.row_factory = None
+    try:
+        cursor = conn.cursor()
+        # Every read below sees the database as of this point
+        cursor.execute("BEGIN")
+        version, changes = _read_changes(cursor, manifest["version"])
+        if changes is None:
+            full = True
+
+        summary = {"run": run, "version": version, "tables": {}}
+        removed = []
+        for table in TABLES:
+            state = manifest["tables"].get(table)
+            table_dir = os.path.join(directory, table)
+            os.makedirs(table_dir, exist_ok=True)
+            columns = _columns(cursor, table)
+
+            if not full and state is not None and table not in changes:
+                summary["tables"][table] = "inchangée"
+                continue
+            if full or state is None or state["delta_rows"] + changes[table] > COMPACT_RATIO * max(state["base_rows"], 1):
+                # New base: all the rows; the previous files are removed once the manifest points to it
+                file_name = f"base-{run:06d}.parquet"
+                rows = _write_parquet(cursor, f"SELECT * FROM {table} ORDER BY id", (), columns,
+                                      os.path.join(table_dir, file_name))
+                if state is not None:
+                    removed += [os.path.join(table_dir, name) for name in [state["base"]] + state["deltas"]]
+                state = {"base": file_name, "base_rows": rows, "deltas": [], "delta_rows": 0}
+                summary["tables"][table] = {"base": file_name, "lignes": rows}
+            else:
+                file_name = f"delta-{run:06d}.parquet"
+                changed = "SELECT row_id FROM Change_Log WHERE table_name = ? AND id > ? AND id <= ?"
+                parameters = (table, manifest["version"], version)
+                rows = _write_parquet(cursor, f"SELECT * FROM {table} WHERE id IN ({changed}) ORDER BY id",
+                                      parameters, columns, os.path.join(table_dir, file_name),
+                                      deleted_query=f"SELECT DISTINCT row_id FROM Change_Log WHERE table_name = ? "
+                                                    f"AND id > ? AND id <= ? AND row_id NOT IN (SELECT id FROM {table})")
+                state = {**state, "deltas": state["deltas"] + [file_name], "delta_rows": state["delta_rows"] + rows}
+                summary["tables"][table] = {"delta": file_name, "lignes": rows}
+            manifest["tables"][table] = state
+        conn.rollback()
+    finally:
+        conn.close()
+
+    manifest.update({"run": run, "version": version, "exported_at": time.time()})
+    _write_json(os.path.join(directory, "manifest.json"), manifest)
+    for path in removed:
+        if os.path.exists(path):
+            os.remove(path)
+
+    summary["duration_s"] = round(time.time() - started, 2)
+    logger.info(f"Export run {run} finished in {summary['duration_s']} s")
+    return summary
+
+
+def _read_changes(cursor, since):
+    """Current version of the change log and the number of changes per table since `since`.
+
+    The changes are None when they can't be known: no change log, log purged past `since`,
+    or a database older than the previous run (restored)."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'Change_Log'")
+    if cursor.fetchone() is None:
+        return 0, None
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'Change_Log'")
+    row = cursor.fetchone()
+    version = row[0] if row else 0
+    cursor.execute("SELECT MIN(id) FROM Change_Log")
+    oldest = cursor.fetchone()[0]
+    if since > version or (oldest or version + 1) > since + 1:
+        return version, None
+    cursor.execute("SELECT table_name, COUNT(*) FROM Change_Log WHERE id > ? AND id <= ? GROUP BY table_name",
+                   (since, version))
+    return version, dict(cursor.fetchall())
+
+
+def _columns(cursor, table):
+    """[(name, Arrow type, conversion)] of a table, conversion being "date", "money", "text" or None."""
+    columns = []
+    cursor.execute(f"PRAGMA table_info({table})")
+    for _, name, declared_type, *_ in cursor.fetchall():
+        declared_type = declared_type.upper()
+        if name in DATE_COLUMNS:
+            columns.append((name, pyarrow.date32(), "date"))
+        elif declared_type == "REAL" and name.startswith(MONEY_PREFIXES):
+            columns.append((name, pyarrow.decimal128(15, 2), "money"))
+        elif declared_type == "INTEGER":
+            columns.append((name, pyarrow.int64(), None))
+        elif declared_type == "REAL":
+            columns.append((name, pyarrow.float64(), None))
+        else:
+            columns.append((name, pyarrow.string(), "text"))
+    return columns
+
+
+def _record_batch(columns, rows, deleted=False):
+    arrays = []
+    for index, (name, arrow_type, conversion) in enumerate(columns):
+        values = [row[index] for row in rows] if not deleted or index == 0 else [None] * len(rows)
+        if conversion == "date":
+            text = pyarrow.array(values, pyarrow.string())
+            # An invalid date is exported as null rather than failing the export
+            parsed = pyarrow.compute.strptime(text, format="%d/%m/%Y", unit="s", error_is_null=True)
+            arrays.append(parsed.cast(pyarrow.date32()))
+        elif conversion == "money":
+            arrays.append(pyarrow.array(values, pyarrow.float64()).cast(arrow_type))
+        elif conversion == "text":
+            # SQLite doesn't enforce the declared types
+            arrays.append(pyarrow.array([None if value is None else str(value) for value in values], arrow_type))
+        else:
+            arrays.append(pyarrow.array(values, arrow_type))
+    arrays.append(pyarrow.array([deleted] * len(rows), pyarrow.bool_()))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=_schema(columns))
+
+
+def _schema(columns):
+    return pyarrow.schema([(name, arrow_type) for name, arrow_type, _ in columns] + [("_supprime", pyarrow.bool_())])
+
+
+def _write_parquet(cursor, query, parameters, columns, path, deleted_query=None):
+    """Write the rows of `query` (and the ids of `deleted_query`) to a Parquet file. Returns the number of rows."""
+    count = 0
+    temporary_path = f"{path}.tmp"
+    with pyarrow.parquet.ParquetWriter(temporary_path, _schema(columns), compression="zstd") as writer:
+        for sql, deleted in [(query, False), (deleted_query, True)]:
+            if sql is None:
+                continue
+            cursor.execute(sql, parameters)
+            while True:
+                rows = cursor.fetchmany(BATCH_ROWS)
+                if not rows:
+                    break
+                writer.write_batch(_record_batch(columns, rows, deleted))
+                count += len(rows)
+    os.replace(temporary_path, path)
+    return count
+
+
+def _write_json(path, data):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
+    os.replace(temporary_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the business tables to Parquet files")
+    parser.add_argument("--db", required=True, help="Database to export")
+    parser.add_argument("--dir", default=EXPORT_DIR, help=f"Export directory (default: {EXPORT_DIR})")
+    parser.add_argument("--full", action="store_true", help="Write every table again instead of the changes")
+    args = parser.parse_args()
+    if pyarrow is None:
+        sys.exit("pyarrow is required: pip install pyarrow")
+
+    summary = export_database(args.db, args.dir, args.full)
+    for table, result in summary["tables"].items():
+        if isinstance(result, dict):
+            kind = "base" if "base" in result else "delta"
+            print(f"{table:<30} {kind:<6} {result['lignes']:>10,} rows")
+        else:
+            print(f"{table:<30} unchanged")
+    print(f"Run {summary['run']} (change log version {summary['version']}) in {summary['duration_s']} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Group commit of the inserts of passages and versements (opt-in: VITAL_WRITE_QUEUE=1).
+
+Every request committing on its own pays a sync of the database to disk per
+insert. At the end of a route day the agents send their bons de passage and
+versements in bursts, and these commits wait for each other. With the write
+queue the handlers give their insert to a single writer thread, which:
+
+- takes the inserts queued at that moment (at most MAX_BATCH), after waiting
+  MAX_WAIT_MS for more when there are only a few;
+- runs them in one transaction, each one in a savepoint: an insert that fails
+  (client not found, no active contract...) is rolled back alone and its
+  caller gets the exception;
+- commits once, then gives every caller its row. A caller gets its row only
+  after the commit: a response still means that the row is written.
+
+When the commit itself fails, every caller of the batch gets the error and
+none of the inserts is written. When the connection can't be opened or
+rolled back, the callers of the batch get the error too, and the next batch
+opens a new connection: the thread keeps running until stop(). Once it is
+stopped, submit() raises instead of queuing a write that would never run.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+
+from app_logging import get_logger
+
+ENABLED = os.getenv("VITAL_WRITE_QUEUE", "0") == "1"
+
+# Inserts per transaction at most
+MAX_BATCH = int(os.getenv("VITAL_WRITE_QUEUE_BATCH", "200"))
+# Wait for more inserts after the first one, in milliseconds (0: only those already queued)
+MAX_WAIT_MS = float(os.getenv("VITAL_WRITE_QUEUE_WAIT_MS", "2"))
+
+logger = get_logger("write_queue")
+
+
+class WriteQueueStopped(RuntimeError):
+    """The writer thread isn't running: the write wasn't queued."""
+
+
+class WriteQueue:
+    """Writer thread running the queued writes in shared transactions."""
+
+    def __init__(self, connect, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.connect = connect
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        # Set while the thread runs; submit() and the end of the thread take the lock,
+        # so no write is queued after the thread has failed the remaining ones
+        self._running = False
+        self._lock = threading.Lock()
+        # Transactions committed and writes done, for the metrics
+        self.batches = 0
+        self.writes = 0
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                self._running = True
+            self._thread = threading.Thread(target=self._loop, name="write-queue", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Write what is queued, then stop the thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def submit(self, fn, *args):
+        """Queue the write fn(cursor, *args). Returns a future of its result, set after the commit.
+
+        fn must not commit: its changes are committed with the other writes of the batch."""
+        future = concurrent.futures.Future()
+        with self._lock:
+            if not self._running:
+                raise WriteQueueStopped("La file d'écriture est arrêtée")
+            self._queue.put((fn, args, future))
+        return future
+
+    async def run(self, fn, *args):
+        """Result of fn(cursor, *args), once committed."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def _loop(self):
+        conn = None
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.max_batch:
+                    try:
+                        # The writes already queued, then those arriving before the deadline
+                        timeout = deadline - time.monotonic()
+                        item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        continue
+                    batch.append(item)
+                try:
+                    if conn is None:
+                        conn = self.connect()
+                    self._write(conn, batch)
+                except Exception as error:
+                    # No connection, or its rollback failed: the callers get the error
+                    # and the next batch starts on a new connection
+                    logger.error(f"Write queue batch of {len(batch)} writes failed: {str(error)}")
+                    _fail(batch, error)
+                    if conn is not None:
+                        _close_quietly(conn)
+                        conn = None
+        finally:
+            with self._lock:
+                self._running = False
+            # Writes queued after the stop request (or left by an unexpected error)
+            pending = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    pending.append(item)
+            _fail(pending, WriteQueueStopped("La file d'écriture est arrêtée"))
+            if conn is not None:
+                _close_quietly(conn)
+
+    def _write(self, conn, batch):
+        cursor = conn.cursor()
+        results = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for fn, args, future in batch:
+                # The request was cancelled (client gone) before its turn: nothing to write
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cursor.execute("SAVEPOINT ecriture")
+                try:
+                    results.append((future, fn(cursor, *args), None))
+                except Exception as error:
+                    cursor.execute("ROLLBACK TO ecriture")
+                    results.append((future, None, error))
+                cursor.execute("RELEASE ecriture")
+            conn.commit()
+        except Exception as error:
+            # A failing rollback is handled by _loop, which fails the batch too
+            conn.rollback()
+            _fail(batch, error)
+            return
+
+        self.batches += 1
+        self.writes += len(results)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def _fail(batch, error):
+    """Give the error to the callers of the batch without a result yet."""
+    for _, _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
@@ -0,0 +1,185 @@
+"""Idempotency keys of the POST requests (Idempotency-Key header).
+
+On a flaky mobile connection the frontend resends a POST when it gets no
+response, although the first one may have been written (a versement, a bon de
+passage...). When a POST has an Idempotency-Key header, the middleware:
+
+- records the key before the request runs, with a fingerprint of the request
+  (path, query and body), in the table Idempotency_Key
+  (migration 0011_idempotency_keys);
+- stores the response once it is sent: status, headers and body;
+- answers a request repeating a stored key with the stored response, without
+  running it again (header Idempotent-Replayed: true);
+- answers 409 while the first request with the key is still running, and 422
+  when the key was used for a different request.
+
+A response with a server error (5xx) isn't stored: the key is released so
+that the retry runs the request again. A key whose request never finished
+(process stopped) stays taken until it expires: its request may have been
+written, so it is never run again with this key.
+
+Keys expire after TTL_HOURS; the job "purge_cles_idempotence" deletes them.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+# How long a key is kept, and so how long a retry is recognized
+TTL_HOURS = float(os.getenv("VITAL_IDEMPOTENCY_TTL_HOURS", "24"))
+
+HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+
+# Response headers not stored: those of the connection, and the length, set again on replay
+NOT_STORED_HEADERS = {b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization", b"te",
+                      b"trailer", b"transfer-encoding", b"upgrade", b"content-length"}
+
+
+def purge_expired_keys(conn):
+    """Delete the keys older than TTL_HOURS (job "purge_cles_idempotence")."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM Idempotency_Key WHERE created_at < ?", (time.time() - TTL_HOURS * 3600,))
+    deleted = cursor.rowcount
+    conn.commit()
+    return {"supprimees": deleted}
+
+
+def fingerprint(scope, body):
+    digest = hashlib.sha256()
+    for part in (scope["method"].encode(), scope["path"].encode(), scope["query_string"], body):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def reserve_key(conn, key, request_fingerprint):
+    """Record the key for a new request. Returns None when it was recorded,
+    else the row of the key (fingerprint, status, headers, body)."""
+    now = time.time()
+    cursor = conn.cursor()
+    # An expired key not purged yet counts as a new one
+    cursor.execute("DELETE FROM Idempotency_Key WHERE key = ? AND created_at < ?", (key, now - TTL_HOURS * 3600))
+    cursor.execute("INSERT OR IGNORE INTO Idempotency_Key (key, fingerprint, created_at) VALUES (?, ?, ?)",
+                   (key, request_fingerprint, now))
+    recorded = cursor.rowcount == 1
+    conn.commit()
+    if recorded:
+        return None
+    cursor.execute("SELECT fingerprint, status, headers, body FROM Idempotency_Key WHERE key = ?", (key,))
+    return cursor.fetchone()
+
+
+def store_response(conn, key, status, headers, body):
+    """Store the response of the key: its status, its headers (list of (name, value) bytes) and its body."""
+    stored_headers = [[name.decode("latin-1"), value.decode("latin-1")]
+                      for name, value in headers if name.lower() not in NOT_STORED_HEADERS]
+    conn.execute("UPDATE Idempotency_Key SET status = ?, headers = ?, body = ? WHERE key = ?",
+                 (status, json.dumps(stored_headers), body, key))
+    conn.commit()
+
+
+def stored_headers(row):
+    """Headers to replay for a stored response."""
+    return [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(row[2])]
+
+
+def release_key(conn, key):
+    conn.execute("DELETE FROM Idempotency_Key WHERE key = ? AND status IS NULL", (key,))
+    conn.commit()
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware replaying the responses of the POST requests sent again with the same key."""
+
+    def __init__(self, app, connect):
+        self.app = app
+        self.connect = connect
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        key = None
+        for name, value in scope["headers"]:
+            if name == HEADER:
+                key = value.decode("latin-1").strip()
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await _send_error(send, 400, f"Clé d'idempotence trop longue (maximum {MAX_KEY_LENGTH} caractères)")
+            return
+
+        # The body is part of the fingerprint: read it all, then hand it to the endpoint
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        conn = await run_in_threadpool(self.connect)
+        try:
+            request_fingerprint = fingerprint(scope, body)
+            stored = await run_in_threadpool(reserve_key, conn, key, request_fingerprint)
+            if stored is not None:
+                if stored[0] != request_fingerprint:
+                    await _send_error(send, 422, "Clé d'idempotence déjà utilisée pour une autre requête")
+                elif stored[1] is None:
+                    await _send_error(send, 409, "Une requête avec cette clé d'idempotence est en cours")
+                else:
+                    await _send_response(send, stored[1], stored_headers(stored), stored[3], replayed=True)
+                return
+            await self._run(scope, receive, send, conn, key, body)
+        finally:
+            conn.close()
+
+    async def _run(self, scope, receive, send, conn, key, body):
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        response = {"status": None, "headers": [], "chunks": []}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["chunks"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except Exception:
+            await run_in_threadpool(release_key, conn, key)
+            raise
+        if response["status"] is None or response["status"] >= 500:
+            await run_in_threadpool(release_key, conn, key)
+        else:
+            await run_in_threadpool(store_response, conn, key, response["status"], response["headers"],
+                                    b"".join(response["chunks"]))
+
+
+async def _send_response(send, status, headers, body, replayed=False):
+    headers = [(b"content-length", str(len(body)).encode())] + headers
+    if replayed:
+        headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_error(send, status, detail):
+    body = json.dumps({"detail": detail}).encode()
+    await _send_response(send, status, [(b"content-type", b"application/json")], body)
@@ -0,0 +1,366 @@
+"""Monthly invoicing of the forfait contracts (job "facturation_mensuelle").
+
+A run bills one month (periode "yyyy-mm") in two steps:
+
+1. Invoices: the contracts are read by id, in batches of BATCH_SIZE. Each
+   batch is one transaction, which inserts the invoices with their lines and
+   moves the position of the run (Facturation.dernier_contrat_id).
+2. PDFs: the invoices without a PDF are rendered by a pool of processes
+   (rendering is CPU-bound, so one process per core) and written to
+   INVOICE_DIR/<periode>/<numero>.pdf.
+
+A job run works for at most SECONDS_PER_RUN and the next one continues, so a
+long run doesn't hold the job thread, and a crash loses at most one batch
+(rolled back) or a few PDFs (rendered again).
+
+Billed contracts: the contracts covering part of the month that are active,
+or that ended during the month. The invoice amount is:
+- the monthly fee: the contract amount (for the whole contract) divided by
+  its length in months, prorated to the days of the month it covers;
+- the excess weight of the passages of the month (kg above the forfait,
+  computed when the passage was recorded) x prix_exces_poids;
+- the products delivered during these passages (qte x prix).
+"""
+
+import calendar
+import datetime
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app_logging import get_logger
+from scheduling import iso_date_sql
+
+# Where the PDFs are written (relative to the backend directory)
+INVOICE_DIR = os.getenv("VITAL_INVOICE_DIR", "../database/factures")
+
+# Processes rendering the PDFs (0: render in the job thread)
+WORKERS = int(os.getenv("VITAL_INVOICE_WORKERS", str(os.cpu_count() or 1)))
+
+# Contracts billed per transaction
+BATCH_SIZE = 500
+# PDFs rendered between two commits
+PDF_CHUNK_SIZE = 200
+# Work done by one run of the job; the next run continues
+SECONDS_PER_RUN = 60
+
+# Average length of a month, to count the months of a contract
+DAYS_PER_MONTH = 365.25 / 12
+
+MONTHS = ["janvier", "février", "mars", "avril", "mai", "juin", "juillet", "août",
+          "septembre", "octobre", "novembre", "décembre"]
+
+logger = get_logger("invoicing")
+
+
+def parse_period(periode):
+    """First and last day of a "yyyy-mm" month. Raises ValueError when the text is not a month."""
+    if len(periode) != 7 or periode[4] != "-":
+        raise ValueError(periode)
+    year, month = int(periode[:4]), int(periode[5:])
+    first = datetime.date(year, month, 1)
+    return first, first.replace(day=calendar.monthrange(year, month)[1])
+
+
+def previous_period(today=None):
+    if today is None:
+        today = datetime.date.today()
+    last_month = today.replace(day=1) - datetime.timedelta(days=1)
+    return last_month.strftime("%Y-%m")
+
+
+def start_run(conn, periode):
+    """Create the run of a month if it doesn't exist yet. Returns its row."""
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR IGNORE INTO Facturation (periode, debut) VALUES (?, ?)", (periode, time.time()))
+    conn.commit()
+    cursor.execute("SELECT * FROM Facturation WHERE periode = ?", (periode,))
+    return cursor.fetchone()
+
+
+def billing_job(conn):
+    """Job: start the run of the previous month, then continue the unfinished runs."""
+    deadline = time.monotonic() + SECONDS_PER_RUN
+    start_run(conn, previous_period())
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT periode FROM Facturation WHERE etat = 'en_cours' ORDER BY periode")
+    result = {"factures": 0, "pdf": 0, "terminees": []}
+    for (periode,) in cursor.fetchall():
+        if time.monotonic() >= deadline:
+            break
+        invoices, pdfs, finished = advance_run(conn, periode, deadline)
+        result["factures"] += invoices
+        result["pdf"] += pdfs
+        if finished:
+            result["terminees"].append(periode)
+    return result
+
+
+def advance_run(conn, periode, deadline):
+    """Work on the run of a month until `deadline`. Returns (invoices, PDFs, finished)."""
+    invoices = 0
+    while True:
+        if time.monotonic() >= deadline:
+            return invoices, 0, False
+        created = _bill_batch(conn, periode)
+        if created is None:
+            break
+        invoices += created
+
+    pdfs, finished = _render_pending(conn, periode, deadline)
+    if finished:
+        conn.execute("UPDATE Facturation SET etat = 'terminee', fin = ? WHERE periode = ?", (time.time(), periode))
+        conn.commit()
+        logger.info(f"Billing of {periode} finished")
+    return invoices, pdfs, finished
+
+
+def _bill_batch(conn, periode):
+    """Bill the next batch of contracts. Returns the number of invoices, or None when all are billed."""
+    first, last = parse_period(periode)
+    first_iso, last_iso = first.isoformat(), last.isoformat()
+    debut, fin = iso_date_sql("ct.date_debut"), iso_date_sql("ct.date_fin")
+    cursor = conn.cursor()
+    # The write lock is taken now: the position read below can't change before the commit
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("SELECT dernier_contrat_id, nombre_factures FROM Facturation WHERE periode = ?", (periode,))
+        position, sequence = cursor.fetchone()
+        cursor.execute(f"""
+            SELECT ct.id, ct.client_id, ct.date_debut, ct.date_fin, ct.montant, ct.prix_exces_poids
+            FROM Contrat_Forfait ct
+            WHERE ct.id > ? AND {debut} <= ? AND {fin} >= ?
+              AND (ct.etat = 'Actif' OR (ct.etat = 'Terminé' AND {fin} <= ?))
+              AND NOT EXISTS (SELECT 1 FROM Facture f WHERE f.contrat_id = ct.id AND f.periode = ?)
+            ORDER BY ct.id
+            LIMIT ?
+        """, (position, last_iso, first_iso, last_iso, periode, BATCH_SIZE))
+        contracts = cursor.fetchall()
+        if not contracts:
+            conn.commit()
+            return None
+        ids = [contract[0] for contract in contracts]
+        placeholders = ", ".join("?" for _ in ids)
+
+        # Passages and products of the month of these contracts (index on contrat_id)
+        passage_date = iso_date_sql("b.date")
+        cursor.execute(f"""
+            SELECT b.contrat_id, SUM(b.exces_poids) FROM Bon_Passage_Forfait b
+            WHERE b.contrat_id IN ({placeholders}) AND {passage_date} BETWEEN ? AND ?
+            GROUP BY b.contrat_id
+        """, ids + [first_iso, last_iso])
+        excess = dict(cursor.fetchall())
+        cursor.execute(f"""
+            SELECT b.contrat_id, p.produit, SUM(p.qte), p.prix
+            FROM Bon_Passage_Forfait b JOIN Bon_Passage_Forfait_Produits p ON p.bon_passage_id = b.id
+            WHERE b.contrat_id IN ({placeholders}) AND {passage_date} BETWEEN ? AND ?
+            GROUP BY b.contrat_id, p.produit, p.prix
+            ORDER BY b.contrat_id, p.produit
+        """, ids + [first_iso, last_iso])
+        products = {}
+        for contrat_id, produit, qte, prix in cursor.fetchall():
+            products.setdefault(contrat_id, []).append((produit, qte, prix))
+
+        date_emission = datetime.date.today().strftime("%d/%m/%Y")
+        prefix = f"F{periode.replace('-', '')}"
+        for contract in contracts:
+            sequence += 1
+            lines = invoice_lines(contract, first, last, excess.get(contract[0]) or 0, products.get(contract[0], []))
+            totals = {"forfait": lines[0][3], "exces": 0, "produits": 0}
+            for line in lines[1:]:
+                totals["exces" if line[4] == "exces" else "produits"] += line[3]
+            cursor.execute("""
+                INSERT INTO Facture (numero, periode, date_emission, contrat_id, client_id,
+                                     montant_forfait, montant_exces, montant_produits, montant_total)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (f"{prefix}-{sequence:05d}", periode, date_emission, contract[0], contract[1],
+                  totals["forfait"], totals["exces"], totals["produits"], sum(totals.values())))
+            facture_id = cursor.lastrowid
+            cursor.executemany("""
+                INSERT INTO Facture_Ligne (facture_id, designation, qte, prix_unitaire, montant)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(facture_id, line[0], line[1], line[2], line[3]) for line in lines])
+
+        cursor.execute("""
+            UPDATE Facturation SET dernier_contrat_id = ?, nombre_factures = ? WHERE periode = ?
+        """, (ids[-1], sequence, periode))
+        conn.commit()
+        return len(contracts)
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, "%d/%m/%Y").date()
+
+
+def invoice_lines(contract, first, last, excess_kg, products):
+    """Lines of the invoice of a contract: [(designation, qte, prix_unitaire, montant, kind)], the fee first."""
+    _, _, date_debut, date_fin, montant, prix_exces_poids = contract
+    debut, fin = _parse_date(date_debut), _parse_date(date_fin)
+
+    months = max(1, round(((fin - debut).days + 1) / DAYS_PER_MONTH))
+    covered_from, covered_to = max(debut, first), min(fin, last)
+    covered_days = (covered_to - covered_from).days + 1
+    month_days = (last - first).days + 1
+    fee = round(montant / months * covered_days / month_days)
+    designation = (f"Forfait mensuel du {covered_from.strftime('%d/%m/%Y')} "
+                   f"au {covered_to.strftime('%d/%m/%Y')}")
+    if covered_days < month_days:
+        designation += f" ({covered_days}/{month_days} jours)"
+
+    lines = [(designation, 1, fee, fee, "forfait")]
+    if excess_kg > 0:
+        lines.append(("Excès de poids (kg)", excess_kg, prix_exces_poids, excess_kg * prix_exces_poids, "exces"))
+    for produit, qte, prix in products:
+        lines.append((produit, qte, prix, round(qte * prix), "produit"))
+    return lines
+
+
+def load_invoice(cursor, facture_id):
+    """Invoice with its client name and lines, as a dict (None when it doesn't exist)."""
+    cursor.execute("""
+        SELECT f.*, cl.nom AS client_nom FROM Facture f
+        LEFT JOIN Client_Forfait cl ON cl.id = f.client_id
+        WHERE f.id = ?
+    """, (facture_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    invoice = dict(row)
+    cursor.execute("SELECT designation, qte, prix_unitaire, montant FROM Facture_Ligne WHERE facture_id = ? "
+                   "ORDER BY id", (facture_id,))
+    invoice["lignes"] = [dict(line) for line in cursor.fetchall()]
+    return invoice
+
+
+def _render_pending(conn, periode, deadline):
+    """Render the PDFs of the month still missing, until `deadline`. Returns (PDFs, all done)."""
+    cursor = conn.cursor()
+    rendered = 0
+    pool = None
+    try:
+        while time.monotonic() < deadline:
+            cursor.execute("SELECT id FROM Facture WHERE periode = ? AND pdf_path IS NULL ORDER BY id LIMIT ?",
+                           (periode, PDF_CHUNK_SIZE))
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return rendered, True
+            invoices = [load_invoice(cursor, facture_id) for facture_id in ids]
+            for invoice in invoices:
+                invoice["directory"] = os.path.join(INVOICE_DIR, periode)
+
+            if WORKERS > 0:
+                if pool is None:
+                    # spawn: forking a process that runs threads (server, jobs) can deadlock the child
+                    pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+                paths = list(pool.map(write_invoice_pdf, invoices, chunksize=max(1, len(invoices) // WORKERS)))
+            else:
+                paths = [write_invoice_pdf(invoice) for invoice in invoices]
+
+            cursor.executemany("UPDATE Facture SET pdf_path = ? WHERE id = ?",
+                               [(path, invoice["id"]) for path, invoice in zip(paths, invoices)])
+            conn.commit()
+            rendered += len(ids)
+        return rendered, False
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def write_invoice_pdf(invoice):
+    """Render an invoice and write its PDF (run in the worker processes). Returns the path."""
+    os.makedirs(invoice["directory"], exist_ok=True)
+    path = os.path.join(invoice["directory"], f"{invoice['numero']}.pdf")
+    # Written next to the final name then renamed: a crash never leaves half a PDF
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(render_invoice_pdf(invoice))
+    os.replace(temporary_path, path)
+    return path
+
+
+def format_amount(value):
+    return f"{round(value):,}".replace(",", " ") + " DA"
+
+
+def format_quantity(value):
+    return f"{value:g}"
+
+
+def render_invoice_pdf(invoice):
+    """PDF of an invoice (dict of load_invoice), as bytes."""
+    first, _ = parse_period(invoice["periode"])
+    texts = [
+        (50, 790, 18, True, "VITALECOSYSTEM"),
+        (400, 790, 18, True, "FACTURE"),
+        (400, 768, 10, False, f"N° {invoice['numero']}"),
+        (400, 754, 10, False, f"Date d'émission : {invoice['date_emission']}"),
+        (400, 740, 10, False, f"Période : {MONTHS[first.month - 1]} {first.year}"),
+        (50, 740, 11, True, f"Client : {invoice['client_nom'] or ''}"),
+        (50, 725, 10, False, f"Contrat n° {invoice['contrat_id']}"),
+        (50, 690, 10, True, "Désignation"),
+        (340, 690, 10, True, "Qté"),
+        (400, 690, 10, True, "Prix unitaire"),
+        (490, 690, 10, True, "Montant"),
+    ]
+    pages = []
+    y = 670
+    for line in invoice["lignes"]:
+        if y < 80:
+            pages.append(texts)
+            texts = [(50, 790, 10, False, f"Facture {invoice['numero']} (suite)")]
+            y = 760
+        texts += [
+            (50, y, 10, False, line["designation"][:55]),
+            (340, y, 10, False, format_quantity(line["qte"])),
+            (400, y, 10, False, format_amount(line["prix_unitaire"])),
+            (490, y, 10, False, format_amount(line["montant"])),
+        ]
+        y -= 16
+    texts.append((400, y - 20, 12, True, f"Total : {format_amount(invoice['montant_total'])}"))
+    pages.append(texts)
+    return build_pdf(pages)
+
+
+def _pdf_string(text):
+    """PDF string literal in the WinAnsi encoding declared for the fonts (accents of French text)."""
+    data = text.encode("cp1252", errors="replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def build_pdf(pages):
+    """Minimal PDF with the standard Helvetica fonts.
+
+    `pages` is a list of pages, each a list of (x, y, size, bold, text) in points from the bottom left of an A4 page."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    page_numbers = []
+    for texts in pages:
+        content = b"BT\n" + b"".join(
+            b"/%s %d Tf 1 0 0 1 %d %d Tm %s Tj\n" % (b"F2" if bold else b"F1", size, x, y, _pdf_string(text))
+            for x, y, size, bold, text in texts) + b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>" % (len(objects)))
+        page_numbers.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % number for number in page_numbers), len(page_numbers))
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return output
@@ -0,0 +1,183 @@
+"""In-process runner for the periodic background jobs.
+
+Every worker process runs its own JobRunner thread. To make sure a job runs
+once per interval even with several workers, each run first takes a lease in
+the Job_State table: the lease is only granted when no other worker holds it
+and when the job is due (its next_run_at has passed). The jobs themselves are
+written to be idempotent, so a run repeated after a crash is harmless.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+from app_logging import get_logger
+
+# Set VITAL_JOBS=0 to disable the background jobs of this process
+JOBS_ENABLED = os.getenv("VITAL_JOBS", "1") != "0"
+
+# A lease older than this is considered abandoned (crashed worker)
+DEFAULT_LEASE_SECONDS = 600
+
+logger = get_logger("jobs")
+
+# Unique name of this worker process in Job_State.owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class Job:
+    """A function run every `interval` seconds. `function(conn)` returns a JSON-serializable result."""
+
+    def __init__(self, name, function, interval, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        # Metrics of this process
+        self.runs = 0
+        self.failures = 0
+        self.total_duration_ms = 0.0
+        self.last_started_at = None
+        self.last_duration_ms = None
+        self.last_result = None
+        self.last_error = None
+
+    def metrics(self):
+        return {
+            "name": self.name,
+            "interval_s": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "mean_duration_ms": round(self.total_duration_ms / self.runs, 3) if self.runs else None,
+            "last_started_at": self.last_started_at,
+            "last_duration_ms": self.last_duration_ms,
+            "last_result": self.last_result,
+            "last_error": self.last_error
+        }
+
+
+class JobRunner:
+    """Run the registered jobs in a background thread of the current process."""
+
+    def __init__(self, connect):
+        # Function opening a new database connection
+        self.connect = connect
+        self.jobs = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+        # Manual runs and the background thread must not run the same job at once
+        self._run_lock = threading.Lock()
+
+    def register(self, job):
+        self.jobs[job.name] = job
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="job-runner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        # Check the jobs every few seconds; the lease decides whether they are due
+        while not self._stop_event.is_set():
+            for job in list(self.jobs.values()):
+                if self._stop_event.is_set():
+                    break
+                try:
+                    self.run(job.name)
+                except Exception as e:
+                    logger.error(f"Error in job runner for {job.name}: {str(e)}")
+            self._stop_event.wait(min([job.interval for job in self.jobs.values()] + [30]))
+
+    def run(self, name, force=False):
+        """Run a job if it is due (or now with force=True) and this worker gets the lease.
+
+        Returns the job result, or None when the job was skipped."""
+        job = self.jobs[name]
+        with self._run_lock:
+            conn = self.connect()
+            try:
+                if not self._acquire_lease(conn, job, force):
+                    return None
+                return self._run_with_lease(conn, job)
+            finally:
+                conn.close()
+
+    def _acquire_lease(self, conn, job, force):
+        now = time.time()
+        cursor = conn.cursor()
+        # Insert the job the first time, otherwise take the lease if it is free and the job is due
+        cursor.execute("""
+            INSERT INTO Job_State (name, owner, lease_expires_at, next_run_at) VALUES (?, ?, ?, 0)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, lease_expires_at = excluded.lease_expires_at
+            WHERE Job_State.lease_expires_at < ? AND (? OR Job_State.next_run_at <= ?)
+        """, (job.name, WORKER_ID, now + job.lease_seconds, now, 1 if force else 0, now))
+        acquired = cursor.rowcount == 1
+        conn.commit()
+        return acquired
+
+    def _run_with_lease(self, conn, job):
+        started = time.time()
+        job.last_started_at = started
+        status = "ok"
+        result = None
+        error = None
+        try:
+            result = job.function(conn)
+        except Exception as e:
+            conn.rollback()
+            status = "error"
+            error = str(e)
+            logger.error(f"Job {job.name} failed: {error}\n{traceback.format_exc()}")
+        finished = time.time()
+        duration_ms = (finished - started) * 1000
+
+        job.runs += 1
+        job.total_duration_ms += duration_ms
+        job.last_duration_ms = round(duration_ms, 3)
+        job.last_result = result
+        job.last_error = error
+        if error is not None:
+            job.failures += 1
+
+        # Release the lease and schedule the next run
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE Job_State
+            SET lease_expires_at = 0, next_run_at = ?, last_started_at = ?, last_finished_at = ?,
+                last_status = ?, last_result = ?, last_error = ?
+            WHERE name = ? AND owner = ?
+        """, (finished + job.interval, started, finished, status, json.dumps(result), error, job.name, WORKER_ID))
+        conn.commit()
+
+        logger.info("job_run", extra={"fields": {
+            "job": job.name, "status": status, "duration_ms": round(duration_ms, 3), "result": result}})
+        return result
+
+    def get_metrics(self):
+        """Metrics of this process, with the last run recorded by any worker."""
+        states = {}
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM Job_State")
+            for row in cursor.fetchall():
+                state = dict(row)
+                state["last_result"] = json.loads(state["last_result"]) if state["last_result"] else None
+                states[state.pop("name")] = state
+        finally:
+            conn.close()
+
+        metrics = []
+        for job in self.jobs.values():
+            metrics.append({**job.metrics(), "worker": WORKER_ID, "shared": states.get(job.name)})
+        return metrics
@@ -1,13 +1,42 @@
 """FastAPI backend for VITALECOSYSTEM's internal management system."""
 
 import re
+import json
 import sqlite3
+import asyncio
 import os
+import datetime
 from typing import Optional, List
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Depends, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse, Response, FileResponse
+from fastapi.concurrency import run_in_threadpool
+import time
+import query_trace
+import profiler
+from debug_auth import require_debug_token, is_debug_authorized
+import scheduling
+import routing
+import spatial
+import search
+import jobs
+import contract_expiry
+import notifications
+import invoicing
+import receivables
+import purchases
+import export
+import analytics
+import idempotency
+import versioning
+import group_commit
+import backup
+import migrations
+import static_assets
+import compression
+import events
+import validation
+from app_logging import setup_logging, get_logger, log_payload, request_id_var, new_request_id
 from models import (Agent, Produit, Service, Fournisseur, BonAchats, ProduitBonAchat, 
                     Inventaire, VersementBonAchat, ClientModel, ContratForfaitModel, 
                     BonPassageForfaitModel, BonPassageForfaitProduitModel,
@@ -15,32 +44,180 @@ from models import (Agent, Produit, Service, Fournisseur, BonAchats, ProduitBonA
 
 env = os.getenv("VITAL_ENV")
 
+# Structured JSON logging, written by a background thread
+setup_logging()
+logger = get_logger("api")
+
 
 # Database connection setup
-def get_db():
-    """Get a database connection."""
-    
+def get_db_path():
+    """Get the path of the database file for the current environment.
+
+    VITAL_DB_PATH overrides the default path (used to run against a generated database)."""
+    db_path = os.getenv("VITAL_DB_PATH")
+    if db_path:
+        return db_path
+
     if env == "DEV":
-        db_path = "../database/dev/db.sqlite"
+        return "../database/dev/db.sqlite"
     elif env == "PROD":
-        db_path = "../database/prod/db.sqlite"
+        return "../database/prod/db.sqlite"
+    return None
+
+def connect_db():
+    """Open a new database connection (outside of a request)."""
+    
+    db_path = get_db_path()
 
-    if not os.path.exists(db_path):
+    if db_path is None or not os.path.exists(db_path):
         raise HTTPException(status_code=500, detail=f"Database file not found: {db_path}")
     
     # Add check_same_thread=False to allow SQLite connections across different threads
-    conn = sqlite3.connect(db_path, check_same_thread=False)
+    # The traced connection class records the duration of every statement
+    conn = sqlite3.connect(db_path, check_same_thread=False, factory=query_trace.connection_factory())
     cursor = conn.cursor()
     cursor.execute("PRAGMA foreign_keys = ON;")
+    if backup.BACKUP_DIR:
+        # Only the WAL shipper checkpoints, after copying the frames (see backup.py)
+        cursor.execute("PRAGMA wal_autocheckpoint = 0")
     conn.row_factory = sqlite3.Row  # This enables column access by name
+    return conn
+
+def get_db():
+    """Get a database connection."""
+    
+    conn = connect_db()
     
     try:
         yield conn
     finally:
         conn.close()
 
+def connect_read_only():
+    """Open a read-only connection for the reports (see analytics.py)."""
+    db_path = get_db_path()
+    if db_path is None or not os.path.exists(db_path):
+        raise HTTPException(status_code=500, detail=f"Database file not found: {db_path}")
+    return analytics.connect_read_only(db_path)
+
+# Reports and exports: their own connections and threads, so they don't hold up the writes
+analytics_pool = analytics.AnalyticsPool(connect_read_only)
+
 app = FastAPI()
 
+@app.on_event("startup")
+def prepare_database():
+    """Bring the schema up to date and build the derived tables."""
+    conn = connect_db()
+    try:
+        applied = migrations.migrate(conn)
+        if applied:
+            logger.info(f"Migrations applied: {applied}")
+        # Fill the new columns and indexes (agents' positions, search index...) before the first request
+        # when they are small; the job continues the others, or startup finishes them without jobs
+        backfills = migrations.run_backfills(
+            conn, seconds=migrations.STARTUP_BACKFILL_SECONDS if jobs.JOBS_ENABLED else None)
+        if backfills["terminees"]:
+            logger.info(f"Migration backfills completed: {backfills['terminees']}")
+        cursor = conn.cursor()
+        # In WAL mode the reports of the analytics pool don't block the writes (the mode is kept in the file)
+        cursor.execute("PRAGMA journal_mode = WAL")
+        spatial.detect_spatial_index(cursor)
+        search.detect_search_index(cursor)
+        # Build the passage schedule the first time
+        cursor.execute("SELECT COUNT(*) FROM Passage_Schedule")
+        if cursor.fetchone()[0] == 0:
+            scheduling.rebuild_schedule(cursor)
+            conn.commit()
+    finally:
+        conn.close()
+
+# Background jobs of this process (VITAL_JOBS=0 disables them)
+job_runner = jobs.JobRunner(connect_db)
+# Backfills of the migrations of large tables, in short batches
+job_runner.register(jobs.Job("migrations_en_ligne", migrations.run_backfills, interval=60))
+job_runner.register(jobs.Job("purge_journal_changements", events.purge_change_log, interval=3600))
+job_runner.register(jobs.Job("purge_cles_idempotence", idempotency.purge_expired_keys, interval=3600))
+job_runner.register(jobs.Job("expiration_contrats", contract_expiry.expire_contracts,
+                             interval=int(os.getenv("VITAL_CONTRACT_EXPIRY_INTERVAL", "3600"))))
+# Bills the previous month, then continues the unfinished runs (at most invoicing.SECONDS_PER_RUN each time)
+job_runner.register(jobs.Job("facturation_mensuelle", invoicing.billing_job, interval=120))
+# Months of the purchase rollup whose lines changed (the reports compute them until then)
+job_runner.register(jobs.Job("cumuls_achats", purchases.refresh_monthly_purchases, interval=300))
+job_runner.register(jobs.Job("rappels_passages", notifications.build_daily_reminders, interval=3600))
+job_runner.register(jobs.Job("envoi_notifications", notifications.send_pending,
+                             interval=notifications.SEND_INTERVAL))
+job_runner.register(jobs.Job("purge_notifications", notifications.purge_old_notifications, interval=3600))
+
+# Continuous backup of the database (enabled with VITAL_BACKUP_DIR)
+wal_shipper = backup.WalShipper(get_db_path(), backup.BACKUP_DIR, get_logger("backup")) if backup.BACKUP_DIR else None
+
+@app.on_event("startup")
+def start_backup():
+    if wal_shipper is not None and not wal_shipper.start():
+        logger.info("WAL shipping already running in another worker")
+
+@app.on_event("shutdown")
+def stop_backup():
+    if wal_shipper is not None:
+        wal_shipper.stop()
+
+# Writes the notifications queued by the request handlers to the outbox
+outbox_writer = notifications.OutboxWriter(connect_db)
+
+@app.on_event("startup")
+def start_jobs():
+    outbox_writer.start()
+    if jobs.JOBS_ENABLED:
+        job_runner.start()
+
+@app.on_event("shutdown")
+def stop_jobs():
+    job_runner.stop()
+    outbox_writer.stop()
+    analytics_pool.close()
+
+# Group commit of the passage and versement inserts (opt-in with VITAL_WRITE_QUEUE=1, see group_commit.py)
+write_queue = group_commit.WriteQueue(connect_db) if group_commit.ENABLED else None
+
+@app.on_event("startup")
+def start_write_queue():
+    if write_queue is not None:
+        write_queue.start()
+
+@app.on_event("shutdown")
+def stop_write_queue():
+    if write_queue is not None:
+        write_queue.stop()
+
+# Broadcasts the changes of the Change_Log table to the /api/events streams
+event_hub = events.EventHub(connect_db)
+
+@app.on_event("startup")
+async def start_event_hub():
+    event_hub.start()
+
+@app.on_event("shutdown")
+async def stop_event_hub():
+    await event_hub.stop()
+
+def notify_new_client(cursor, client_id, version, client_nom, agent_name):
+    """Tell an agent that a client was assigned to them (without waiting for the sending).
+
+    The version of the client row identifies the assignment: a client moved back to an
+    agent is notified again, the same assignment only once."""
+    notification = notifications.agent_notification(
+        cursor, agent_name, "nouveau_client", f"nouveau_client:{client_id}:{version}",
+        f"Bonjour {agent_name}, le client {client_nom} vous a été assigné.")
+    if notification is not None:
+        outbox_writer.enqueue(notification)
+
+# Innermost middleware: POST requests resent with the same Idempotency-Key get the stored response
+app.add_middleware(idempotency.IdempotencyMiddleware, connect=connect_db)
+
+# Compresses the responses as the endpoints send them (and the replayed ones)
+app.add_middleware(compression.CompressionMiddleware)
+
 # Configuration CORS
 app.add_middleware(
     CORSMiddleware,
@@ -50,11 +227,145 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Give every request an ID (or reuse the client's X-Request-ID) for the logs."""
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    if request.method in ("POST", "PUT", "DELETE"):
+        # Send the changes of this request to the /api/events streams now, without waiting for the next poll
+        event_hub.wake()
+    return response
+
+@app.middleware("http")
+async def request_profile_middleware(request: Request, call_next):
+    """Profile a single request when it is sent with the X-Profile header.
+
+    The stacks are stored in memory and can be fetched with the ID returned
+    in the X-Profile-Id response header."""
+    if not profiler.PROFILER_ENABLED or not request.headers.get("X-Profile"):
+        return await call_next(request)
+    if not is_debug_authorized(request):
+        return await call_next(request)
+
+    sampler = profiler.start_request_profile()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        profile_id = profiler.finish_request_profile(sampler, request.method, request.url.path, duration_ms)
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
 # Health check endpoint for Fly.io
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy"}
 
+# Query tracing endpoints
+@app.get("/api/debug/queries", dependencies=[Depends(require_debug_token)])
+async def get_debug_queries(limit: int = 20, order_by: str = "total_ms"):
+    """Get the top SQL statements by total time (or count, max_ms, avg_ms, rows)."""
+    valid_orders = ["total_ms", "count", "max_ms", "avg_ms", "rows"]
+    if order_by not in valid_orders:
+        raise HTTPException(status_code=400, detail=f"Tri invalide. Valeurs acceptées: {', '.join(valid_orders)}")
+
+    return {
+        "enabled": query_trace.TRACE_ENABLED,
+        "slow_query_ms": query_trace.SLOW_QUERY_MS,
+        "queries": query_trace.get_top_queries(limit, order_by)
+    }
+
+@app.delete("/api/debug/queries", dependencies=[Depends(require_debug_token)])
+async def reset_debug_queries():
+    """Reset the collected SQL statistics."""
+    query_trace.reset_stats()
+    return {"message": "Statistiques des requêtes réinitialisées"}
+
+# Background jobs endpoints
+@app.get("/api/jobs", dependencies=[Depends(require_debug_token)])
+async def get_jobs():
+    """Get the run metrics of the background jobs."""
+    return {"enabled": jobs.JOBS_ENABLED, "jobs": await run_in_threadpool(job_runner.get_metrics)}
+
+@app.post("/api/jobs/{name}/run", dependencies=[Depends(require_debug_token)])
+async def run_job(name: str):
+    """Run a background job now, without waiting for its next run."""
+    if name not in job_runner.jobs:
+        raise HTTPException(status_code=404, detail=f"Tâche '{name}' non trouvée")
+    result = await run_in_threadpool(job_runner.run, name, True)
+    if result is None:
+        raise HTTPException(status_code=409, detail=f"La tâche '{name}' est déjà en cours sur un autre processus")
+    return {"job": name, "result": result}
+
+@app.get("/api/backup", dependencies=[Depends(require_debug_token)])
+async def get_backup_status():
+    """Get the state of the continuous backup."""
+    if wal_shipper is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "shipping": wal_shipper.conn is not None,
+        "generation": os.path.basename(wal_shipper.generation_dir) if wal_shipper.generation_dir else None,
+        **wal_shipper.stats,
+        "generation_list": await run_in_threadpool(backup.list_generations, backup.BACKUP_DIR)
+    }
+
+@app.get("/api/migrations", dependencies=[Depends(require_debug_token)])
+async def get_migrations(conn = Depends(get_db)):
+    """Get the applied schema migrations and the state of their backfill."""
+    cursor = conn.cursor()
+    return {"migrations": migrations.get_status(cursor)}
+
+@app.get("/api/notifications", dependencies=[Depends(require_debug_token)])
+async def get_notifications_stats(conn = Depends(get_db)):
+    """Get the state of the notification outbox."""
+    cursor = conn.cursor()
+    stats = notifications.get_outbox_stats(cursor)
+    stats["file_pleine"] = outbox_writer.dropped
+    return stats
+
+# Sampling profiler endpoints (enabled with VITAL_PROFILER=1)
+@app.get("/api/debug/profile", response_class=PlainTextResponse, dependencies=[Depends(require_debug_token)])
+async def profile_process(seconds: float = 10, interval_ms: float = 10):
+    """Sample the stacks of the whole process for N seconds.
+
+    Returns a collapsed-stack file that can be loaded in speedscope or flamegraph.pl."""
+    if not profiler.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Le profileur n'est pas activé (VITAL_PROFILER=1)")
+    if not 0 < seconds <= profiler.MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"La durée doit être entre 0 et {profiler.MAX_PROFILE_SECONDS} secondes")
+
+    # Sample from a worker thread so the event loop keeps serving requests
+    collapsed = await run_in_threadpool(profiler.profile_process, seconds, interval_ms)
+    if collapsed is None:
+        raise HTTPException(status_code=409, detail="Un profilage est déjà en cours")
+    return PlainTextResponse(collapsed, headers={"Content-Disposition": "attachment; filename=profile.collapsed"})
+
+@app.get("/api/debug/profile/requests", dependencies=[Depends(require_debug_token)])
+async def list_request_profiles():
+    """List the stored per-request profiles (requests sent with the X-Profile header)."""
+    if not profiler.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Le profileur n'est pas activé (VITAL_PROFILER=1)")
+    return profiler.list_request_profiles()
+
+@app.get("/api/debug/profile/requests/{profile_id}", response_class=PlainTextResponse,
+         dependencies=[Depends(require_debug_token)])
+async def get_request_profile(profile_id: str):
+    """Get the collapsed stacks of one per-request profile."""
+    if not profiler.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Le profileur n'est pas activé (VITAL_PROFILER=1)")
+    profile = profiler.get_request_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profil {profile_id} non trouvé")
+    return PlainTextResponse(profile["collapsed"])
+
 def recalculate_montant_verse(bon_id: int, cursor):
     """Recalculate the total montant_verse for a bon d'achat based on versements"""
     cursor.execute("SELECT SUM(montant) FROM Versement_Bon_Achat WHERE bon_achat_id = ?", (bon_id,))
@@ -70,14 +381,59 @@ def recalculate_montant_verse(bon_id: int, cursor):
 
 
 if env == "PROD":
-    app.mount("/assets", StaticFiles(directory="../frontend/dist/assets"), name="assets")
+    # Hashed assets are sent precompressed and cached for good, index.html is kept in memory
+    app.mount("/assets", static_assets.PrecompressedStaticFiles(directory="../frontend/dist/assets"), name="assets")
+    index_page = static_assets.IndexPage("../frontend/dist/index.html")
 
     @app.get("/")
-    async def serve_react_app():
-        index_path = "../frontend/dist/index.html"
-        if os.path.exists(index_path):
-            return FileResponse(index_path)
-        return {"error": "index.html not found"}
+    async def serve_react_app(request: Request):
+        response = index_page.response(request)
+        if response is None:
+            return {"error": "index.html not found"}
+        return response
+
+# Change feed (Server-Sent Events)
+@app.get("/api/events")
+async def get_events(request: Request, tables: Optional[str] = None):
+    """Stream the changes of the tables (all of them, or a comma-separated list) as Server-Sent Events.
+
+    Each event is {"table", "id", "op", "version"}. A browser reconnecting with
+    Last-Event-ID receives the changes it missed, or a "reset" event."""
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID invalide")
+    table_filter = set(table.strip() for table in tables.split(",") if table.strip()) if tables else None
+
+    subscriber = event_hub.subscribe(table_filter)
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Trop de connexions au flux d'événements")
+    # X-Accel-Buffering: proxies must send every event immediately
+    return StreamingResponse(event_hub.stream(subscriber, last_event_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Recherche plein texte
+@app.get("/api/search")
+async def search_records(q: str, types: Optional[str] = None, limit: int = 20, conn = Depends(get_db)):
+    """
+    Recherche les clients, fournisseurs, produits et services dont le texte contient les mots
+    de `q` (début de mot, sans tenir compte des accents ni de la casse), les plus pertinents d'abord.
+    `types` limite la recherche (ex: "client,fournisseur").
+    """
+    try:
+        type_filter = set(name.strip() for name in types.split(",")) if types else None
+        if type_filter is not None and not type_filter <= set(search.TYPES):
+            raise HTTPException(status_code=400,
+                                detail=f"Types invalides. Valeurs acceptées: {', '.join(search.TYPES)}")
+        cursor = conn.cursor()
+        return search.search(cursor, q, type_filter, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching '{q}': {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Agent endpoints
 @app.get("/api/agents", response_model=List[Agent])
@@ -92,10 +448,31 @@ async def get_agents(conn = Depends(get_db)):
         return [dict(agent) for agent in agents]
     except Exception as e:
         # Log the error for server-side debugging
-        print(f"Error fetching agents: {str(e)}")
+        logger.error(f"Error fetching agents: {str(e)}")
         # Return a user-friendly error
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
+def check_position(lat, lng):
+    """Reject coordinates outside of the valid latitude/longitude ranges."""
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        raise HTTPException(status_code=400, detail="Coordonnées GPS invalides")
+
+# Declared before /api/agents/{agent_id} so that "nearest" is not read as an ID
+@app.get("/api/agents/nearest")
+async def get_nearest_agents(lat: float, lng: float, limit: int = 1, conn = Depends(get_db)):
+    """Get the agents closest to a position, with their distance in km."""
+    try:
+        check_position(lat, lng)
+        if limit < 1:
+            raise HTTPException(status_code=400, detail="Le nombre d'agents doit être positif")
+        cursor = conn.cursor()
+        return spatial.nearest_agents(cursor, lat, lng, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching nearest agents: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
 @app.get("/api/agents/{agent_id}", response_model=Agent)
 async def get_agent(agent_id: int, conn = Depends(get_db)):
     """Get a specific agent by ID."""
@@ -111,7 +488,7 @@ async def get_agent(agent_id: int, conn = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching agent {agent_id}: {str(e)}")
+        logger.error(f"Error fetching agent {agent_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/agents", response_model=Agent)
@@ -138,13 +515,14 @@ async def create_agent(agent: Agent, conn = Depends(get_db)):
             agent.regime,
             agent.notification
         ))
+        spatial.refresh_position(cursor, "agent", next_id)
         
         conn.commit()
         
         # Return the created agent with its ID
         return {**agent.dict(), "id": next_id}
     except Exception as e:
-        print(f"Error creating agent: {str(e)}")
+        logger.error(f"Error creating agent: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/agents/{agent_id}", response_model=Agent)
@@ -172,6 +550,7 @@ async def update_agent(agent_id: int, agent: Agent, conn = Depends(get_db)):
             agent.notification,
             agent_id
         ))
+        spatial.refresh_position(cursor, "agent", agent_id)
         
         conn.commit()
         
@@ -180,7 +559,7 @@ async def update_agent(agent_id: int, agent: Agent, conn = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating agent {agent_id}: {str(e)}")
+        logger.error(f"Error updating agent {agent_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/agents/{agent_id}")
@@ -196,13 +575,14 @@ async def delete_agent(agent_id: int, conn = Depends(get_db)):
         
         # Delete the agent
         cursor.execute("DELETE FROM Agents WHERE id = ?", (agent_id,))
+        spatial.remove_position(cursor, "agent", agent_id)
         conn.commit()
         
         return {"message": f"Agent avec ID {agent_id} supprimé avec succès"}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting agent {agent_id}: {str(e)}")
+        logger.error(f"Error deleting agent {agent_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Product endpoints
@@ -218,7 +598,7 @@ async def get_produits(conn = Depends(get_db)):
         return [dict(produit) for produit in produits]
     except Exception as e:
         # Log the error for server-side debugging
-        print(f"Error fetching products: {str(e)}")
+        logger.error(f"Error fetching products: {str(e)}")
         # Return a user-friendly error
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
@@ -254,7 +634,7 @@ async def create_produit(produit: Produit, conn = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error creating product: {str(e)}")
+        logger.error(f"Error creating product: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/produits/{produit_id}", response_model=Produit)
@@ -291,7 +671,7 @@ async def update_produit(produit_id: int, produit: Produit, conn = Depends(get_d
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating product {produit_id}: {str(e)}")
+        logger.error(f"Error updating product {produit_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/produits/{produit_id}")
@@ -313,7 +693,7 @@ async def delete_produit(produit_id: int, conn = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting product {produit_id}: {str(e)}")
+        logger.error(f"Error deleting product {produit_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Service endpoints
@@ -329,7 +709,7 @@ async def get_services(conn = Depends(get_db)):
         return [dict(service) for service in services]
     except Exception as e:
         # Log the error for server-side debugging
-        print(f"Error fetching services: {str(e)}")
+        logger.error(f"Error fetching services: {str(e)}")
         # Return a user-friendly error
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
@@ -366,7 +746,7 @@ async def create_service(service: Service, conn = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error creating service: {str(e)}")
+        logger.error(f"Error creating service: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/services/{service_id}", response_model=Service)
@@ -404,7 +784,7 @@ async def update_service(service_id: int, service: Service, conn = Depends(get_d
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating service {service_id}: {str(e)}")
+        logger.error(f"Error updating service {service_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/services/{service_id}")
@@ -426,7 +806,7 @@ async def delete_service(service_id: int, conn = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting service {service_id}: {str(e)}")
+        logger.error(f"Error deleting service {service_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Fournisseur endpoints
@@ -449,7 +829,7 @@ async def get_fournisseurs(conn = Depends(get_db)):
         
         return fournisseurs
     except Exception as e:
-        print(f"Error fetching suppliers: {str(e)}")
+        logger.error(f"Error fetching suppliers: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.get("/api/fournisseurs/{fournisseur_id}", response_model=Fournisseur)
@@ -473,7 +853,7 @@ async def get_fournisseur(fournisseur_id: int, conn = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching supplier {fournisseur_id}: {str(e)}")
+        logger.error(f"Error fetching supplier {fournisseur_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/fournisseurs", response_model=Fournisseur)
@@ -510,7 +890,7 @@ async def create_fournisseur(fournisseur: Fournisseur, conn = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error creating supplier: {str(e)}")
+        logger.error(f"Error creating supplier: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/fournisseurs/{fournisseur_id}", response_model=Fournisseur)
@@ -549,7 +929,7 @@ async def update_fournisseur(fournisseur_id: int, fournisseur: Fournisseur, conn
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating supplier {fournisseur_id}: {str(e)}")
+        logger.error(f"Error updating supplier {fournisseur_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/fournisseurs/{fournisseur_id}")
@@ -577,7 +957,7 @@ async def get_bon_achats(conn = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/bon-achats/{bon_id}", response_model=BonAchats)
-async def get_bon_achat(bon_id: int, conn = Depends(get_db)):
+async def get_bon_achat(bon_id: int, response: Response, conn = Depends(get_db)):
     """Get a specific bon d'achat by ID"""
     try:
         cursor = conn.cursor()
@@ -585,6 +965,7 @@ async def get_bon_achat(bon_id: int, conn = Depends(get_db)):
         bon = cursor.fetchone()
         if bon is None:
             raise HTTPException(status_code=404, detail="Bon d'achat non trouvé")
+        response.headers["ETag"] = versioning.etag(bon["version"])
         return dict(bon)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -626,15 +1007,19 @@ async def create_bon_achat(bon: BonAchats, id: Optional[int] = None, conn = Depe
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/bon-achats/{bon_id}", response_model=BonAchats)
-async def update_bon_achat(bon_id: int, bon: BonAchats, conn = Depends(get_db)):
-    """Update a bon d'achat"""
+async def update_bon_achat(bon_id: int, bon: BonAchats, response: Response,
+                           if_match: Optional[str] = Header(None), conn = Depends(get_db)):
+    """Update a bon d'achat (only if it still has the version of If-Match or of the body, when given)"""
     try:
         cursor = conn.cursor()
+        expected_version = versioning.expected_version(if_match, bon.version)
         
         # First get the current bon d'achat to check if it exists
-        cursor.execute("SELECT id FROM Bon_Achats WHERE id = ?", (bon_id,))
-        if cursor.fetchone() is None:
+        cursor.execute("SELECT id, version FROM Bon_Achats WHERE id = ?", (bon_id,))
+        existing_bon = cursor.fetchone()
+        if existing_bon is None:
             raise HTTPException(status_code=404, detail="Bon d'achat non trouvé")
+        versioning.check_version(existing_bon, expected_version, "Le bon d'achat")
         
         # Calculate the actual montant_verse based on versements
         cursor.execute("SELECT SUM(montant) FROM Versement_Bon_Achat WHERE bon_achat_id = ?", (bon_id,))
@@ -644,14 +1029,19 @@ async def update_bon_achat(bon_id: int, bon: BonAchats, conn = Depends(get_db)):
         # Ensure montant_verse matches the versements
         montant_verse = total_versements
             
-        # Update the bon d'achat
+        # Update the bon d'achat, unless another update changed its version since it was read
         cursor.execute(
-            "UPDATE Bon_Achats SET date = ?, fournisseur = ?, montant_total = ?, montant_verse = ? WHERE id = ? RETURNING *",
-            (bon.date, bon.fournisseur, bon.montant_total, montant_verse, bon_id)
+            "UPDATE Bon_Achats SET date = ?, fournisseur = ?, montant_total = ?, montant_verse = ?, version = version + 1 "
+            "WHERE id = ? AND (? IS NULL OR version = ?) RETURNING *",
+            (bon.date, bon.fournisseur, bon.montant_total, montant_verse, bon_id, expected_version, expected_version)
         )
         updated_bon = cursor.fetchone()
+        if updated_bon is None:
+            conn.rollback()
+            raise versioning.conflict("Le bon d'achat")
         conn.commit()
         
+        response.headers["ETag"] = versioning.etag(updated_bon["version"])
         return dict(updated_bon)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -868,7 +1258,7 @@ async def get_inventaire(conn = Depends(get_db)):
         items = cursor.fetchall()
         return [dict(item) for item in items]
     except sqlite3.Error as e:
-        print(f"Error fetching inventory: {str(e)}")
+        logger.error(f"Error fetching inventory: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.get("/api/bon-achats/{bon_id}/versements", response_model=List[VersementBonAchat])
@@ -883,7 +1273,7 @@ async def get_versements_bon_achat(bon_id: int, conn = Depends(get_db)):
         versements = cursor.fetchall()
         return [dict(row) for row in versements]
     except sqlite3.Error as e:
-        print(f"Error fetching versements: {str(e)}")
+        logger.error(f"Error fetching versements: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/bon-achats/{bon_id}/versements", response_model=VersementBonAchat)
@@ -927,7 +1317,7 @@ async def create_versement_bon_achat(bon_id: int, versement: VersementBonAchat,
         conn.commit()
         return dict(new_versement)
     except sqlite3.Error as e:
-        print(f"Error creating versement: {str(e)}")
+        logger.error(f"Error creating versement: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/bon-achats/{bon_id}/versements/{versement_id}", response_model=VersementBonAchat)
@@ -1029,12 +1419,28 @@ async def get_clients(conn = Depends(get_db)):
         return [dict(client) for client in clients]
     except Exception as e:
         # Log the error for server-side debugging
-        print(f"Error fetching clients: {str(e)}")
+        logger.error(f"Error fetching clients: {str(e)}")
         # Return a user-friendly error
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
+# Declared before /api/clients/{client_id} so that "within" is not read as an ID
+@app.get("/api/clients/within")
+async def get_clients_within(lat: float, lng: float, radius: float, conn = Depends(get_db)):
+    """Get the clients at most `radius` km from a position, closest first."""
+    try:
+        check_position(lat, lng)
+        if radius <= 0:
+            raise HTTPException(status_code=400, detail="Le rayon doit être positif")
+        cursor = conn.cursor()
+        return spatial.clients_within(cursor, lat, lng, radius)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching clients within {radius} km: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
 @app.get("/api/clients/{client_id}", response_model=ClientModel)
-async def get_client(client_id: int, conn = Depends(get_db)):
+async def get_client(client_id: int, response: Response, conn = Depends(get_db)):
     """Get a specific client by ID."""
     try:
         cursor = conn.cursor()
@@ -1044,11 +1450,12 @@ async def get_client(client_id: int, conn = Depends(get_db)):
         if client is None:
             raise HTTPException(status_code=404, detail=f"Client_Forfait avec ID {client_id} non trouvé")
         
+        response.headers["ETag"] = versioning.etag(client["version"])
         return dict(client)
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching client {client_id}: {str(e)}")
+        logger.error(f"Error fetching client {client_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/clients", response_model=ClientModel)
@@ -1062,6 +1469,16 @@ async def create_client(client: ClientModel, conn = Depends(get_db)):
         if cursor.fetchone() is not None:
             raise HTTPException(status_code=400, detail=f"Un client avec le nom '{client.nom}' existe déjà")
         
+        # Without an agent, the client is assigned to the closest agent
+        if not client.agent:
+            position = routing.parse_gps(client.gps)
+            if position is None:
+                raise HTTPException(status_code=400, detail="Un agent ou une position GPS est requis")
+            nearest = spatial.nearest_agents(cursor, position[0], position[1])
+            if not nearest:
+                raise HTTPException(status_code=400, detail="Aucun agent avec une position GPS")
+            client.agent = nearest[0]["nom"]
+        
         # Get next ID
         cursor.execute("SELECT MAX(id) FROM Client_Forfait")
         max_id = cursor.fetchone()[0]
@@ -1069,8 +1486,8 @@ async def create_client(client: ClientModel, conn = Depends(get_db)):
         
         # Insert the new client
         cursor.execute("""
-            INSERT INTO Client_Forfait (id, nom, specialite, tel, mode, agent, etat_contrat, debut_contrat, fin_contrat)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO Client_Forfait (id, nom, specialite, tel, mode, agent, etat_contrat, debut_contrat, fin_contrat, gps)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             next_id,
             client.nom,
@@ -1080,30 +1497,36 @@ async def create_client(client: ClientModel, conn = Depends(get_db)):
             client.agent,
             client.etat_contrat,
             client.debut_contrat,
-            client.fin_contrat
+            client.fin_contrat,
+            client.gps
         ))
+        spatial.refresh_position(cursor, "client", next_id)
         
         conn.commit()
+        notify_new_client(cursor, next_id, 1, client.nom, client.agent)
         
-        # Return the created client with its ID
-        return {**client.dict(), "id": next_id}
+        # Return the created client with its ID (a new row has version 1)
+        return {**client.dict(), "id": next_id, "version": 1}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error creating client: {str(e)}")
+        logger.error(f"Error creating client: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/clients/{client_id}", response_model=ClientModel)
-async def update_client(client_id: int, client: ClientModel, conn = Depends(get_db)):
-    """Update an existing client."""
+async def update_client(client_id: int, client: ClientModel, response: Response,
+                        if_match: Optional[str] = Header(None), conn = Depends(get_db)):
+    """Update an existing client (only if it still has the version of If-Match or of the body, when given)."""
     try:
         cursor = conn.cursor()
+        expected_version = versioning.expected_version(if_match, client.version)
         
         # Check if client exists
         cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (client_id,))
         existing_client = cursor.fetchone()
         if existing_client is None:
             raise HTTPException(status_code=404, detail=f"Client_Forfait avec ID {client_id} non trouvé")
+        versioning.check_version(existing_client, expected_version, "Le client")
         
         # Check if name is already taken by another client
         if client.nom != existing_client['nom']:
@@ -1111,12 +1534,12 @@ async def update_client(client_id: int, client: ClientModel, conn = Depends(get_
             if cursor.fetchone() is not None:
                 raise HTTPException(status_code=400, detail=f"Un client avec le nom '{client.nom}' existe déjà")
         
-        # Update the client
+        # Update the client, unless another update changed its version since it was read
         cursor.execute("""
             UPDATE Client_Forfait 
             SET nom = ?, specialite = ?, tel = ?, mode = ?, agent = ?, 
-                etat_contrat = ?, debut_contrat = ?, fin_contrat = ?
-            WHERE id = ?
+                etat_contrat = ?, debut_contrat = ?, fin_contrat = ?, gps = ?, version = version + 1
+            WHERE id = ? AND (? IS NULL OR version = ?)
         """, (
             client.nom,
             client.specialite,
@@ -1126,20 +1549,33 @@ async def update_client(client_id: int, client: ClientModel, conn = Depends(get_
             client.etat_contrat,
             client.debut_contrat,
             client.fin_contrat,
-            client_id
+            client.gps,
+            client_id,
+            expected_version,
+            expected_version
         ))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            raise versioning.conflict("Le client")
+        
+        # The mode or the agent may have changed: update the passage schedule
+        scheduling.refresh_client(cursor, client_id)
+        spatial.refresh_position(cursor, "client", client_id)
         
         conn.commit()
         
         # Fetch updated client
         cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (client_id,))
         updated_client = cursor.fetchone()
+        if client.agent != existing_client['agent']:
+            notify_new_client(cursor, client_id, updated_client["version"], client.nom, client.agent)
         
+        response.headers["ETag"] = versioning.etag(updated_client["version"])
         return dict(updated_client)
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating client {client_id}: {str(e)}")
+        logger.error(f"Error updating client {client_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/clients/{client_id}")
@@ -1155,13 +1591,14 @@ async def delete_client(client_id: int, conn = Depends(get_db)):
         
         # Delete the client
         cursor.execute("DELETE FROM Client_Forfait WHERE id = ?", (client_id,))
+        spatial.remove_position(cursor, "client", client_id)
         conn.commit()
         
         return {"message": f"Client_Forfait avec ID {client_id} supprimé avec succès"}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting client {client_id}: {str(e)}")
+        logger.error(f"Error deleting client {client_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Contrat Forfait Endpoints
@@ -1178,11 +1615,11 @@ async def get_contrats_forfait(conn = Depends(get_db)):
         # Convertir les résultats en liste de dictionnaires
         return [dict(contrat) for contrat in contrats]
     except Exception as e:
-        print(f"Error fetching contrats forfait: {str(e)}")
+        logger.error(f"Error fetching contrats forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des contrats forfait: {str(e)}")
 
 @app.get("/api/contrats-forfait/{contrat_id}", response_model=ContratForfaitModel)
-async def get_contrat_forfait(contrat_id: int, conn = Depends(get_db)):
+async def get_contrat_forfait(contrat_id: int, response: Response, conn = Depends(get_db)):
     """
     Récupère un contrat forfait spécifique par son ID
     """
@@ -1196,12 +1633,13 @@ async def get_contrat_forfait(contrat_id: int, conn = Depends(get_db)):
         if contrat is None:
             raise HTTPException(status_code=404, detail="Contrat forfait non trouvé")
         
-        # Retourner le contrat
+        # Retourner le contrat, avec sa version dans l'en-tête ETag
+        response.headers["ETag"] = versioning.etag(contrat["version"])
         return dict(contrat)
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
-        print(f"Error fetching contrat forfait {contrat_id}: {str(e)}")
+        logger.error(f"Error fetching contrat forfait {contrat_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération du contrat forfait: {str(e)}")
 
 @app.get("/api/clients/{client_id}/contrats-forfait", response_model=List[ContratForfaitModel])
@@ -1227,7 +1665,7 @@ async def get_contrats_forfait_by_client(client_id: int, conn = Depends(get_db))
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
-        print(f"Error fetching contrats forfait for client {client_id}: {str(e)}")
+        logger.error(f"Error fetching contrats forfait for client {client_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des contrats forfait: {str(e)}")
 
 @app.post("/api/contrats-forfait", response_model=ContratForfaitModel)
@@ -1268,6 +1706,9 @@ async def create_contrat_forfait(contrat: ContratForfaitModel, conn = Depends(ge
             WHERE id = ?
         """, (contrat.date_debut, contrat.date_fin, contrat.client_id))
         
+        # Planifier le premier passage du nouveau contrat
+        scheduling.refresh_contract(cursor, contrat_id)
+        
         conn.commit()
         
         # Retourner le contrat complet avec l'ID
@@ -1279,21 +1720,25 @@ async def create_contrat_forfait(contrat: ContratForfaitModel, conn = Depends(ge
             "prix_exces_poids": contrat.prix_exces_poids,
             "poids_forfait": contrat.poids_forfait,
             "client_id": contrat.client_id,
-            "etat": "Actif"
+            "etat": "Actif",
+            "version": 1
         }
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
-        print(f"Error creating contrat forfait: {str(e)}")
+        logger.error(f"Error creating contrat forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création du contrat forfait: {str(e)}")
 
 @app.put("/api/contrats-forfait/{contrat_id}", response_model=ContratForfaitModel)
-async def update_contrat_forfait(contrat_id: int, contrat: ContratForfaitModel, conn = Depends(get_db)):
+async def update_contrat_forfait(contrat_id: int, contrat: ContratForfaitModel, response: Response,
+                                 if_match: Optional[str] = Header(None), conn = Depends(get_db)):
     """
     Met à jour un contrat forfait existant
+    (seulement s'il a encore la version de l'en-tête If-Match ou du corps, quand elle est donnée)
     """
     try:
         cursor = conn.cursor()
+        expected_version = versioning.expected_version(if_match, contrat.version)
         
         # Vérifier si le contrat existe
         cursor.execute("SELECT * FROM Contrat_Forfait WHERE id = ?", (contrat_id,))
@@ -1301,6 +1746,7 @@ async def update_contrat_forfait(contrat_id: int, contrat: ContratForfaitModel,
         
         if existing_contrat is None:
             raise HTTPException(status_code=404, detail="Contrat forfait non trouvé")
+        versioning.check_version(existing_contrat, expected_version, "Le contrat")
         
         # Vérifier si le client existe
         cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (contrat.client_id,))
@@ -1319,13 +1765,17 @@ async def update_contrat_forfait(contrat_id: int, contrat: ContratForfaitModel,
                 raise HTTPException(status_code=400, 
                                   detail="Un contrat actif existe déjà pour ce client. Veuillez le mettre en pause avant d'activer celui-ci.")
         
-        # Mettre à jour le contrat
+        # Mettre à jour le contrat, sauf si une autre mise à jour a changé sa version depuis sa lecture
         cursor.execute("""
             UPDATE Contrat_Forfait
-            SET date_debut = ?, date_fin = ?, montant = ?, prix_exces_poids = ?, poids_forfait = ?, client_id = ?, etat = ?
-            WHERE id = ?
+            SET date_debut = ?, date_fin = ?, montant = ?, prix_exces_poids = ?, poids_forfait = ?, client_id = ?, etat = ?,
+                version = version + 1
+            WHERE id = ? AND (? IS NULL OR version = ?)
         """, (contrat.date_debut, contrat.date_fin, contrat.montant, contrat.prix_exces_poids, 
-              contrat.poids_forfait, contrat.client_id, contrat.etat, contrat_id))
+              contrat.poids_forfait, contrat.client_id, contrat.etat, contrat_id, expected_version, expected_version))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            raise versioning.conflict("Le contrat")
         
         # Mettre à jour les informations du client en fonction de l'état du contrat
         if contrat.etat == "Actif":
@@ -1360,16 +1810,20 @@ async def update_contrat_forfait(contrat_id: int, contrat: ContratForfaitModel,
                     WHERE id = ?
                 """, (contrat.client_id,))
         
+        # Mettre à jour la planification (seuls les contrats actifs sont planifiés)
+        scheduling.refresh_contract(cursor, contrat_id)
+        
         conn.commit()
         
         # Retourner le contrat mis à jour
         cursor.execute("SELECT * FROM Contrat_Forfait WHERE id = ?", (contrat_id,))
         updated_contrat = cursor.fetchone()
+        response.headers["ETag"] = versioning.etag(updated_contrat["version"])
         return dict(updated_contrat)
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
-        print(f"Error updating contrat forfait {contrat_id}: {str(e)}")
+        logger.error(f"Error updating contrat forfait {contrat_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour du contrat forfait: {str(e)}")
 
 @app.delete("/api/contrats-forfait/{contrat_id}")
@@ -1418,9 +1872,120 @@ async def delete_contrat_forfait(contrat_id: int, conn = Depends(get_db)):
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
-        print(f"Error deleting contrat forfait {contrat_id}: {str(e)}")
+        logger.error(f"Error deleting contrat forfait {contrat_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression du contrat forfait: {str(e)}")
 
+# Planification des passages
+@app.get("/api/passages-dus")
+async def get_passages_dus(date: Optional[str] = None, agent: Optional[str] = None, conn = Depends(get_db)):
+    """
+    Récupère les clients dont le passage est dû ou en retard pour la semaine
+    contenant la date donnée (dd/mm/yyyy, aujourd'hui par défaut), groupés par agent
+    """
+    try:
+        today = datetime.date.today()
+        if date is None:
+            day = today
+        else:
+            day = validation.parse_date(date)
+            if day is None:
+                raise HTTPException(status_code=400, detail=validation.DATE_ERROR)
+
+        debut, fin = scheduling.week_bounds(day)
+        cursor = conn.cursor()
+        agents = scheduling.get_due_passages(cursor, fin, today, agent)
+
+        return {
+            "debut_semaine": debut.strftime('%d/%m/%Y'),
+            "fin_semaine": fin.strftime('%d/%m/%Y'),
+            "agents": agents
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching passages dus: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.post("/api/passages-dus/reconstruire")
+async def rebuild_passages_dus(conn = Depends(get_db)):
+    """Reconstruit entièrement la planification des passages à partir de l'historique"""
+    try:
+        cursor = conn.cursor()
+        count = scheduling.rebuild_schedule(cursor)
+        conn.commit()
+        return {"message": f"Planification reconstruite pour {count} contrats actifs"}
+    except Exception as e:
+        logger.error(f"Error rebuilding passage schedule: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.get("/api/agents/{agent_id}/tournee")
+async def get_tournee_agent(agent_id: int, date: Optional[str] = None, conn = Depends(get_db)):
+    """
+    Calcule l'ordre de visite des clients dus (ou en retard) d'un agent pour un jour donné
+    (dd/mm/yyyy, aujourd'hui par défaut), en partant de la position GPS de l'agent et en y revenant
+    """
+    try:
+        today = datetime.date.today()
+        if date is None:
+            day = today
+        else:
+            day = validation.parse_date(date)
+            if day is None:
+                raise HTTPException(status_code=400, detail=validation.DATE_ERROR)
+
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM Agents WHERE id = ?", (agent_id,))
+        agent = cursor.fetchone()
+        if agent is None:
+            raise HTTPException(status_code=404, detail=f"Agent avec ID {agent_id} non trouvé")
+
+        start = routing.parse_gps(agent["gps"])
+        if start is None:
+            raise HTTPException(status_code=400, detail="Position GPS de l'agent invalide")
+
+        # Clients dus jusqu'à ce jour pour cet agent
+        due = scheduling.get_due_passages(cursor, day, today, agent["nom"])
+        clients = due[0]["clients"] if due else []
+
+        # Les clients sans coordonnées ne peuvent pas être placés dans la tournée
+        stops = []
+        with_gps = []
+        sans_gps = []
+        for client in clients:
+            position = routing.parse_gps(client["gps"])
+            if position is None:
+                sans_gps.append(client)
+            else:
+                stops.append(position)
+                with_gps.append(client)
+
+        order, legs, total = routing.plan_route(start, stops)
+
+        etapes = []
+        cumul = 0.0
+        for rank, (index, leg) in enumerate(zip(order, legs), start=1):
+            cumul += leg
+            etapes.append({
+                "ordre": rank,
+                **with_gps[index],
+                "distance_km": round(leg, 2),
+                "distance_cumulee_km": round(cumul, 2)
+            })
+
+        return {
+            "agent": agent["nom"],
+            "date": day.strftime('%d/%m/%Y'),
+            "depart": agent["gps"],
+            "distance_totale_km": round(total, 2),
+            "etapes": etapes,
+            "clients_sans_gps": sans_gps
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error planning route for agent {agent_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
 # Bon Passage Forfait endpoints
 @app.get("/api/bon-passage-forfait", response_model=List[BonPassageForfaitModel])
 async def get_bons_passage_forfait(conn = Depends(get_db)):
@@ -1431,7 +1996,7 @@ async def get_bons_passage_forfait(conn = Depends(get_db)):
         bons = cursor.fetchall()
         return [dict(bon) for bon in bons]
     except Exception as e:
-        print(f"Error fetching bons de passage: {str(e)}")
+        logger.error(f"Error fetching bons de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.get("/api/bon-passage-forfait/{bon_id}", response_model=BonPassageForfaitModel)
@@ -1447,7 +2012,7 @@ async def get_bon_passage_forfait(bon_id: int, conn = Depends(get_db)):
             
         return dict(bon)
     except Exception as e:
-        print(f"Error fetching bon de passage: {str(e)}")
+        logger.error(f"Error fetching bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.get("/api/clients/{client_id}/bon-passage-forfait", response_model=List[BonPassageForfaitModel])
@@ -1468,52 +2033,63 @@ async def get_bons_passage_forfait_by_client(client_id: int, conn = Depends(get_
         
         return [dict(bon) for bon in bons]
     except Exception as e:
-        print(f"Error fetching bons de passage for client: {str(e)}")
+        logger.error(f"Error fetching bons de passage for client: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
+def insert_bon_passage_forfait(cursor, bon):
+    """Check and insert a bon de passage forfait, without committing. Returns the new row."""
+    # Vérifier si le client existe
+    cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (bon.client_id,))
+    client = cursor.fetchone()
+
+    if client is None:
+        raise HTTPException(status_code=404, detail=f"Client_Forfait avec ID {bon.client_id} non trouvé")
+
+    # Trouver le contrat actif pour ce client
+    cursor.execute("""
+        SELECT * FROM Contrat_Forfait 
+        WHERE client_id = ? AND etat = 'Actif'
+    """, (bon.client_id,))
+
+    contrat_actif = cursor.fetchone()
+
+    if contrat_actif is None:
+        raise HTTPException(
+            status_code=400, 
+            detail="Aucun contrat actif trouvé pour ce client. Un contrat actif est nécessaire pour créer un bon de passage."
+        )
+
+    # Calculer l'excès de poids par rapport au poids collecté et au poids forfait du contrat
+    poids_forfait = contrat_actif["poids_forfait"]
+    exces_poids = max(0, bon.poids_collecte - poids_forfait) if poids_forfait > 0 else 0
+
+    # Insérer le nouveau bon de passage avec montant, exces_poids, poids_collecte et contrat_id
+    cursor.execute("""
+        INSERT INTO Bon_Passage_Forfait (date, client_id, montant, exces_poids, poids_collecte, contrat_id)
+        VALUES (?, ?, ?, ?, ?, ?) RETURNING *
+    """, (bon.date, bon.client_id, bon.montant, exces_poids, bon.poids_collecte, contrat_actif["id"]))
+
+    new_bon = cursor.fetchone()
+
+    # Mettre à jour la date du prochain passage du contrat
+    scheduling.refresh_contract(cursor, contrat_actif["id"])
+
+    return dict(new_bon)
+
 @app.post("/api/bon-passage-forfait", response_model=BonPassageForfaitModel)
 async def create_bon_passage_forfait(bon: BonPassageForfaitModel, conn = Depends(get_db)):
     """Créer un nouveau bon de passage forfait"""
     try:
-        cursor = conn.cursor()
-        
-        # Vérifier si le client existe
-        cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (bon.client_id,))
-        client = cursor.fetchone()
-        
-        if client is None:
-            raise HTTPException(status_code=404, detail=f"Client_Forfait avec ID {bon.client_id} non trouvé")
-        
-        # Trouver le contrat actif pour ce client
-        cursor.execute("""
-            SELECT * FROM Contrat_Forfait 
-            WHERE client_id = ? AND etat = 'Actif'
-        """, (bon.client_id,))
-        
-        contrat_actif = cursor.fetchone()
-        
-        if contrat_actif is None:
-            raise HTTPException(
-                status_code=400, 
-                detail="Aucun contrat actif trouvé pour ce client. Un contrat actif est nécessaire pour créer un bon de passage."
-            )
-        
-        # Calculer l'excès de poids par rapport au poids collecté et au poids forfait du contrat
-        poids_forfait = contrat_actif["poids_forfait"]
-        exces_poids = max(0, bon.poids_collecte - poids_forfait) if poids_forfait > 0 else 0
-        
-        # Insérer le nouveau bon de passage avec montant, exces_poids, poids_collecte et contrat_id
-        cursor.execute("""
-            INSERT INTO Bon_Passage_Forfait (date, client_id, montant, exces_poids, poids_collecte, contrat_id)
-            VALUES (?, ?, ?, ?, ?, ?) RETURNING *
-        """, (bon.date, bon.client_id, bon.montant, exces_poids, bon.poids_collecte, contrat_actif["id"]))
-        
-        new_bon = cursor.fetchone()
+        if write_queue is not None:
+            # Committed with the inserts of the other requests
+            return await write_queue.run(insert_bon_passage_forfait, bon)
+        new_bon = insert_bon_passage_forfait(conn.cursor(), bon)
         conn.commit()
-        
-        return dict(new_bon)
+        return new_bon
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error creating bon de passage: {str(e)}")
+        logger.error(f"Error creating bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/bon-passage-forfait/{bon_id}", response_model=BonPassageForfaitModel)
@@ -1555,11 +2131,14 @@ async def update_bon_passage_forfait(bon_id: int, bon: BonPassageForfaitModel, c
         """, (bon.date, bon.client_id, bon.montant, exces_poids, bon.poids_collecte, bon_id))
         
         updated_bon = cursor.fetchone()
+        
+        # La date du passage a pu changer: recalculer le prochain passage du contrat
+        scheduling.refresh_contract(cursor, existing_bon["contrat_id"])
         conn.commit()
         
         return dict(updated_bon)
     except Exception as e:
-        print(f"Error updating bon de passage: {str(e)}")
+        logger.error(f"Error updating bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/bon-passage-forfait/{bon_id}")
@@ -1577,11 +2156,14 @@ async def delete_bon_passage_forfait(bon_id: int, conn = Depends(get_db)):
         
         # Supprimer le bon de passage (les produits et services seront supprimés en cascade)
         cursor.execute("DELETE FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
+        
+        # Recalculer le prochain passage du contrat sans ce bon
+        scheduling.refresh_contract(cursor, bon["contrat_id"])
         conn.commit()
         
         return {"message": "Bon de passage forfait supprimé avec succès"}
     except Exception as e:
-        print(f"Error deleting bon de passage: {str(e)}")
+        logger.error(f"Error deleting bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Endpoints pour les produits dans un bon de passage
@@ -1603,7 +2185,7 @@ async def get_produits_bon_passage(bon_id: int, conn = Depends(get_db)):
         
         return [dict(produit) for produit in produits]
     except Exception as e:
-        print(f"Error fetching produits de bon de passage: {str(e)}")
+        logger.error(f"Error fetching produits de bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/bon-passage-forfait/{bon_id}/produits", response_model=BonPassageForfaitProduitModel)
@@ -1612,7 +2194,7 @@ async def create_produit_bon_passage(bon_id: int, produit: BonPassageForfaitProd
     try:
         cursor = conn.cursor()
         
-        print(f"Attempting to create produit for bon_id={bon_id}, produit data: {produit}")
+        log_payload(logger, "create_produit_bon_passage request", bon_id=bon_id, produit=produit)
         
         # Vérifier si le bon de passage existe
         cursor.execute("SELECT * FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
@@ -1620,7 +2202,7 @@ async def create_produit_bon_passage(bon_id: int, produit: BonPassageForfaitProd
         
         if bon is None:
             error_msg = f"Bon de passage forfait avec ID {bon_id} non trouvé"
-            print(error_msg)
+            logger.warning(error_msg)
             raise HTTPException(status_code=404, detail=error_msg)
         
         # Insérer le produit
@@ -1633,16 +2215,50 @@ async def create_produit_bon_passage(bon_id: int, produit: BonPassageForfaitProd
             new_produit = cursor.fetchone()
             conn.commit()
             
-            print(f"Produit created successfully: {new_produit}")
-            return dict(new_produit)
+            result = dict(new_produit)
+            log_payload(logger, "create_produit_bon_passage result", bon_id=bon_id, produit=result)
+            return result
         except Exception as sql_error:
-            print(f"SQL error creating produit: {str(sql_error)}")
+            logger.error(f"SQL error creating produit: {str(sql_error)}")
             raise HTTPException(
                 status_code=400, 
                 detail=f"Erreur lors de l'insertion du produit: {str(sql_error)}"
             )
     except Exception as e:
-        print(f"Error creating produit de bon de passage: {str(e)}")
+        logger.error(f"Error creating produit de bon de passage: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.post("/api/bon-passage-forfait/{bon_id}/produits/lot", response_model=List[BonPassageForfaitProduitModel])
+async def create_produits_bon_passage(bon_id: int, produits: List[dict], conn = Depends(get_db)):
+    """Ajouter plusieurs produits à un bon de passage forfait en une requête.
+
+    Tous les produits sont validés avant l'insertion: les erreurs sont renvoyées
+    ensemble (index et message), et aucun produit n'est inséré si l'un est invalide."""
+    try:
+        produits = validation.validate_batch(BonPassageForfaitProduitModel, produits)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT id FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
+        if cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail=f"Bon de passage forfait avec ID {bon_id} non trouvé")
+
+        # Une seule transaction pour tout le lot
+        result = []
+        for produit in produits:
+            cursor.execute("""
+                INSERT INTO Bon_Passage_Forfait_Produits (produit, qte, prix, bon_passage_id)
+                VALUES (?, ?, ?, ?) RETURNING *
+            """, (produit.produit, produit.qte, produit.prix, bon_id))
+            result.append(dict(cursor.fetchone()))
+        conn.commit()
+
+        log_payload(logger, "create_produits_bon_passage result", bon_id=bon_id, nombre=len(result))
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error creating produits de bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/bon-passage-forfait/{bon_id}/produits/{produit_id}", response_model=BonPassageForfaitProduitModel)
@@ -1673,7 +2289,7 @@ async def update_produit_bon_passage(bon_id: int, produit_id: int, produit: BonP
         
         return dict(updated_produit)
     except Exception as e:
-        print(f"Error updating produit de bon de passage: {str(e)}")
+        logger.error(f"Error updating produit de bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/bon-passage-forfait/{bon_id}/produits/{produit_id}")
@@ -1701,7 +2317,7 @@ async def delete_produit_bon_passage(bon_id: int, produit_id: int, conn = Depend
         
         return {"message": "Produit supprimé avec succès du bon de passage"}
     except Exception as e:
-        print(f"Error deleting produit de bon de passage: {str(e)}")
+        logger.error(f"Error deleting produit de bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Endpoints pour les services dans un bon de passage
@@ -1723,7 +2339,7 @@ async def get_services_bon_passage(bon_id: int, conn = Depends(get_db)):
         
         return [dict(service) for service in services]
     except Exception as e:
-        print(f"Error fetching services de bon de passage: {str(e)}")
+        logger.error(f"Error fetching services de bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.post("/api/bon-passage-forfait/{bon_id}/services", response_model=BonPassageForfaitServiceModel)
@@ -1732,7 +2348,7 @@ async def create_service_bon_passage(bon_id: int, service: BonPassageForfaitServ
     try:
         cursor = conn.cursor()
         
-        print(f"Attempting to create service for bon_id={bon_id}, service data: {service}")
+        log_payload(logger, "create_service_bon_passage request", bon_id=bon_id, service=service)
         
         # Vérifier si le bon de passage existe
         cursor.execute("SELECT * FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
@@ -1740,7 +2356,7 @@ async def create_service_bon_passage(bon_id: int, service: BonPassageForfaitServ
         
         if bon is None:
             error_msg = f"Bon de passage forfait avec ID {bon_id} non trouvé"
-            print(error_msg)
+            logger.warning(error_msg)
             raise HTTPException(status_code=404, detail=error_msg)
         
         # Insérer le service
@@ -1753,16 +2369,46 @@ async def create_service_bon_passage(bon_id: int, service: BonPassageForfaitServ
             new_service = cursor.fetchone()
             conn.commit()
             
-            print(f"Service created successfully: {new_service}")
-            return dict(new_service)
+            result = dict(new_service)
+            log_payload(logger, "create_service_bon_passage result", bon_id=bon_id, service=result)
+            return result
         except Exception as sql_error:
-            print(f"SQL error creating service: {str(sql_error)}")
+            logger.error(f"SQL error creating service: {str(sql_error)}")
             raise HTTPException(
                 status_code=400, 
                 detail=f"Erreur lors de l'insertion du service: {str(sql_error)}"
             )
     except Exception as e:
-        print(f"Error creating service de bon de passage: {str(e)}")
+        logger.error(f"Error creating service de bon de passage: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.post("/api/bon-passage-forfait/{bon_id}/services/lot", response_model=List[BonPassageForfaitServiceModel])
+async def create_services_bon_passage(bon_id: int, services: List[dict], conn = Depends(get_db)):
+    """Ajouter plusieurs services à un bon de passage forfait en une requête (validés ensemble comme les produits)"""
+    try:
+        services = validation.validate_batch(BonPassageForfaitServiceModel, services)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT id FROM Bon_Passage_Forfait WHERE id = ?", (bon_id,))
+        if cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail=f"Bon de passage forfait avec ID {bon_id} non trouvé")
+
+        result = []
+        for service in services:
+            cursor.execute("""
+                INSERT INTO Bon_Passage_Forfait_Services (service, qte, bon_passage_id)
+                VALUES (?, ?, ?) RETURNING *
+            """, (service.service, service.qte, bon_id))
+            result.append(dict(cursor.fetchone()))
+        conn.commit()
+
+        log_payload(logger, "create_services_bon_passage result", bon_id=bon_id, nombre=len(result))
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error creating services de bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/bon-passage-forfait/{bon_id}/services/{service_id}", response_model=BonPassageForfaitServiceModel)
@@ -1793,7 +2439,7 @@ async def update_service_bon_passage(bon_id: int, service_id: int, service: BonP
         
         return dict(updated_service)
     except Exception as e:
-        print(f"Error updating service de bon de passage: {str(e)}")
+        logger.error(f"Error updating service de bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/bon-passage-forfait/{bon_id}/services/{service_id}")
@@ -1819,7 +2465,7 @@ async def delete_service_bon_passage(bon_id: int, service_id: int, conn = Depend
         
         return {"message": "Service supprimé avec succès"}
     except Exception as e:
-        print(f"Error deleting service from bon de passage: {str(e)}")
+        logger.error(f"Error deleting service from bon de passage: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 # Endpoints pour les versements forfait
@@ -1833,7 +2479,7 @@ async def get_versements_forfait(conn = Depends(get_db)):
         
         return [dict(versement) for versement in versements]
     except Exception as e:
-        print(f"Error fetching versements forfait: {str(e)}")
+        logger.error(f"Error fetching versements forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.get("/api/versements-forfait/{versement_id}", response_model=VersementForfaitModel)
@@ -1849,7 +2495,7 @@ async def get_versement_forfait(versement_id: int, conn = Depends(get_db)):
         
         return dict(versement)
     except Exception as e:
-        print(f"Error fetching versement forfait: {str(e)}")
+        logger.error(f"Error fetching versement forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.get("/api/clients/{client_id}/versements-forfait", response_model=List[VersementForfaitModel])
@@ -1870,7 +2516,7 @@ async def get_versements_forfait_by_client(client_id: int, conn = Depends(get_db
         
         return [dict(versement) for versement in versements]
     except Exception as e:
-        print(f"Error fetching versements forfait for client: {str(e)}")
+        logger.error(f"Error fetching versements forfait for client: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.get("/api/contrats-forfait/{contrat_id}/versements", response_model=List[VersementForfaitModel])
@@ -1891,45 +2537,53 @@ async def get_versements_forfait_by_contrat(contrat_id: int, conn = Depends(get_
         
         return [dict(versement) for versement in versements]
     except Exception as e:
-        print(f"Error fetching versements forfait for contrat: {str(e)}")
+        logger.error(f"Error fetching versements forfait for contrat: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
+def insert_versement_forfait(cursor, versement):
+    """Check and insert a versement forfait, without committing. Returns the new row."""
+    # Vérifier si le client existe
+    cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (versement.client_id,))
+    client = cursor.fetchone()
+
+    if client is None:
+        raise HTTPException(status_code=404, detail=f"Client_Forfait avec ID {versement.client_id} non trouvé")
+
+    # Vérifier si le contrat existe
+    cursor.execute("SELECT * FROM Contrat_Forfait WHERE id = ?", (versement.contrat_id,))
+    contrat = cursor.fetchone()
+
+    if contrat is None:
+        raise HTTPException(status_code=404, detail=f"Contrat_Forfait avec ID {versement.contrat_id} non trouvé")
+
+    # Vérifier que le contrat appartient bien au client
+    if contrat['client_id'] != versement.client_id:
+        raise HTTPException(status_code=400, detail="Le contrat spécifié n'appartient pas au client spécifié")
+
+    # Insérer le nouveau versement
+    cursor.execute("""
+        INSERT INTO Versement_Forfait (date, montant, client_id, contrat_id)
+        VALUES (?, ?, ?, ?) RETURNING *
+    """, (versement.date, versement.montant, versement.client_id, versement.contrat_id))
+
+    new_versement = cursor.fetchone()
+
+    return dict(new_versement)
+
 @app.post("/api/versements-forfait", response_model=VersementForfaitModel)
 async def create_versement_forfait(versement: VersementForfaitModel, conn = Depends(get_db)):
     """Créer un nouveau versement forfait"""
     try:
-        cursor = conn.cursor()
-        
-        # Vérifier si le client existe
-        cursor.execute("SELECT * FROM Client_Forfait WHERE id = ?", (versement.client_id,))
-        client = cursor.fetchone()
-        
-        if client is None:
-            raise HTTPException(status_code=404, detail=f"Client_Forfait avec ID {versement.client_id} non trouvé")
-        
-        # Vérifier si le contrat existe
-        cursor.execute("SELECT * FROM Contrat_Forfait WHERE id = ?", (versement.contrat_id,))
-        contrat = cursor.fetchone()
-        
-        if contrat is None:
-            raise HTTPException(status_code=404, detail=f"Contrat_Forfait avec ID {versement.contrat_id} non trouvé")
-        
-        # Vérifier que le contrat appartient bien au client
-        if contrat['client_id'] != versement.client_id:
-            raise HTTPException(status_code=400, detail="Le contrat spécifié n'appartient pas au client spécifié")
-        
-        # Insérer le nouveau versement
-        cursor.execute("""
-            INSERT INTO Versement_Forfait (date, montant, client_id, contrat_id)
-            VALUES (?, ?, ?, ?) RETURNING *
-        """, (versement.date, versement.montant, versement.client_id, versement.contrat_id))
-        
-        new_versement = cursor.fetchone()
+        if write_queue is not None:
+            # Committed with the inserts of the other requests
+            return await write_queue.run(insert_versement_forfait, versement)
+        new_versement = insert_versement_forfait(conn.cursor(), versement)
         conn.commit()
-        
-        return dict(new_versement)
+        return new_versement
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error creating versement forfait: {str(e)}")
+        logger.error(f"Error creating versement forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.put("/api/versements-forfait/{versement_id}", response_model=VersementForfaitModel)
@@ -1975,7 +2629,7 @@ async def update_versement_forfait(versement_id: int, versement: VersementForfai
         
         return dict(updated_versement)
     except Exception as e:
-        print(f"Error updating versement forfait: {str(e)}")
+        logger.error(f"Error updating versement forfait: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
 
 @app.delete("/api/versements-forfait/{versement_id}")
@@ -1997,5 +2651,203 @@ async def delete_versement_forfait(versement_id: int, conn = Depends(get_db)):
         
         return {"message": "Versement forfait supprimé avec succès"}
     except Exception as e:
-        print(f"Error deleting versement forfait: {str(e)}")
+        logger.error(f"Error deleting versement forfait: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+# Facturation mensuelle
+@app.post("/api/facturation")
+async def start_facturation(periode: Optional[str] = None):
+    """
+    Lance la facturation d'un mois (yyyy-mm, le mois précédent par défaut).
+    Les factures sont créées en arrière-plan: GET /api/facturation donne l'avancement.
+    """
+    if periode is None:
+        periode = invoicing.previous_period()
+    try:
+        invoicing.parse_period(periode)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Période invalide. Utilisez le format yyyy-mm")
+    conn = connect_db()
+    try:
+        run = dict(invoicing.start_run(conn, periode))
+    finally:
+        conn.close()
+    if run["etat"] != "terminee":
+        # Run the job now without waiting for the response (it continues at its next runs)
+        asyncio.get_running_loop().run_in_executor(None, job_runner.run, "facturation_mensuelle", True)
+    return run
+
+@app.get("/api/facturation")
+async def get_facturations(conn = Depends(get_db)):
+    """Avancement des facturations mensuelles, la plus récente d'abord"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM Facturation ORDER BY periode DESC")
+    return [dict(row) for row in cursor.fetchall()]
+
+@app.get("/api/factures")
+async def get_factures(periode: Optional[str] = None, client_id: Optional[int] = None,
+                       limit: int = 100, offset: int = 0, conn = Depends(get_db)):
+    """Liste des factures, filtrée par période et/ou client"""
+    try:
+        conditions = []
+        parameters = []
+        if periode is not None:
+            conditions.append("periode = ?")
+            parameters.append(periode)
+        if client_id is not None:
+            conditions.append("client_id = ?")
+            parameters.append(client_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM Facture {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                       parameters + [min(limit, 1000), offset])
+        return [dict(row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Error fetching factures: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.get("/api/factures/{facture_id}")
+async def get_facture(facture_id: int, conn = Depends(get_db)):
+    """Une facture avec ses lignes"""
+    invoice = invoicing.load_invoice(conn.cursor(), facture_id)
+    if invoice is None:
+        raise HTTPException(status_code=404, detail=f"Facture avec ID {facture_id} non trouvée")
+    return invoice
+
+@app.get("/api/factures/{facture_id}/pdf")
+async def get_facture_pdf(facture_id: int, conn = Depends(get_db)):
+    """PDF d'une facture (rendu à la demande s'il n'a pas encore été écrit)"""
+    invoice = invoicing.load_invoice(conn.cursor(), facture_id)
+    if invoice is None:
+        raise HTTPException(status_code=404, detail=f"Facture avec ID {facture_id} non trouvée")
+    if invoice["pdf_path"] and os.path.exists(invoice["pdf_path"]):
+        with open(invoice["pdf_path"], "rb") as file:
+            content = file.read()
+    else:
+        content = await run_in_threadpool(invoicing.render_invoice_pdf, invoice)
+    return Response(content, media_type="application/pdf",
+                    headers={"Content-Disposition": f'inline; filename="{invoice["numero"]}.pdf"'})
+
+def _report_day(date):
+    """Date of a report (dd/mm/yyyy, aujourd'hui par défaut)."""
+    if date is None:
+        return datetime.date.today()
+    day = validation.parse_date(date)
+    if day is None:
+        raise HTTPException(status_code=400, detail=validation.DATE_ERROR)
+    return day
+
+def _report_response(content):
+    """JSON response of a report, encoded without jsonable_encoder (slow on the event loop for thousands of rows)."""
+    return Response(json.dumps(content, ensure_ascii=False, separators=(",", ":")), media_type="application/json")
+
+@app.get("/api/balance-agee")
+async def get_balance_agee(date: Optional[str] = None, agent: Optional[str] = None):
+    """
+    Balance âgée des clients forfait à une date (dd/mm/yyyy, aujourd'hui par défaut) :
+    montant dû par client et par agent, réparti en tranches de 0-30, 31-60, 61-90 et plus de 90 jours
+    """
+    try:
+        day = _report_day(date)
+        # The query reads all the charges and payments: run in the analytics pool
+        report = await analytics_pool.run(receivables.aged_balance, day, agent)
+        return _report_response({"date": day.strftime('%d/%m/%Y'), **report})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing balance agee: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.get("/api/balance-agee/csv")
+async def get_balance_agee_csv(date: Optional[str] = None, agent: Optional[str] = None):
+    """Balance âgée au format CSV (une ligne par client), envoyée au fur et à mesure"""
+    day = _report_day(date)
+    file_name = f"balance-agee-{day.isoformat()}.csv"
+    return StreamingResponse(analytics_pool.stream(receivables.aged_balance_csv, day, agent), media_type="text/csv",
+                             headers={"Content-Disposition": f'attachment; filename="{file_name}"'})
+
+def _report_month(value):
+    """Month of a report filter (yyyy-mm), None when not given."""
+    if value is None:
+        return None
+    try:
+        invoicing.parse_period(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Mois invalide. Utilisez le format yyyy-mm")
+    return value
+
+@app.get("/api/achats/fournisseurs")
+async def get_achats_fournisseurs(date: Optional[str] = None):
+    """
+    Dettes par fournisseur à une date (dd/mm/yyyy, aujourd'hui par défaut) : reste à payer des bons d'achat
+    réparti par ancienneté du bon (0-30, 31-60, 61-90, plus de 90 jours), et versements par type
+    """
+    try:
+        day = _report_day(date)
+        report = await analytics_pool.run(purchases.payables, day)
+        return _report_response({"date": day.strftime('%d/%m/%Y'), **report})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing dettes fournisseurs: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.get("/api/achats/depenses")
+async def get_achats_depenses(debut: Optional[str] = None, fin: Optional[str] = None,
+                              produit: Optional[str] = None):
+    """Dépenses d'achat par mois (yyyy-mm, de debut à fin), détaillées par produit"""
+    try:
+        debut, fin = _report_month(debut), _report_month(fin)
+        return _report_response(await analytics_pool.run(purchases.spending, debut, fin, produit))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing depenses achats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.get("/api/achats/prix")
+async def get_achats_prix(produit: str, debut: Optional[str] = None, fin: Optional[str] = None):
+    """Historique des prix d'achat d'un produit par mois : prix moyen, minimum et maximum"""
+    try:
+        debut, fin = _report_month(debut), _report_month(fin)
+        return _report_response(await analytics_pool.run(purchases.price_history, produit, debut, fin))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing historique prix: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.post("/api/export", dependencies=[Depends(require_debug_token)])
+async def run_export(complet: bool = False):
+    """
+    Exporte les tables en fichiers Parquet dans le répertoire d'export (VITAL_EXPORT_DIR) :
+    seulement les changements depuis l'export précédent, ou tout si complet=true
+    """
+    if export.pyarrow is None:
+        raise HTTPException(status_code=503, detail="Export indisponible : pyarrow n'est pas installé")
+    try:
+        return await analytics_pool.call(export.export_database, get_db_path(), export.EXPORT_DIR, complet)
+    except export.ExportBusy:
+        raise HTTPException(status_code=409, detail="Un export est déjà en cours")
+    except Exception as e:
+        logger.error(f"Error exporting database: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur de serveur: {str(e)}")
+
+@app.get("/api/export", dependencies=[Depends(require_debug_token)])
+async def get_export():
+    """Manifeste du dernier export : fichiers de chaque table et version du journal des changements"""
+    manifest = export.load_manifest(export.EXPORT_DIR)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Aucun export n'a encore été fait")
+    return manifest
+
+@app.get("/api/export/{table}/{file_name}", dependencies=[Depends(require_debug_token)])
+async def get_export_file(table: str, file_name: str):
+    """Télécharge un fichier Parquet de l'export"""
+    manifest = export.load_manifest(export.EXPORT_DIR) or {"tables": {}}
+    state = manifest["tables"].get(table)
+    # Only the files of the manifest: the names never come from the request as they are
+    if state is None or file_name not in [state["base"]] + state["deltas"]:
+        raise HTTPException(status_code=404, detail=f"Fichier {table}/{file_name} non trouvé")
+    return FileResponse(os.path.join(export.EXPORT_DIR, table, file_name), media_type="application/vnd.apache.parquet",
+                        filename=f"{table}-{file_name}")
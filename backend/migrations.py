@@ -0,0 +1,177 @@
+"""Versioned schema migrations.
+
+Migrations are Python files in database/migrations named NNNN_description.py.
+Each one defines:
+
+- up(cursor): the schema change, run with cursor.execute() only (executescript
+  would commit the transaction);
+- optionally backfill(cursor, last_id, batch_size): fills existing rows after
+  the change, one batch of ids greater than last_id at a time. It returns the
+  last id processed, or None when there is nothing left.
+
+At startup, migrate() applies the pending migrations in order, all in one
+transaction, and records them in the schema_version table with the checksum
+of their file. A migration file changed after being applied stops the
+startup. The backfills then run in short transactions (run_backfills), so a
+migration of a large table never holds the write lock for long: at startup
+for up to STARTUP_BACKFILL_SECONDS, which completes those of small tables
+before the first request, then in the background (job "migrations_en_ligne").
+When the jobs are disabled, startup runs them to the end.
+"""
+
+import datetime
+import hashlib
+import importlib.util
+import os
+import re
+import time
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "database", "migrations")
+
+# Rows per backfill transaction, and time spent backfilling per run
+BACKFILL_BATCH_SIZE = 1000
+BACKFILL_SECONDS_PER_RUN = 5
+# Time spent backfilling at startup, before the first request
+STARTUP_BACKFILL_SECONDS = float(os.getenv("VITAL_STARTUP_BACKFILL_SECONDS", "10"))
+
+_file_pattern = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+
+class MigrationError(Exception):
+    """The database schema can't be brought up to date."""
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, "rb") as file:
+            self.checksum = hashlib.sha256(file.read()).hexdigest()
+        self._module = None
+
+    @property
+    def module(self):
+        if self._module is None:
+            spec = importlib.util.spec_from_file_location(f"migration_{self.version:04d}", self.path)
+            self._module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self._module)
+        return self._module
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Return the migrations of a directory, ordered by version."""
+    migrations = []
+    for file_name in os.listdir(directory):
+        match = _file_pattern.match(file_name)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, file_name)))
+    migrations.sort(key=lambda migration: migration.version)
+
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise MigrationError("Deux migrations ont le même numéro de version")
+    return migrations
+
+
+def _ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TEXT NOT NULL,
+            backfill_done INTEGER NOT NULL DEFAULT 1,
+            backfill_position INTEGER
+        )
+    """)
+
+
+def add_column(cursor, table, column, declaration):
+    """Add a column to a table if it is missing (for migrations of databases that may already have it)."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def migrate(conn, directory=MIGRATIONS_DIR, target=None):
+    """Apply the pending migrations (up to version `target` when given) in one transaction.
+    Returns the versions applied."""
+    migrations = load_migrations(directory)
+    cursor = conn.cursor()
+    # BEGIN IMMEDIATE: two workers starting at once apply the migrations only once
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        _ensure_version_table(cursor)
+        cursor.execute("SELECT version, checksum FROM schema_version")
+        applied = {row[0]: row[1] for row in cursor.fetchall()}
+
+        for migration in migrations:
+            if migration.version in applied and applied[migration.version] != migration.checksum:
+                raise MigrationError(f"La migration {migration.version:04d}_{migration.name} "
+                                     "a été modifiée après avoir été appliquée")
+
+        done = []
+        for migration in migrations:
+            if migration.version in applied or (target is not None and migration.version > target):
+                continue
+            migration.module.up(cursor)
+            has_backfill = hasattr(migration.module, "backfill")
+            cursor.execute("""
+                INSERT INTO schema_version (version, name, checksum, applied_at, backfill_done)
+                VALUES (?, ?, ?, ?, ?)
+            """, (migration.version, migration.name, migration.checksum,
+                  datetime.datetime.now().isoformat(timespec="seconds"), 0 if has_backfill else 1))
+            done.append(migration.version)
+        conn.commit()
+        return done
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def run_backfills(conn, directory=MIGRATIONS_DIR, seconds=BACKFILL_SECONDS_PER_RUN):
+    """Run the pending backfills for up to `seconds`, or to the end when None (job "migrations_en_ligne").
+
+    Progress is saved with every batch, so the work resumes where it stopped."""
+    migrations = {migration.version: migration for migration in load_migrations(directory)}
+    cursor = conn.cursor()
+    cursor.execute("SELECT version, backfill_position FROM schema_version WHERE backfill_done = 0 ORDER BY version")
+    pending = cursor.fetchall()
+
+    deadline = None if seconds is None else time.monotonic() + seconds
+    rows = 0
+    finished = []
+    for version, _ in pending:
+        migration = migrations[version]
+        while deadline is None or time.monotonic() < deadline:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # Read again under the lock: another worker may have run batches since
+                cursor.execute("SELECT backfill_done, backfill_position FROM schema_version WHERE version = ?",
+                               (version,))
+                done, position = cursor.fetchone()
+                if done:
+                    conn.rollback()
+                    break
+                new_position = migration.module.backfill(cursor, position or 0, BACKFILL_BATCH_SIZE)
+                if new_position is None:
+                    cursor.execute("UPDATE schema_version SET backfill_done = 1 WHERE version = ?", (version,))
+                else:
+                    cursor.execute("UPDATE schema_version SET backfill_position = ? WHERE version = ?",
+                                   (new_position, version))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            if new_position is None:
+                finished.append(version)
+                break
+            rows += 1
+    return {"lots": rows, "terminees": finished}
+
+
+def get_status(cursor):
+    """Applied migrations with the state of their backfill."""
+    cursor.execute("SELECT * FROM schema_version ORDER BY version")
+    return [dict(row) for row in cursor.fetchall()]
@@ -1,8 +1,8 @@
 from pydantic import BaseModel, validator, Field
-from datetime import date, datetime
+from datetime import date
 from typing import Optional
 from fastapi import HTTPException
-import re
+import validation
 
 
 class Client(BaseModel):
@@ -25,7 +25,7 @@ class Client(BaseModel):
 
     @validator('tel')
     def validate_phone(cls, v):
-        if not re.match(r'^0\d{9}$', v):
+        if not validation.PHONE_PATTERN.match(v):
             raise HTTPException(status_code=400, detail="Le numéro de téléphone doit commencer par 0 et contenir 10 chiffres")
         return v
 
@@ -47,20 +47,14 @@ class Agent(BaseModel):
 
     @validator('telephone', 'whatsapp')
     def validate_phone(cls, v):
-        if not re.match(r'^0\d{9}$', v):
+        if not validation.PHONE_PATTERN.match(v):
             raise HTTPException(status_code=400, detail="Le numéro de téléphone doit commencer par 0 et contenir 10 chiffres")
         return v
 
     @validator('gps')
     def validate_gps(cls, v):
         # Format attendu: "latitude,longitude" avec 5 décimales chacun
-        gps_pattern = r'^(-?\d+\.\d{5}),\s*(-?\d+\.\d{5})$'
-        if not re.match(gps_pattern, v):
-            raise HTTPException(
-                status_code=400, 
-                detail="Format GPS invalide. Utilisez le format latitude,longitude avec 5 décimales (ex: 36.75234, 3.04215)"
-            )
-        return v
+        return validation.check_gps(v)
 
     @validator('regime')
     def validate_regime(cls, v):
@@ -127,6 +121,8 @@ class Fournisseur(BaseModel):
 class BonAchats(BaseModel):
     """Bon d'achats model"""
     id: Optional[int] = None
+    # Version of the row read by the client: the update is refused when it changed since (see versioning.py)
+    version: Optional[int] = None
     date: str
     fournisseur: str
     montant_total: float = 0
@@ -134,14 +130,7 @@ class BonAchats(BaseModel):
 
     @validator('date')
     def validate_date(cls, v):
-        try:
-            datetime.strptime(v, '%d/%m/%Y')
-        except ValueError:
-            raise HTTPException(
-                status_code=400,
-                detail="Format de date invalide. Utilisez le format dd/mm/yyyy"
-            )
-        return v
+        return validation.check_date(v)
 
 # Produit_Bon_Achat model
 class ProduitBonAchat(BaseModel):
@@ -221,6 +210,8 @@ class VersementBonAchat(BaseModel):
 class ClientModel(BaseModel):
     """Client_Forfait model"""
     id: Optional[int] = None
+    # Version of the row read by the client: the update is refused when it changed since (see versioning.py)
+    version: Optional[int] = None
     nom: str
     specialite: Optional[str] = None
     tel: str
@@ -229,10 +220,11 @@ class ClientModel(BaseModel):
     etat_contrat: Optional[str] = None
     debut_contrat: Optional[str] = None
     fin_contrat: Optional[str] = None
+    gps: Optional[str] = None
     
     @validator('tel')
     def validate_tel(cls, v):
-        if not re.match(r'^0\d{8,9}$', v):
+        if not validation.CLIENT_PHONE_PATTERN.match(v):
             raise HTTPException(status_code=400, detail="Le numéro de téléphone doit commencer par 0 et contenir 9 ou 10 chiffres")
         return v
     
@@ -257,16 +249,21 @@ class ClientModel(BaseModel):
         if v is None:
             return None
         # Validate date format dd/mm/yyyy
-        try:
-            datetime.strptime(v, '%d/%m/%Y')
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Format de date invalide. Utilisez le format dd/mm/yyyy")
-        return v
+        return validation.check_date(v)
+
+    @validator('gps')
+    def validate_gps(cls, v):
+        if v is None or v == "":
+            return None
+        # Same format as the agents: "latitude,longitude" with 5 decimals each
+        return validation.check_gps(v)
 
 # Contrat_Forfait model
 class ContratForfaitModel(BaseModel):
     """Modèle pour contrat forfait"""
     id: Optional[int] = None
+    # Version of the row read by the client: the update is refused when it changed since (see versioning.py)
+    version: Optional[int] = None
     date_debut: str
     date_fin: str
     montant: int
@@ -277,29 +274,19 @@ class ContratForfaitModel(BaseModel):
     
     @validator('date_debut', 'date_fin')
     def validate_date_format(cls, v):
-        try:
-            datetime.strptime(v, '%d/%m/%Y')
-        except ValueError:
-            raise HTTPException(
-                status_code=400,
-                detail="Format de date invalide. Utilisez le format dd/mm/yyyy"
-            )
-        return v
+        return validation.check_date(v)
     
     @validator('date_fin')
     def validate_date_fin_greater(cls, v, values):
         if 'date_debut' in values:
-            try:
-                debut = datetime.strptime(values['date_debut'], '%d/%m/%Y')
-                fin = datetime.strptime(v, '%d/%m/%Y')
-                if fin <= debut:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="La date de fin doit être postérieure à la date de début"
-                    )
-            except ValueError:
-                # Already handled by validate_date_format
-                pass
+            # Both dates were just parsed by validate_date_format: read from the cache
+            debut = validation.parse_date(values['date_debut'])
+            fin = validation.parse_date(v)
+            if fin <= debut:
+                raise HTTPException(
+                    status_code=400,
+                    detail="La date de fin doit être postérieure à la date de début"
+                )
         return v
     
     @validator('montant')
@@ -365,14 +352,7 @@ class BonPassageForfaitModel(BaseModel):
     
     @validator('date')
     def validate_date_format(cls, v):
-        try:
-            datetime.strptime(v, '%d/%m/%Y')
-        except ValueError:
-            raise HTTPException(
-                status_code=400,
-                detail="Format de date invalide. Utilisez le format dd/mm/yyyy"
-            )
-        return v
+        return validation.check_date(v)
     
     @validator('montant')
     def validate_montant(cls, v):
@@ -483,14 +463,7 @@ class VersementForfaitModel(BaseModel):
     
     @validator('date')
     def validate_date_format(cls, v):
-        try:
-            datetime.strptime(v, '%d/%m/%Y')
-        except ValueError:
-            raise HTTPException(
-                status_code=400,
-                detail="Format de date invalide. Utilisez le format dd/mm/yyyy"
-            )
-        return v
+        return validation.check_date(v)
     
     @validator('montant')
     def validate_montant(cls, v):
@@ -0,0 +1,315 @@
+"""Durable outbox of the WhatsApp notifications sent to the agents.
+
+Notifications are first written to the Notification_Outbox table, then sent
+by the "envoi_notifications" background job through a transport:
+
+- "stub" (default) only logs the messages and keeps them in memory, for
+  development and tests;
+- "whatsapp" sends them with the WhatsApp Cloud API.
+
+The job sends a limited batch per run, respects a rate limit, and retries the
+failed messages with an exponential backoff before giving up. The rate limit
+never makes the job wait (it runs in the thread of all the jobs): a run sends
+the messages the limit allows at that moment, the others stay in the outbox
+for the next run.
+
+Request handlers call enqueue(), which only puts the notification in an
+in-memory queue: a writer thread inserts the queued notifications in the
+outbox, so a handler never waits for the database or the transport.
+"""
+
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import scheduling
+from app_logging import get_logger
+
+# Transport used to send the messages: "stub" or "whatsapp"
+TRANSPORT = os.getenv("VITAL_NOTIFY_TRANSPORT", "stub")
+
+# Messages sent per second at most, and messages sent per job run
+RATE_PER_SECOND = float(os.getenv("VITAL_NOTIFY_RATE", "5"))
+BATCH_SIZE = 100
+
+# Seconds between the runs of the job "envoi_notifications"
+SEND_INTERVAL = int(os.getenv("VITAL_NOTIFY_INTERVAL", "15"))
+
+# A message is abandoned after this number of failed attempts
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30
+
+# Sent and failed notifications are deleted after this number of days (job "purge_notifications")
+RETENTION_DAYS = float(os.getenv("VITAL_NOTIFY_RETENTION_DAYS", "30"))
+
+# Daily reminders are built from this hour on
+REMINDER_HOUR = int(os.getenv("VITAL_REMINDER_HOUR", "7"))
+
+# Maximum number of notifications waiting for the writer thread
+QUEUE_SIZE = 1000
+
+logger = get_logger("notifications")
+
+
+def insert_notifications(cursor, notifications):
+    """Insert notifications (agent_id, recipient, kind, dedup_key, message) in the outbox.
+
+    A notification whose dedup_key is already in the outbox is ignored.
+    Returns the number of inserted rows."""
+    now = time.time()
+    before = cursor.connection.total_changes
+    cursor.executemany("""
+        INSERT OR IGNORE INTO Notification_Outbox (agent_id, recipient, kind, dedup_key, message, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(*notification, now, now) for notification in notifications])
+    return cursor.connection.total_changes - before
+
+
+# Transports
+
+class TransportError(Exception):
+    """A message could not be sent. `retryable` is False when retrying is useless."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class StubTransport:
+    """Transport that only logs the messages and keeps the last ones in memory."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, recipient, message):
+        self.sent.append({"recipient": recipient, "message": message})
+        del self.sent[:-100]
+        logger.info("notification_stub", extra={"fields": {"recipient": recipient, "length": len(message)}})
+
+
+class WhatsAppTransport:
+    """Transport sending text messages with the WhatsApp Cloud API."""
+
+    def __init__(self):
+        self.token = os.getenv("VITAL_WHATSAPP_TOKEN")
+        self.phone_number_id = os.getenv("VITAL_WHATSAPP_PHONE_ID")
+        self.url = f"https://graph.facebook.com/v19.0/{self.phone_number_id}/messages"
+
+    def send(self, recipient, message):
+        if not self.token or not self.phone_number_id:
+            raise TransportError("VITAL_WHATSAPP_TOKEN et VITAL_WHATSAPP_PHONE_ID sont requis", retryable=False)
+        # Local numbers (0XXXXXXXXX) are sent in international format
+        number = "213" + recipient[1:] if recipient.startswith("0") else recipient
+        body = json.dumps({"messaging_product": "whatsapp", "to": number,
+                           "type": "text", "text": {"body": message}}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, method="POST", headers={
+            "Authorization": f"Bearer {self.token}", "Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            # Client errors (bad number, bad token) will fail again; rate limits and server errors may not
+            raise TransportError(f"HTTP {e.code}", retryable=e.code == 429 or e.code >= 500)
+        except (urllib.error.URLError, OSError) as e:
+            raise TransportError(str(e))
+
+
+def create_transport(name):
+    if name == "whatsapp":
+        return WhatsAppTransport()
+    return StubTransport()
+
+
+transport = create_transport(TRANSPORT)
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` operations per second (with bursts of `burst`)."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def available(self):
+        """Number of operations allowed now."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return int(self.tokens)
+
+    def consume(self, count):
+        self.tokens -= count
+
+
+# A run may send what the rate allows between two runs
+_rate_limiter = RateLimiter(RATE_PER_SECOND, burst=max(1, RATE_PER_SECOND * SEND_INTERVAL))
+
+
+# Background jobs
+
+def send_pending(conn):
+    """Send a batch of due notifications (job "envoi_notifications").
+
+    At most the messages the rate limit allows now: the others wait for the next run."""
+    allowed = min(BATCH_SIZE, _rate_limiter.available())
+    if allowed == 0:
+        return {"envoyes": 0, "a_reessayer": 0, "echecs": 0}
+    cursor = conn.cursor()
+    now = time.time()
+    cursor.execute("""
+        SELECT id, recipient, message, attempts FROM Notification_Outbox
+        WHERE status = 'pending' AND next_attempt_at <= ?
+        ORDER BY next_attempt_at LIMIT ?
+    """, (now, allowed))
+    rows = cursor.fetchall()
+    _rate_limiter.consume(len(rows))
+
+    sent = []
+    retries = []
+    failed = []
+    for row in rows:
+        try:
+            transport.send(row["recipient"], row["message"])
+            sent.append((time.time(), row["id"]))
+        except TransportError as e:
+            attempts = row["attempts"] + 1
+            if e.retryable and attempts < MAX_ATTEMPTS:
+                # Exponential backoff: 30 s, 60 s, 120 s...
+                retries.append((attempts, time.time() + RETRY_BASE_SECONDS * 2 ** (attempts - 1), str(e), row["id"]))
+            else:
+                failed.append((attempts, str(e), row["id"]))
+
+    # One statement per outcome for the whole batch
+    cursor.executemany("UPDATE Notification_Outbox SET status = 'sent', sent_at = ?, "
+                       "attempts = attempts + 1 WHERE id = ?", sent)
+    cursor.executemany("UPDATE Notification_Outbox SET attempts = ?, next_attempt_at = ?, last_error = ? "
+                       "WHERE id = ?", retries)
+    cursor.executemany("UPDATE Notification_Outbox SET status = 'failed', attempts = ?, last_error = ? "
+                       "WHERE id = ?", failed)
+    conn.commit()
+    return {"envoyes": len(sent), "a_reessayer": len(retries), "echecs": len(failed)}
+
+
+def purge_old_notifications(conn):
+    """Delete the sent and failed notifications older than RETENTION_DAYS (job "purge_notifications")."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM Notification_Outbox WHERE status IN ('sent', 'failed') AND created_at < ?",
+                   (time.time() - RETENTION_DAYS * 86400,))
+    deleted = cursor.rowcount
+    conn.commit()
+    return {"supprimees": deleted}
+
+
+def build_daily_reminders(conn, today=None, force=False):
+    """Queue one reminder per agent listing the clients due today (job "rappels_passages").
+
+    Only agents with notification 'Actif' are reminded. The dedup key (agent and
+    date) makes sure each agent gets at most one reminder per day."""
+    now = datetime.datetime.now()
+    if today is None:
+        today = now.date()
+        if now.hour < REMINDER_HOUR and not force:
+            return {"rappels": 0}
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, nom, whatsapp FROM Agents WHERE notification = 'Actif'")
+    agents = {row["nom"]: row for row in cursor.fetchall()}
+
+    notifications = []
+    for due in scheduling.get_due_passages(cursor, today, today):
+        agent = agents.get(due["agent"])
+        if agent is None:
+            continue
+        lines = [f"Bonjour {agent['nom']}, vous avez {due['nombre']} passage(s) à effectuer le "
+                 f"{today.strftime('%d/%m/%Y')} :"]
+        for client in due["clients"]:
+            retard = " (en retard)" if client["en_retard"] else ""
+            lines.append(f"- {client['nom']} ({client['tel']}){retard}")
+        notifications.append((agent["id"], agent["whatsapp"], "rappel_passages",
+                              f"rappel_passages:{agent['id']}:{today.isoformat()}", "\n".join(lines)))
+
+    inserted = insert_notifications(cursor, notifications)
+    conn.commit()
+    return {"rappels": inserted}
+
+
+def get_outbox_stats(cursor):
+    """Number of notifications per status, and the most recent failures."""
+    cursor.execute("SELECT status, COUNT(*) AS nombre FROM Notification_Outbox GROUP BY status")
+    counts = {row["status"]: row["nombre"] for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT id, recipient, kind, attempts, last_error, created_at FROM Notification_Outbox
+        WHERE status = 'failed' ORDER BY id DESC LIMIT 20
+    """)
+    return {"transport": TRANSPORT, "par_statut": counts, "derniers_echecs": [dict(row) for row in cursor.fetchall()]}
+
+
+# Non-blocking enqueue for the request handlers
+
+class OutboxWriter:
+    """Background thread inserting the notifications queued by the request handlers."""
+
+    def __init__(self, connect):
+        self.connect = connect
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.dropped = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="outbox-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def enqueue(self, notification):
+        """Queue a notification without waiting. It is dropped (and logged) if the queue is full."""
+        try:
+            self.queue.put_nowait(notification)
+        except queue.Full:
+            self.dropped += 1
+            logger.error(f"Notification queue full, notification dropped: {notification[3]}")
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            # Take everything already queued, to insert it in one transaction
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [notification for notification in batch if notification is not None]
+            if not batch:
+                continue
+            try:
+                conn = self.connect()
+                try:
+                    insert_notifications(conn.cursor(), batch)
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} notifications to the outbox: {str(e)}")
+
+
+def agent_notification(cursor, agent_name, kind, dedup_key, message):
+    """Build the notification of an agent, or None if the agent has notifications paused."""
+    cursor.execute("SELECT id, whatsapp FROM Agents WHERE nom = ? AND notification = 'Actif'", (agent_name,))
+    agent = cursor.fetchone()
+    if agent is None:
+        return None
+    return (agent["id"], agent["whatsapp"], kind, dedup_key, message)
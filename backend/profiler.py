@@ -0,0 +1,143 @@
+"""Low-overhead sampling profiler producing flamegraph-compatible collapsed stacks.
+
+A background thread reads the current stack of every thread (sys._current_frames)
+at a fixed interval and counts identical stacks. The result uses the "collapsed"
+format understood by flamegraph.pl, speedscope and inferno:
+
+    MainThread;run (server.py:60);handle (main.py:120) 42
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+import uuid
+
+# The profiler endpoints are disabled unless VITAL_PROFILER=1
+PROFILER_ENABLED = os.getenv("VITAL_PROFILER", "0") == "1"
+
+# Limits of the on-demand profile
+MAX_PROFILE_SECONDS = 60
+MIN_INTERVAL_MS = 1
+
+# Number of per-request profiles kept in memory
+MAX_REQUEST_PROFILES = 20
+
+# Only one on-demand profile can run at a time
+_profile_lock = threading.Lock()
+
+# Recent per-request profiles, oldest first
+_request_profiles = collections.OrderedDict()
+_request_profiles_lock = threading.Lock()
+
+
+def _frame_label(frame):
+    """Label of one stack frame: function name, file and first line of the function."""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Sample the stacks of the process threads in a background thread."""
+
+    def __init__(self, interval_ms=10, thread_ids=None):
+        self.interval = max(MIN_INTERVAL_MS, interval_ms) / 1000
+        # Only sample these threads (None = every thread)
+        self.thread_ids = thread_ids
+        self.counts = collections.Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if self.thread_ids is not None and thread_id not in self.thread_ids:
+                    continue
+
+                # Walk the stack from the innermost frame to the outermost one
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(thread_names.get(thread_id, str(thread_id)))
+                labels.reverse()
+
+                self.counts[";".join(labels)] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Return the samples in collapsed-stack format (one 'stack count' per line)."""
+        lines = [f"{stack} {count}" for stack, count in self.counts.most_common()]
+        return "\n".join(lines) + "\n"
+
+
+def profile_process(seconds, interval_ms):
+    """Sample every thread of the process for `seconds` seconds (blocking).
+
+    Returns the collapsed stacks, or None if another profile is already running."""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        sampler = StackSampler(interval_ms)
+        sampler.start()
+        time.sleep(seconds)
+        sampler.stop()
+        return sampler.collapsed()
+    finally:
+        _profile_lock.release()
+
+
+def start_request_profile(interval_ms=1):
+    """Start sampling the calling thread (the event loop thread for async handlers)."""
+    sampler = StackSampler(interval_ms, thread_ids={threading.get_ident()})
+    sampler.start()
+    return sampler
+
+
+def finish_request_profile(sampler, method, path, duration_ms):
+    """Stop a per-request sampler, store its result and return the profile ID."""
+    sampler.stop()
+    profile_id = uuid.uuid4().hex[:12]
+    with _request_profiles_lock:
+        _request_profiles[profile_id] = {
+            "id": profile_id,
+            "method": method,
+            "path": path,
+            "duration_ms": round(duration_ms, 3),
+            "samples": sampler.samples,
+            "collapsed": sampler.collapsed()
+        }
+        # Forget the oldest profiles
+        while len(_request_profiles) > MAX_REQUEST_PROFILES:
+            _request_profiles.popitem(last=False)
+    return profile_id
+
+
+def get_request_profile(profile_id):
+    """Return a stored per-request profile, or None."""
+    with _request_profiles_lock:
+        return _request_profiles.get(profile_id)
+
+
+def list_request_profiles():
+    """Return the stored per-request profiles without their stacks, newest first."""
+    with _request_profiles_lock:
+        profiles = [{key: value for key, value in profile.items() if key != "collapsed"}
+                    for profile in _request_profiles.values()]
+    profiles.reverse()
+    return profiles
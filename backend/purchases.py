@@ -0,0 +1,188 @@
+"""Purchase analytics over the bons d'achat (/api/achats/...).
+
+- Payables: what is left to pay per fournisseur (montant_total - montant_verse
+  of the bons), split by age of the bon, with the Chèque / Espèce split of
+  the payments made.
+- Spend per product and month, and the price history of a product.
+
+The spend and the payments are read from rollups per month (migration
+0010_achats_mensuels): Achat_Mensuel for the lines of the bons per product,
+Achat_Versement_Mensuel for the payments per fournisseur and type. Triggers
+record the months whose bons, lines or payments changed, and
+refresh_monthly_purchases() (job "cumuls_achats") computes these months
+again, so the rollups never need a full rebuild. The reports only read: the
+months changed since the last refresh are computed from the bons in their
+query, the other months come from the rollups. The payments of a report up
+to a date are those of the previous months plus those of the bons of its month.
+
+Some lines have no price: they count in the quantities, not in the amounts
+(qte_prix is the quantity the amounts cover).
+"""
+
+import datetime
+import time
+
+from scheduling import iso_date_sql
+
+# Age ranges of the payables, in days (the last one is open)
+TRANCHES = ["0-30", "31-60", "61-90", "90+"]
+
+
+def month_sql(column):
+    """SQL expression converting a dd/mm/yyyy text column to its month, yyyy-mm."""
+    return f"(substr({column}, 7, 4) || '-' || substr({column}, 4, 2))"
+
+
+def monthly_purchases_sql():
+    """Query of the rows of Achat_Mensuel, up to date without a refresh: the rollup of the
+    months not changed, and the months changed since the last refresh computed from the bons."""
+    return f"""
+        SELECT mois, produit, qte, qte_prix, montant, lignes, prix_min, prix_max FROM Achat_Mensuel
+        WHERE mois NOT IN (SELECT mois FROM Achat_Mois_Modifie)
+        UNION ALL
+        SELECT {month_sql('b.date')}, p.produit, SUM(p.qte), SUM(CASE WHEN p.prix IS NULL THEN 0 ELSE p.qte END),
+               COALESCE(SUM(p.qte * p.prix), 0), COUNT(*), MIN(p.prix), MAX(p.prix)
+        FROM Bon_Achats b JOIN Produits_Bon_Achat p ON p.bon_achat_id = b.id
+        WHERE {month_sql('b.date')} IN (SELECT mois FROM Achat_Mois_Modifie)
+        GROUP BY 1, p.produit
+    """
+
+
+def refresh_monthly_purchases(conn):
+    """Compute again the months of the rollups whose bons, lines or payments changed (job "cumuls_achats")."""
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    # Write lock first: no line can change between the computation and the removal of the month
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("SELECT mois FROM Achat_Mois_Modifie")
+        months = [row[0] for row in cursor.fetchall()]
+        for month in months:
+            cursor.execute("DELETE FROM Achat_Mensuel WHERE mois = ?", (month,))
+            cursor.execute(f"""
+                INSERT INTO Achat_Mensuel (mois, produit, qte, qte_prix, montant, lignes, prix_min, prix_max)
+                SELECT ?, p.produit, SUM(p.qte), SUM(CASE WHEN p.prix IS NULL THEN 0 ELSE p.qte END),
+                       COALESCE(SUM(p.qte * p.prix), 0), COUNT(*), MIN(p.prix), MAX(p.prix)
+                FROM Bon_Achats b JOIN Produits_Bon_Achat p ON p.bon_achat_id = b.id
+                WHERE {month_sql('b.date')} = ?
+                GROUP BY p.produit
+            """, (month, month))
+            cursor.execute("DELETE FROM Achat_Versement_Mensuel WHERE mois = ?", (month,))
+            cursor.execute(f"""
+                INSERT INTO Achat_Versement_Mensuel (mois, fournisseur, type, montant)
+                SELECT ?, b.fournisseur, v.type, SUM(v.montant)
+                FROM Bon_Achats b JOIN Versement_Bon_Achat v ON v.bon_achat_id = b.id
+                WHERE {month_sql('b.date')} = ?
+                GROUP BY b.fournisseur, v.type
+            """, (month, month))
+            cursor.execute("DELETE FROM Achat_Mois_Modifie WHERE mois = ?", (month,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"mois": len(months), "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def payables(cursor, day):
+    """Amounts left to pay per fournisseur for the bons dated up to `day`, the largest first."""
+    bon_day = iso_date_sql("date")
+    parameters = {"jour": day.isoformat()}
+    for days in (30, 60, 90):
+        parameters[f"depuis_{days}"] = (day - datetime.timedelta(days=days)).isoformat()
+    cursor.execute(f"""
+        SELECT fournisseur, COUNT(*) AS bons, SUM(reste > 0) AS bons_impayes,
+               SUM(montant_total) AS montant_total, SUM(montant_verse) AS montant_verse,
+               SUM(MAX(reste, 0)) AS reste,
+               SUM(CASE WHEN reste > 0 AND jour > :depuis_30 THEN reste ELSE 0 END) AS j0_30,
+               SUM(CASE WHEN reste > 0 AND jour <= :depuis_30 AND jour > :depuis_60 THEN reste ELSE 0 END) AS j31_60,
+               SUM(CASE WHEN reste > 0 AND jour <= :depuis_60 AND jour > :depuis_90 THEN reste ELSE 0 END) AS j61_90,
+               SUM(CASE WHEN reste > 0 AND jour <= :depuis_90 THEN reste ELSE 0 END) AS j90_plus
+        FROM (
+            SELECT fournisseur, montant_total, montant_verse, montant_total - montant_verse AS reste, {bon_day} AS jour
+            FROM Bon_Achats WHERE {bon_day} <= :jour
+        )
+        GROUP BY fournisseur
+        ORDER BY reste DESC
+    """, parameters)
+    suppliers = {row["fournisseur"]: {key: _round(row[key]) for key in row.keys()} for row in cursor.fetchall()}
+
+    # Payments of these bons per type (the payments have no date of their own):
+    # the rollup of the previous months (their bons for the months changed since
+    # the last refresh), and the bons of the month of `day` up to it
+    parameters["mois"] = day.strftime("%Y-%m")
+    cursor.execute(f"""
+        SELECT fournisseur, type, SUM(montant) FROM (
+            SELECT fournisseur, type, montant FROM Achat_Versement_Mensuel
+            WHERE mois < :mois AND mois NOT IN (SELECT mois FROM Achat_Mois_Modifie)
+            UNION ALL
+            SELECT b.fournisseur, v.type, v.montant
+            FROM Bon_Achats b JOIN Versement_Bon_Achat v ON v.bon_achat_id = b.id
+            WHERE {month_sql('b.date')} IN (SELECT mois FROM Achat_Mois_Modifie WHERE mois < :mois)
+            UNION ALL
+            SELECT b.fournisseur, v.type, v.montant
+            FROM Bon_Achats b JOIN Versement_Bon_Achat v ON v.bon_achat_id = b.id
+            WHERE {month_sql('b.date')} = :mois AND {iso_date_sql('b.date')} <= :jour
+        )
+        GROUP BY fournisseur, type
+    """, parameters)
+    for supplier in suppliers.values():
+        supplier["versements"] = {"Chèque": 0, "Espèce": 0}
+    for fournisseur, payment_type, amount in cursor.fetchall():
+        suppliers[fournisseur]["versements"][payment_type] = _round(amount)
+
+    amounts = ["montant_total", "montant_verse", "reste", "j0_30", "j31_60", "j61_90", "j90_plus"]
+    totals = {name: _round(sum(supplier[name] for supplier in suppliers.values())) for name in amounts}
+    return {"tranches": TRANCHES, "total": totals, "fournisseurs": list(suppliers.values())}
+
+
+def spending(cursor, debut=None, fin=None, produit=None):
+    """Spend per month ("yyyy-mm", between `debut` and `fin` when given), with the detail per product."""
+    conditions, parameters = _month_filter(debut, fin)
+    if produit is not None:
+        conditions.append("produit = ?")
+        parameters.append(produit)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cursor.execute(f"""
+        SELECT mois, produit, qte, montant FROM ({monthly_purchases_sql()}) {where}
+        ORDER BY mois, montant DESC
+    """, parameters)
+    months = []
+    for row in cursor.fetchall():
+        if not months or months[-1]["mois"] != row["mois"]:
+            months.append({"mois": row["mois"], "montant": 0, "produits": []})
+        months[-1]["montant"] = _round(months[-1]["montant"] + row["montant"])
+        months[-1]["produits"].append({"produit": row["produit"], "qte": row["qte"], "montant": _round(row["montant"])})
+    return months
+
+
+def price_history(cursor, produit, debut=None, fin=None):
+    """Prices paid for a product per month: average (weighted by quantity), lowest and highest."""
+    conditions, parameters = _month_filter(debut, fin)
+    conditions.append("produit = ?")
+    parameters.append(produit)
+    cursor.execute(f"""
+        SELECT mois, qte, lignes, prix_min, prix_max,
+               CASE WHEN qte_prix > 0 THEN montant / qte_prix END AS prix_moyen
+        FROM ({monthly_purchases_sql()}) WHERE {' AND '.join(conditions)}
+        ORDER BY mois
+    """, parameters)
+    months = [{key: _round(row[key]) for key in row.keys()} for row in cursor.fetchall()]
+    cursor.execute("SELECT prix_dernier FROM Inventaire WHERE produit = ?", (produit,))
+    row = cursor.fetchone()
+    return {"produit": produit, "prix_dernier": row[0] if row else None, "mois": months}
+
+
+def _month_filter(debut, fin):
+    conditions, parameters = [], []
+    if debut is not None:
+        conditions.append("mois >= ?")
+        parameters.append(debut)
+    if fin is not None:
+        conditions.append("mois <= ?")
+        parameters.append(fin)
+    return conditions, parameters
+
+
+def _round(value):
+    """Amounts are REAL columns: rounded to the centime."""
+    return round(value, 2) if isinstance(value, float) else value
@@ -0,0 +1,213 @@
+"""SQL query tracing and slow-query log for the SQLite connection layer."""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from app_logging import get_logger
+
+# Statements slower than this threshold (in milliseconds) go to the slow-query log
+SLOW_QUERY_MS = float(os.getenv("VITAL_SLOW_QUERY_MS", "100"))
+
+# Tracing can be turned off completely with VITAL_QUERY_TRACE=0
+TRACE_ENABLED = os.getenv("VITAL_QUERY_TRACE", "1") != "0"
+
+slow_query_logger = get_logger("slow_query")
+
+# Regular expressions used to normalize statements
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r"\b\d+(?:\.\d+)?\b")
+_whitespace = re.compile(r"\s+")
+
+# Aggregated statistics per normalized statement
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and replace literal values with '?' so that
+    the same statement with different values is aggregated together."""
+    sql = _string_literal.sub("?", sql)
+    sql = _number_literal.sub("?", sql)
+    sql = _whitespace.sub(" ", sql)
+    return sql.strip()
+
+
+def record_query(sql: str, duration_ms: float, rows: int):
+    """Add one execution of a statement to the statistics."""
+    statement = normalize_sql(sql)
+
+    with _stats_lock:
+        entry = _stats.get(statement)
+        if entry is None:
+            entry = {
+                "statement": statement,
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "rows": 0,
+                "slow_count": 0
+            }
+            _stats[statement] = entry
+
+        entry["count"] += 1
+        entry["total_ms"] += duration_ms
+        entry["rows"] += rows
+        if duration_ms > entry["max_ms"]:
+            entry["max_ms"] = duration_ms
+        if duration_ms >= SLOW_QUERY_MS:
+            entry["slow_count"] += 1
+
+    # Write slow statements to the structured slow-query log
+    if duration_ms >= SLOW_QUERY_MS:
+        slow_query_logger.warning("slow_query", extra={"fields": {
+            "statement": statement,
+            "duration_ms": round(duration_ms, 3),
+            "rows": rows
+        }})
+
+
+def get_top_queries(limit: int = 20, order_by: str = "total_ms"):
+    """Return the top statements ordered by total time (or another metric)."""
+    with _stats_lock:
+        entries = [dict(entry) for entry in _stats.values()]
+
+    for entry in entries:
+        entry["avg_ms"] = entry["total_ms"] / entry["count"] if entry["count"] else 0.0
+        entry["total_ms"] = round(entry["total_ms"], 3)
+        entry["max_ms"] = round(entry["max_ms"], 3)
+        entry["avg_ms"] = round(entry["avg_ms"], 3)
+
+    entries.sort(key=lambda entry: entry[order_by], reverse=True)
+    return entries[:limit]
+
+
+def reset_stats():
+    """Clear all collected statistics."""
+    with _stats_lock:
+        _stats.clear()
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that measures each statement and counts the rows it returns.
+
+    The time spent fetching rows is added to the statement that produced
+    them, so a SELECT is measured from execute() to its last fetch."""
+
+    def _start_statement(self, sql):
+        self._trace_sql = sql
+        self._trace_ms = 0.0
+        self._trace_rows = 0
+        self._trace_pending = True
+
+    def _finish_statement(self):
+        # Flush the statistics of the previous statement on this cursor
+        if getattr(self, "_trace_pending", False):
+            self._trace_pending = False
+            rows = self._trace_rows
+            # For INSERT/UPDATE/DELETE without RETURNING, use the affected row count
+            if rows == 0 and self.rowcount > 0:
+                rows = self.rowcount
+            record_query(self._trace_sql, self._trace_ms, rows)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._trace_ms += (time.perf_counter() - start) * 1000
+
+    def execute(self, sql, parameters=()):
+        self._finish_statement()
+        self._start_statement(sql)
+        self._timed(super().execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish_statement()
+        self._start_statement(sql)
+        self._timed(super().executemany, sql, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is not None:
+            self._trace_rows += 1
+        else:
+            self._finish_statement()
+        return row
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        rows = self._timed(super().fetchmany, size)
+        self._trace_rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._trace_rows += len(rows)
+        self._finish_statement()
+        return rows
+
+    def __next__(self):
+        # for row in cursor.execute(...): each row is counted and timed like a fetchone()
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._trace_ms += (time.perf_counter() - start) * 1000
+            self._finish_statement()
+            raise
+        self._trace_ms += (time.perf_counter() - start) * 1000
+        self._trace_rows += 1
+        return row
+
+    def close(self):
+        self._finish_statement()
+        super().close()
+
+    def __del__(self):
+        # A cursor dropped without close() or a last fetch still counts its statement
+        self._finish_statement()
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose cursors are traced, and whose commits are timed."""
+
+    def cursor(self, factory=TracedCursor):
+        cursor = super().cursor(factory)
+        # The open cursors, so that close() flushes their pending statistics.
+        # Weak references: the long-lived connections (change feed, pools,
+        # write queue) create cursors without end, each one flushed by __del__
+        if not hasattr(self, "_traced_cursors"):
+            self._traced_cursors = weakref.WeakSet()
+        self._traced_cursors.add(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        super().commit()
+        record_query("COMMIT", (time.perf_counter() - start) * 1000, 0)
+
+    def close(self):
+        for cursor in list(getattr(self, "_traced_cursors", ())):
+            if isinstance(cursor, TracedCursor):
+                cursor._finish_statement()
+        self._traced_cursors = weakref.WeakSet()
+        super().close()
+
+
+def connection_factory():
+    """Return the connection class to pass to sqlite3.connect()."""
+    if TRACE_ENABLED:
+        return TracedConnection
+    return sqlite3.Connection
@@ -0,0 +1,121 @@
+"""Aged balance of the forfait clients (/api/balance-agee).
+
+What a client owes at a date is what was charged to them up to that date
+minus what they paid:
+- the amount of each contract, due at the start of the contract;
+- the amount of each passage (excess weight), due on the day of the passage;
+- minus the Versement_Forfait payments.
+
+Payments settle the oldest charges first, so the amount still due is made of
+the most recent charges. The part due for 0-30 days is then the charges of
+the last 30 days (at most the amount due), the part due for 31-60 days the
+charges of the last 60 days minus the first part, and so on: the report only
+needs, per client, the balance and the charges of the last 30, 60 and 90
+days. These sums are read from indexes on the ISO dates
+(migration 0009_balance_agee), and the agent totals are window sums over
+the client rows, in the same query.
+"""
+
+import csv
+import datetime
+import io
+
+from scheduling import iso_date_sql
+
+# Age ranges of the report, in days (the last one is open)
+TRANCHES = ["0-30", "31-60", "61-90", "90+"]
+
+# Columns of a client row, in the order of the query
+COLUMNS = ["client_id", "nom", "agent", "du", "j0_30", "j31_60", "j61_90", "j90_plus"]
+AMOUNTS = COLUMNS[3:]
+
+
+def _recent_charges(table, date_column, condition=""):
+    """Charges of a table of the last 90, 60 and 30 days, per client."""
+    day = iso_date_sql(date_column)
+    return f"""
+        SELECT client_id, 0, SUM(montant), SUM(CASE WHEN {day} > :depuis_60 THEN montant ELSE 0 END),
+               SUM(CASE WHEN {day} > :depuis_30 THEN montant ELSE 0 END)
+        FROM {table} WHERE {condition} {day} > :depuis_90 AND {day} <= :jour
+        GROUP BY client_id"""
+
+
+_AGED_BALANCE_QUERY = f"""
+    WITH sommes (client_id, solde, depuis_90, depuis_60, depuis_30) AS (
+        SELECT client_id, SUM(montant), 0, 0, 0 FROM Contrat_Forfait
+        WHERE {iso_date_sql('date_debut')} <= :jour GROUP BY client_id
+        UNION ALL
+        SELECT client_id, SUM(montant), 0, 0, 0 FROM Bon_Passage_Forfait
+        WHERE montant > 0 AND {iso_date_sql('date')} <= :jour GROUP BY client_id
+        UNION ALL
+        SELECT client_id, -SUM(montant), 0, 0, 0 FROM Versement_Forfait
+        WHERE {iso_date_sql('date')} <= :jour GROUP BY client_id
+        UNION ALL {_recent_charges('Contrat_Forfait', 'date_debut')}
+        UNION ALL {_recent_charges('Bon_Passage_Forfait', 'date', 'montant > 0 AND')}
+    ),
+    soldes AS (
+        SELECT client_id, SUM(solde) AS du, SUM(depuis_90) AS d90, SUM(depuis_60) AS d60, SUM(depuis_30) AS d30
+        FROM sommes GROUP BY client_id
+        HAVING SUM(solde) > 0
+    ),
+    tranches AS (
+        SELECT client_id, du, MIN(d30, du) AS j0_30, MIN(d60, du) - MIN(d30, du) AS j31_60,
+               MIN(d90, du) - MIN(d60, du) AS j61_90, du - MIN(d90, du) AS j90_plus
+        FROM soldes
+    )
+    SELECT cl.id, cl.nom, cl.agent, t.du, t.j0_30, t.j31_60, t.j61_90, t.j90_plus,
+           SUM(t.du) OVER par_agent, SUM(t.j0_30) OVER par_agent, SUM(t.j31_60) OVER par_agent,
+           SUM(t.j61_90) OVER par_agent, SUM(t.j90_plus) OVER par_agent
+    FROM tranches t JOIN Client_Forfait cl ON cl.id = t.client_id
+    WHERE :agent IS NULL OR cl.agent = :agent
+    WINDOW par_agent AS (PARTITION BY cl.agent)
+    ORDER BY cl.agent, t.du DESC
+"""
+
+
+def query_aged_balance(cursor, day, agent=None):
+    """Run the report at `day` (a date) for all the agents or one of them.
+
+    The rows of the cursor are the COLUMNS of a client followed by the totals
+    of its agent (same amounts), sorted by agent then amount due."""
+    parameters = {"jour": day.isoformat(), "agent": agent}
+    for days in (30, 60, 90):
+        parameters[f"depuis_{days}"] = (day - datetime.timedelta(days=days)).isoformat()
+    cursor.execute(_AGED_BALANCE_QUERY, parameters)
+    return cursor
+
+
+def aged_balance(cursor, day, agent=None):
+    """Report grouped by agent: [{"agent", amounts..., "clients": [...]}], with the totals of all agents."""
+    agents = []
+    for row in query_aged_balance(cursor, day, agent):
+        if not agents or agents[-1]["agent"] != row[2]:
+            totals = dict(zip(AMOUNTS, row[len(COLUMNS):]))
+            agents.append({"agent": row[2], **totals, "clients": []})
+        agents[-1]["clients"].append(dict(zip(COLUMNS, row[:len(COLUMNS)])))
+
+    totals = {name: sum(entry[name] for entry in agents) for name in AMOUNTS}
+    return {"tranches": TRANCHES, "total": totals, "agents": agents}
+
+
+def aged_balance_csv(cursor, day, agent=None, batch_size=500):
+    """Report as CSV text chunks, one client per line (for a streaming response).
+
+    Separated by ";" and starting with a BOM, the way Excel opens it in French."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    buffer.write("\ufeff")
+    writer.writerow(["Agent", "ID client", "Client", "Total dû"] + [f"{tranche} jours" for tranche in TRANCHES])
+    query_aged_balance(cursor, day, agent)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            writer.writerow([row[2], row[0], row[1]] + list(row[3:len(COLUMNS)]))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when no client owes anything
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,172 @@
+"""Route planning for the agents' daily collection rounds.
+
+The visiting order is built with a nearest-neighbour tour followed by 2-opt
+improvement over a haversine distance matrix. When NumPy is installed the
+matrix and the 2-opt moves are vectorized; otherwise a pure Python version
+of the same algorithm is used.
+"""
+
+import math
+import re
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional
+    numpy = None
+
+EARTH_RADIUS_KM = 6371.0
+
+# Same format as the Agent.gps validator: "latitude,longitude"
+_gps_pattern = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def parse_gps(gps):
+    """Parse a "lat, lng" string. Returns (lat, lng) or None if missing or invalid."""
+    if not gps:
+        return None
+    match = _gps_pattern.match(gps)
+    if match is None:
+        return None
+    return float(match.group(1)), float(match.group(2))
+
+
+def distance_matrix(points):
+    """Return the matrix of haversine distances (km) between (lat, lng) points."""
+    if numpy is not None:
+        return _distance_matrix_numpy(points)
+    return _distance_matrix_python(points)
+
+
+def _distance_matrix_numpy(points):
+    coordinates = numpy.radians(numpy.asarray(points, dtype=float))
+    lat = coordinates[:, 0][:, None]
+    lng = coordinates[:, 1][:, None]
+    # Haversine formula computed for every pair at once with broadcasting
+    a = (numpy.sin((lat - lat.T) / 2) ** 2
+         + numpy.cos(lat) * numpy.cos(lat.T) * numpy.sin((lng - lng.T) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0.0, 1.0)))
+
+
+def _distance_matrix_python(points):
+    radians = [(math.radians(lat), math.radians(lng)) for lat, lng in points]
+    matrix = []
+    for lat1, lng1 in radians:
+        row = []
+        for lat2, lng2 in radians:
+            a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+            row.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a))))
+        matrix.append(row)
+    return matrix
+
+
+def nearest_neighbour_tour(matrix, size):
+    """Build a tour starting at point 0 by always going to the closest unvisited point."""
+    if numpy is not None:
+        visited = numpy.zeros(size, dtype=bool)
+        visited[0] = True
+        tour = [0]
+        for _ in range(size - 1):
+            distances = numpy.where(visited, numpy.inf, matrix[tour[-1]])
+            nearest = int(numpy.argmin(distances))
+            visited[nearest] = True
+            tour.append(nearest)
+        return tour
+
+    unvisited = set(range(1, size))
+    tour = [0]
+    while unvisited:
+        row = matrix[tour[-1]]
+        nearest = min(unvisited, key=lambda point: row[point])
+        unvisited.remove(nearest)
+        tour.append(nearest)
+    return tour
+
+
+def two_opt(matrix, tour, max_passes=50):
+    """Improve a round trip with 2-opt moves (reverse a segment when it shortens the route).
+
+    The first point (the agent's position) never moves, and the route returns
+    to it at the end."""
+    if numpy is not None:
+        return _two_opt_numpy(matrix, tour, max_passes)
+    return _two_opt_python(matrix, tour, max_passes)
+
+
+def _two_opt_numpy(matrix, tour, max_passes):
+    # The start point is repeated at the end so that the return leg is optimized too
+    route = numpy.asarray(tour + [tour[0]])
+    size = len(route)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, size - 2):
+            # Reversing route[i..j] replaces edges (i-1, i) and (j, j+1) by (i-1, j) and (i, j+1)
+            a = route[i - 1]
+            b = route[i]
+            c = route[i + 1:size - 1]
+            d = route[i + 2:size]
+            gains = matrix[a, b] + matrix[c, d] - matrix[a, c] - matrix[b, d]
+            best = int(numpy.argmax(gains))
+            if gains[best] > 1e-9:
+                j = i + 1 + best
+                route[i:j + 1] = route[i:j + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return route.tolist()[:-1]
+
+
+def _two_opt_python(matrix, tour, max_passes):
+    route = tour + [tour[0]]
+    size = len(route)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, size - 2):
+            a = route[i - 1]
+            b = route[i]
+            best_gain = 1e-9
+            best_j = None
+            for j in range(i + 1, size - 1):
+                c = route[j]
+                d = route[j + 1]
+                gain = matrix[a][b] + matrix[c][d] - matrix[a][c] - matrix[b][d]
+                if gain > best_gain:
+                    best_gain = gain
+                    best_j = j
+            if best_j is not None:
+                route[i:best_j + 1] = reversed(route[i:best_j + 1])
+                improved = True
+        if not improved:
+            break
+    return route[:-1]
+
+
+def route_length(matrix, tour):
+    """Total length (km) of a round trip, including the return to the start."""
+    total = 0.0
+    for index in range(len(tour) - 1):
+        total += float(matrix[tour[index]][tour[index + 1]])
+    if len(tour) > 1:
+        total += float(matrix[tour[-1]][tour[0]])
+    return total
+
+
+def plan_route(start, stops):
+    """Order the stops of a round trip starting and ending at `start` (lat, lng).
+
+    `stops` is a list of (lat, lng). Returns (order, legs_km, total_km) where
+    `order` lists indexes into `stops` in visiting order and `legs_km` is the
+    distance driven to reach each stop."""
+    if not stops:
+        return [], [], 0.0
+
+    points = [start] + list(stops)
+    matrix = distance_matrix(points)
+    tour = nearest_neighbour_tour(matrix, len(points))
+    if len(points) > 3:
+        tour = two_opt(matrix, tour)
+
+    legs = [float(matrix[tour[index - 1]][tour[index]]) for index in range(1, len(tour))]
+    total = route_length(matrix, tour)
+    # Point 0 is the agent: stop indexes are shifted by one
+    order = [point - 1 for point in tour[1:]]
+    return order, legs, total
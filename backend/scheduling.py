@@ -0,0 +1,118 @@
+"""Passage scheduling: which clients are due for a collection, per agent.
+
+The Passage_Schedule table keeps one row per active contract with the date of
+the last passage and the date the next one is due (last passage + client mode
+of 30/60/90 days). It is updated in the same transaction as the passages and
+contracts, so "who is due this week" is an index range query on
+(agent, prochain_passage) instead of a scan of the whole passage history.
+
+Dates in this table are stored as ISO yyyy-mm-dd so they sort correctly.
+"""
+
+import datetime
+
+
+def iso_date_sql(column):
+    """SQL expression converting a dd/mm/yyyy text column to ISO yyyy-mm-dd."""
+    return f"(substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2))"
+
+
+# Rows of Passage_Schedule for the active contracts matching a WHERE condition.
+# The next passage is due at the start of the contract when there is no passage yet.
+_SCHEDULE_SELECT = f"""
+    SELECT ct.id, ct.client_id, cl.agent, cl.mode, lp.dernier,
+           CASE WHEN lp.dernier IS NULL THEN {iso_date_sql('ct.date_debut')}
+                ELSE date(lp.dernier, '+' || cl.mode || ' days') END,
+           {iso_date_sql('ct.date_fin')}
+    FROM Contrat_Forfait ct
+    JOIN Client_Forfait cl ON cl.id = ct.client_id
+    LEFT JOIN (
+        SELECT contrat_id, MAX({iso_date_sql('date')}) AS dernier
+        FROM Bon_Passage_Forfait
+        WHERE {{passage_condition}}
+        GROUP BY contrat_id
+    ) lp ON lp.contrat_id = ct.id
+    WHERE ct.etat = 'Actif' AND {{contract_condition}}
+"""
+
+
+def rebuild_schedule(cursor):
+    """Rebuild the whole schedule with one set-based statement. Returns the number of rows."""
+    cursor.execute("DELETE FROM Passage_Schedule")
+    cursor.execute(
+        "INSERT INTO Passage_Schedule (contrat_id, client_id, agent, mode, dernier_passage, prochain_passage, fin_contrat) "
+        + _SCHEDULE_SELECT.format(passage_condition="1 = 1", contract_condition="1 = 1")
+    )
+    return cursor.rowcount
+
+
+def refresh_contract(cursor, contrat_id):
+    """Recompute the schedule row of one contract (after a passage or contract change)."""
+    cursor.execute("DELETE FROM Passage_Schedule WHERE contrat_id = ?", (contrat_id,))
+    cursor.execute(
+        "INSERT INTO Passage_Schedule (contrat_id, client_id, agent, mode, dernier_passage, prochain_passage, fin_contrat) "
+        + _SCHEDULE_SELECT.format(passage_condition="contrat_id = ?", contract_condition="ct.id = ?"),
+        (contrat_id, contrat_id)
+    )
+
+
+def refresh_client(cursor, client_id):
+    """Recompute the schedule rows of every contract of a client (after a mode or agent change)."""
+    cursor.execute("DELETE FROM Passage_Schedule WHERE client_id = ?", (client_id,))
+    cursor.execute(
+        "INSERT INTO Passage_Schedule (contrat_id, client_id, agent, mode, dernier_passage, prochain_passage, fin_contrat) "
+        + _SCHEDULE_SELECT.format(
+            passage_condition="contrat_id IN (SELECT id FROM Contrat_Forfait WHERE client_id = ?)",
+            contract_condition="ct.client_id = ?"),
+        (client_id, client_id)
+    )
+
+
+def week_bounds(day):
+    """Return the (monday, sunday) dates of the week containing `day`."""
+    monday = day - datetime.timedelta(days=day.weekday())
+    return monday, monday + datetime.timedelta(days=6)
+
+
+def get_due_passages(cursor, fin, today, agent=None):
+    """Return the clients due or overdue up to `fin`, grouped per agent.
+
+    Passages due before `today` are marked as overdue ("en_retard")."""
+    query = """
+        SELECT s.contrat_id, s.client_id, s.agent, s.mode, s.dernier_passage, s.prochain_passage,
+               cl.nom, cl.tel, cl.specialite, cl.gps
+        FROM Passage_Schedule s
+        JOIN Client_Forfait cl ON cl.id = s.client_id
+        WHERE s.prochain_passage <= ? AND s.prochain_passage <= s.fin_contrat
+    """
+    params = [fin.isoformat()]
+    if agent is not None:
+        query += " AND s.agent = ?"
+        params.append(agent)
+    query += " ORDER BY s.agent, s.prochain_passage"
+    cursor.execute(query, params)
+
+    today_iso = today.isoformat()
+    agents = {}
+    for row in cursor.fetchall():
+        agents.setdefault(row["agent"], []).append({
+            "client_id": row["client_id"],
+            "nom": row["nom"],
+            "tel": row["tel"],
+            "specialite": row["specialite"],
+            "gps": row["gps"],
+            "contrat_id": row["contrat_id"],
+            "mode": row["mode"],
+            "dernier_passage": _to_french_date(row["dernier_passage"]),
+            "prochain_passage": _to_french_date(row["prochain_passage"]),
+            "en_retard": row["prochain_passage"] < today_iso
+        })
+
+    return [{"agent": name, "nombre": len(clients), "clients": clients} for name, clients in agents.items()]
+
+
+def _to_french_date(iso_date):
+    """Convert yyyy-mm-dd to the dd/mm/yyyy format used by the API."""
+    if iso_date is None:
+        return None
+    return f"{iso_date[8:10]}/{iso_date[5:7]}/{iso_date[0:4]}"
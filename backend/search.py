@@ -0,0 +1,123 @@
+"""Search of the clients, fournisseurs, produits and services (/api/search).
+
+The records are indexed in the FTS5 table Recherche (migration 0007_recherche),
+kept in sync by triggers. The rowid of an entry is the id of the record * 4
+plus the index of its type in TYPES. The search ignores accents and case,
+and every word of the query matches as a prefix ("alg med" finds
+"Clinique Médicale d'Algérie"). The results are sorted by relevance (BM25,
+a match in the title counts more than in the details).
+
+Ranking costs a few microseconds per matching record, so only the first
+RANK_CANDIDATES matches are ranked: a vague query ("ca" on 100k clients)
+still answers in a few milliseconds, and typing more letters narrows the
+matches down to a set ranked in full. One-letter words are matched as whole
+words, not as prefixes (they would match a large part of the index).
+
+If SQLite was built without FTS5, the same search runs with LIKE queries on
+the base tables (slower, and accent-sensitive). So does it while the backfill
+of the migration hasn't indexed all the existing records yet: the index
+would miss them.
+"""
+
+import re
+
+# Order of the types in the rowid of the Recherche table
+TYPES = ["client", "fournisseur", "produit", "service"]
+
+# Weight of the title and details columns in the ranking
+TITLE_WEIGHT = 10.0
+DETAILS_WEIGHT = 1.0
+
+MAX_LIMIT = 100
+
+# Matches ranked at most per query
+RANK_CANDIDATES = 1000
+
+# Words of a query: anything but letters and digits separates them
+_word_pattern = re.compile(r"\w+")
+
+# Fallback without FTS5: (table, title column, details expression) per type
+_LIKE_SOURCES = {
+    "client": ("Client_Forfait", "nom", "COALESCE(specialite, '')"),
+    "fournisseur": ("Fournisseur", "nom", "COALESCE(adresse, '') || ' ' || COALESCE(telephone, '')"),
+    "produit": ("Produit", "designation", "''"),
+    "service": ("Service", "designation", "''"),
+}
+
+# Set by detect_search_index()
+_fts_available = True
+# Whether the backfill of 0007_recherche has indexed every existing record (checked until it has)
+_fts_complete = False
+
+
+def detect_search_index(cursor):
+    """Check whether the Recherche table exists (created by the migrations when SQLite supports FTS5)."""
+    global _fts_available, _fts_complete
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'Recherche'")
+    _fts_available = cursor.fetchone() is not None
+    _fts_complete = False
+
+
+def _index_complete(cursor):
+    global _fts_complete
+    if not _fts_complete:
+        cursor.execute("SELECT backfill_done FROM schema_version WHERE name = 'recherche'")
+        row = cursor.fetchone()
+        _fts_complete = row is None or row[0] == 1
+    return _fts_complete
+
+
+def match_expression(query):
+    """FTS5 query for a text typed by a user: every word, as a prefix. None when there is no word."""
+    words = _word_pattern.findall(query)
+    if not words:
+        return None
+    # Quoted, so that words like AND/OR/NEAR are not read as operators
+    return " ".join(f'"{word}"*' if len(word) > 1 else f'"{word}"' for word in words)
+
+
+def search(cursor, query, types=None, limit=20):
+    """Records matching `query`, best first: [{"type", "id", "titre", "details"}].
+
+    `types` restricts the search to some of TYPES (all of them when None)."""
+    types = [name for name in TYPES if types is None or name in types]
+    limit = max(1, min(limit, MAX_LIMIT))
+    if not types:
+        return []
+    if not _fts_available or not _index_complete(cursor):
+        return _search_like(cursor, query, types, limit)
+
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    type_filter = ""
+    parameters = [expression]
+    if len(types) < len(TYPES):
+        type_filter = f"AND rowid % 4 IN ({', '.join('?' for _ in types)})"
+        parameters += [TYPES.index(name) for name in types]
+    # bm25 is lower for better matches; the candidates are sorted here rather than
+    # with ORDER BY, which would rank every match before applying the LIMIT
+    cursor.execute(f"""
+        SELECT rowid, titre, details, bm25(Recherche, {TITLE_WEIGHT}, {DETAILS_WEIGHT}) FROM Recherche
+        WHERE Recherche MATCH ? {type_filter}
+        LIMIT ?
+    """, parameters + [RANK_CANDIDATES])
+    rows = sorted(cursor.fetchall(), key=lambda row: row[3])[:limit]
+    return [{"type": TYPES[row[0] % 4], "id": row[0] // 4, "titre": row[1], "details": row[2].strip()}
+            for row in rows]
+
+
+def _search_like(cursor, query, types, limit):
+    words = _word_pattern.findall(query)
+    if not words:
+        return []
+    results = []
+    for name in types:
+        table, title, details = _LIKE_SOURCES[name]
+        text = f"({title} || ' ' || {details})"
+        conditions = " AND ".join(f"{text} LIKE ?" for _ in words)
+        cursor.execute(f"SELECT id, {title}, {details} FROM {table} WHERE {conditions} ORDER BY {title} LIMIT ?",
+                       [f"%{word}%" for word in words] + [limit])
+        results += [{"type": name, "id": row[0], "titre": row[1], "details": row[2].strip()}
+                    for row in cursor.fetchall()]
+    return results[:limit]
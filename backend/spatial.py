@@ -0,0 +1,133 @@
+"""Spatial index of the agents and clients positions.
+
+The "lat, lng" text of the gps columns is copied into numeric lat/lng
+columns, and every position is also stored in an SQLite R*Tree virtual table
+(Agents_Geo, Clients_Geo). A search first selects the points inside a
+bounding box with the R*Tree, then computes the exact distances in Python
+for these few candidates only.
+
+If SQLite was built without the R*Tree module, the same bounding-box queries
+run on the base tables with a (lat, lng) index instead.
+
+The columns and the R*Tree tables are created by the migration
+0002_positions_gps, which also fills them for the existing rows.
+"""
+
+import math
+
+from routing import parse_gps, EARTH_RADIUS_KM
+
+# Length of one degree of latitude
+KM_PER_DEGREE = 111.32
+
+# The nearest-agent search starts with this radius and doubles it until it finds someone
+NEAREST_START_RADIUS_KM = 5.0
+NEAREST_MAX_RADIUS_KM = 2000.0
+
+# Table holding the positions, and its R*Tree, for each kind of point
+_TABLES = {
+    "agent": ("Agents", "Agents_Geo"),
+    "client": ("Client_Forfait", "Clients_Geo"),
+}
+
+# Set by detect_spatial_index()
+_rtree_available = True
+
+
+def detect_spatial_index(cursor):
+    """Check whether the R*Tree tables exist (created by the migrations when SQLite supports R*Tree)."""
+    global _rtree_available
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'Agents_Geo'")
+    _rtree_available = cursor.fetchone() is not None
+
+
+def refresh_position(cursor, kind, point_id):
+    """Update the lat/lng columns and the R*Tree entry of one agent or client (after a create or update)."""
+    table, geo_table = _TABLES[kind]
+    cursor.execute(f"SELECT gps FROM {table} WHERE id = ?", (point_id,))
+    row = cursor.fetchone()
+    position = parse_gps(row[0]) if row is not None else None
+
+    lat, lng = position if position else (None, None)
+    cursor.execute(f"UPDATE {table} SET lat = ?, lng = ? WHERE id = ?", (lat, lng, point_id))
+    if _rtree_available:
+        cursor.execute(f"DELETE FROM {geo_table} WHERE id = ?", (point_id,))
+        if position is not None:
+            cursor.execute(f"INSERT INTO {geo_table} (id, min_lat, max_lat, min_lng, max_lng) VALUES (?, ?, ?, ?, ?)",
+                           (point_id, lat, lat, lng, lng))
+
+
+def remove_position(cursor, kind, point_id):
+    """Remove an agent or client from the R*Tree (after a delete)."""
+    if _rtree_available:
+        cursor.execute(f"DELETE FROM {_TABLES[kind][1]} WHERE id = ?", (point_id,))
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Haversine distance between two points, in km."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _bounding_box(lat, lng, radius_km):
+    """Return (min_lat, max_lat, min_lng, max_lng) of a box containing the circle."""
+    delta_lat = radius_km / KM_PER_DEGREE
+    # Degrees of longitude get shorter towards the poles
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    delta_lng = radius_km / (KM_PER_DEGREE * cos_lat)
+    return lat - delta_lat, lat + delta_lat, lng - delta_lng, lng + delta_lng
+
+
+def _points_in_box(cursor, kind, columns, lat, lng, radius_km):
+    """Rows (with their lat/lng) of the agents or clients inside the bounding box of a circle."""
+    table, geo_table = _TABLES[kind]
+    box = _bounding_box(lat, lng, radius_km)
+    if _rtree_available:
+        cursor.execute(f"""
+            SELECT {columns}, t.lat, t.lng FROM {geo_table} g
+            JOIN {table} t ON t.id = g.id
+            WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lng >= ? AND g.min_lng <= ?
+        """, box)
+    else:
+        cursor.execute(f"""
+            SELECT {columns}, t.lat, t.lng FROM {table} t
+            WHERE t.lat BETWEEN ? AND ? AND t.lng BETWEEN ? AND ?
+        """, box)
+    return cursor.fetchall()
+
+
+def nearest_agents(cursor, lat, lng, limit=1):
+    """Return the `limit` agents closest to (lat, lng), with their distance in km.
+
+    The search box grows until it contains enough agents within its radius."""
+    columns = "t.id, t.nom, t.telephone, t.whatsapp, t.gps, t.regime, t.notification"
+    radius = NEAREST_START_RADIUS_KM
+    while True:
+        found = []
+        for row in _points_in_box(cursor, "agent", columns, lat, lng, radius):
+            agent = dict(row)
+            agent["distance_km"] = round(distance_km(lat, lng, agent.pop("lat"), agent.pop("lng")), 3)
+            found.append(agent)
+        found.sort(key=lambda agent: agent["distance_km"])
+
+        # Agents in the corners of the box may be farther than agents just outside of it:
+        # only the ones within the radius are sure to be the closest
+        within = [agent for agent in found if agent["distance_km"] <= radius]
+        if len(within) >= limit or radius >= NEAREST_MAX_RADIUS_KM:
+            return found[:limit] if radius >= NEAREST_MAX_RADIUS_KM else within[:limit]
+        radius *= 2
+
+
+def clients_within(cursor, lat, lng, radius_km):
+    """Return the clients at most `radius_km` km from (lat, lng), closest first."""
+    columns = "t.id, t.nom, t.specialite, t.tel, t.mode, t.agent, t.etat_contrat, t.gps"
+    clients = []
+    for row in _points_in_box(cursor, "client", columns, lat, lng, radius_km):
+        client = dict(row)
+        distance = distance_km(lat, lng, client.pop("lat"), client.pop("lng"))
+        if distance <= radius_km:
+            client["distance_km"] = round(distance, 3)
+            clients.append(client)
+    clients.sort(key=lambda client: client["distance_km"])
+    return clients
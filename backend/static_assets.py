@@ -0,0 +1,129 @@
+"""Serving of the React build (PROD only).
+
+The frontend build writes a Brotli (.br) and a gzip (.gz) variant next to
+each large file (see frontend/scripts/compress.js). The backend sends the
+smallest variant the browser accepts, so nothing is compressed per request.
+
+- Files in dist/assets have a content hash in their name (a new build gives
+  new names), so they are cached by the browser for a year without revalidation.
+- index.html keeps the same name between builds: it is kept in memory with an
+  ETag, and the browser revalidates it on every visit (a 304 when unchanged).
+"""
+
+import hashlib
+import mimetypes
+import os
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+# Variants written by the build, best compression first
+PRECOMPRESSED = [("br", ".br"), ("gzip", ".gz")]
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+
+def accepted_encodings(accept_encoding):
+    """Set of the content codings accepted in an Accept-Encoding header (ignoring the ones with q=0)."""
+    encodings = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, parameters = part.strip().partition(";")
+        quality = parameters.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name.strip())
+    return encodings
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles sending the precompressed variant of a file, with immutable caching."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        # Type of the original file, not of the .br/.gz file
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+
+        response = None
+        for encoding, extension in PRECOMPRESSED:
+            if encoding not in accepted:
+                continue
+            try:
+                variant_stat = os.stat(f"{full_path}{extension}")
+            except OSError:
+                continue
+            response = FileResponse(f"{full_path}{extension}", status_code=status_code, stat_result=variant_stat,
+                                    method=scope["method"], media_type=media_type)
+            response.headers["Content-Encoding"] = encoding
+            break
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result,
+                                    method=scope["method"], media_type=media_type)
+
+        # The chosen file depends on Accept-Encoding, caches must know it
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE
+        if self.is_not_modified(response.headers, request_headers):
+            return Response(status_code=304, headers={
+                name: value for name, value in response.headers.items()
+                if name in ("etag", "cache-control", "vary", "content-encoding")})
+        return response
+
+
+class IndexPage:
+    """index.html and its precompressed variants, kept in memory.
+
+    The file is read again only when its modification time changes (new build)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        # Content and ETag per encoding ("identity", "br", "gzip")
+        self.variants = {}
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self.mtime:
+            return
+        variants = {}
+        with open(self.path, "rb") as file:
+            content = file.read()
+        digest = hashlib.sha256(content).hexdigest()[:20]
+        variants["identity"] = (content, f'"{digest}"')
+        for encoding, extension in PRECOMPRESSED:
+            if os.path.exists(self.path + extension):
+                with open(self.path + extension, "rb") as file:
+                    # Each variant has its own ETag: the bytes are different
+                    variants[encoding] = (file.read(), f'"{digest}-{encoding}"')
+        self.variants = variants
+        self.mtime = mtime
+
+    def response(self, request):
+        """The page in the best accepted encoding, or 304 when the browser already has it."""
+        if not os.path.exists(self.path):
+            return None
+        self._load()
+
+        accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+        encoding = "identity"
+        for name, _ in PRECOMPRESSED:
+            if name in accepted and name in self.variants:
+                encoding = name
+                break
+        content, etag = self.variants[encoding]
+
+        # no-cache: the browser may keep the page but must check it is still current
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if_none_match = request.headers.get("if-none-match", "")
+        # The compression middleware may have made the ETag weak (W/"...")
+        if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        return Response(content, media_type="text/html", headers=headers)
@@ -0,0 +1,95 @@
+"""Checks shared by the request models (models.py).
+
+The patterns are compiled once, at import, instead of on every call of
+re.match with a string pattern. Dates (dd/mm/yyyy) are parsed by hand:
+datetime.strptime goes through a regex built from the format and a lock on
+every call, which is most of the validation time of the list endpoints
+(every row of a response_model=List[...] is validated again).
+
+Parsed dates are kept in a bounded cache keyed by the text: the same dates
+come back on every row and every request, and a model checking two dates
+against each other (start before end) reads them from the cache. Pydantic
+runs the validators before the model instance exists, so the cache can't
+live on the instance itself.
+"""
+
+import datetime
+import re
+from functools import lru_cache
+
+from fastapi import HTTPException
+
+# Agents: 10 digits starting with 0
+PHONE_PATTERN = re.compile(r'^0\d{9}$')
+# Clients: 9 digits (landline) or 10 digits (mobile), starting with 0
+CLIENT_PHONE_PATTERN = re.compile(r'^0\d{8,9}$')
+# "latitude,longitude" with 5 decimals each
+GPS_PATTERN = re.compile(r'^(-?\d+\.\d{5}),\s*(-?\d+\.\d{5})$')
+
+DATE_ERROR = "Format de date invalide. Utilisez le format dd/mm/yyyy"
+GPS_ERROR = "Format GPS invalide. Utilisez le format latitude,longitude avec 5 décimales (ex: 36.75234, 3.04215)"
+
+# Distinct dates kept parsed (a few years of days, plus some invalid texts)
+DATE_CACHE_SIZE = 4096
+
+# Errors reported at most by a batch validation
+MAX_BATCH_ERRORS = 50
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(value):
+    """Parse a dd/mm/yyyy date. Returns a datetime.date, or None when the text isn't a valid date.
+
+    Accepts the same texts as datetime.strptime(value, '%d/%m/%Y'), including
+    day and month on one digit (1/2/2024)."""
+    day, month, year = value[0:2], value[3:5], value[6:10]
+    if (len(value) == 10 and value[2] == "/" and value[5] == "/" and value.isascii()
+            and day.isdigit() and month.isdigit() and year.isdigit()):
+        # Fast path: the zero-padded form sent by the frontend
+        try:
+            return datetime.date(int(year), int(month), int(day))
+        except ValueError:
+            return None
+    # Other forms (1/2/2024...) keep the behaviour of strptime
+    try:
+        return datetime.datetime.strptime(value, '%d/%m/%Y').date()
+    except ValueError:
+        return None
+
+
+def check_date(value):
+    """Validate a dd/mm/yyyy date and return it zero-padded (the form the SQL date expressions expect)."""
+    parsed = parse_date(value)
+    if parsed is None:
+        raise HTTPException(status_code=400, detail=DATE_ERROR)
+    return f"{parsed.day:02d}/{parsed.month:02d}/{parsed.year:04d}"
+
+
+def check_gps(value):
+    if not GPS_PATTERN.match(value):
+        raise HTTPException(status_code=400, detail=GPS_ERROR)
+    return value
+
+
+def validate_batch(model, items):
+    """Validate a list of payloads with a model and return the model instances.
+
+    Every item is checked, and all the errors are reported in one 400 response
+    (item index and message) instead of stopping at the first invalid item."""
+    validated = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise HTTPException(status_code=400, detail="Un objet JSON est attendu")
+            validated.append(model(**item))
+        except HTTPException as e:
+            errors.append({"index": index, "detail": e.detail})
+        except ValueError as e:
+            # Missing fields or wrong types (pydantic ValidationError)
+            errors.append({"index": index, "detail": str(e)})
+        if len(errors) >= MAX_BATCH_ERRORS:
+            break
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": "Éléments invalides", "erreurs": errors})
+    return validated
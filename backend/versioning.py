@@ -0,0 +1,44 @@
+"""Optimistic concurrency of the updates of clients, contracts and bons d'achat.
+
+These rows have a version column (migration 0012_versions), increased by a
+trigger on every change of the row, by a request or a job. The GET and PUT
+responses give it in their body and in the ETag header.
+
+A PUT sent with the version the client read (If-Match header, or the
+version field of the body) only updates the row if it still has this
+version: the condition is in the WHERE of the UPDATE, so two operators
+saving the same contract can't overwrite each other, and no lock is held
+between the read and the update. The other one gets a 409 and reloads the row.
+A PUT without a version updates the row whatever its version (as before).
+"""
+
+import re
+
+from fastapi import HTTPException
+
+_if_match_pattern = re.compile(r'^(?:W/)?"?(\d+)"?$')
+
+
+def etag(version):
+    return f'"{version}"'
+
+
+def expected_version(if_match, body_version):
+    """Version the update requires: the If-Match header, else the version of the body, else None (any)."""
+    if if_match is None or if_match.strip() == "*":
+        return body_version
+    match = _if_match_pattern.match(if_match.strip())
+    if match is None:
+        raise HTTPException(status_code=400, detail="En-tête If-Match invalide : il doit contenir la version de la ligne")
+    return int(match.group(1))
+
+
+def check_version(row, expected, label):
+    """Refuse the update early when the row read has already changed (the UPDATE checks it again)."""
+    if expected is not None and row["version"] != expected:
+        raise conflict(label)
+
+
+def conflict(label):
+    return HTTPException(status_code=409,
+                         detail=f"{label} a été modifié par un autre utilisateur. Rechargez-le avant de le modifier.")
@@ -0,0 +1,133 @@
+"""Shared helpers for the benchmark scripts: statistics, result files and comparison."""
+
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+BACKEND_DIR = os.path.join(REPO_DIR, "backend")
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+# Default database: the one built by database/generate_db.py
+DEFAULT_DB_PATH = os.path.join(REPO_DIR, "database", "large", "db.sqlite")
+
+
+def load_backend(db_path):
+    """Import backend/main.py configured to use `db_path`."""
+    os.environ["VITAL_DB_PATH"] = db_path
+    os.environ.setdefault("VITAL_ENV", "DEV")
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+    return main
+
+
+def percentile(sorted_values, fraction):
+    """Return the percentile (0.0 to 1.0) of an already sorted list, with linear interpolation."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    weight = position - lower
+    return sorted_values[lower] * (1 - weight) + sorted_values[upper] * weight
+
+
+def summarize(latencies_ms, elapsed_s, errors=0):
+    """Summarize a list of latencies (milliseconds) measured over `elapsed_s` seconds."""
+    values = sorted(latencies_ms)
+    count = len(values)
+    return {
+        "count": count,
+        "errors": errors,
+        "elapsed_s": round(elapsed_s, 3),
+        "throughput_per_s": round(count / elapsed_s, 2) if elapsed_s > 0 else 0.0,
+        "mean_ms": round(sum(values) / count, 3) if count else 0.0,
+        "p50_ms": round(percentile(values, 0.50), 3),
+        "p95_ms": round(percentile(values, 0.95), 3),
+        "p99_ms": round(percentile(values, 0.99), 3),
+        "max_ms": round(values[-1], 3) if count else 0.0
+    }
+
+
+def git_commit():
+    """Return the current git commit hash, or None outside a git checkout."""
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True)
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def database_info(db_path):
+    """Return the row count of the main tables of the database used for the run."""
+    info = {"path": db_path, "tables": {}}
+    if not db_path or not os.path.exists(db_path):
+        return info
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    for table in ["Client_Forfait", "Contrat_Forfait", "Bon_Passage_Forfait", "Versement_Forfait", "Bon_Achats"]:
+        try:
+            info["tables"][table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        except sqlite3.Error:
+            pass
+    conn.close()
+    return info
+
+
+def save_results(kind, results, parameters, db_path, output=None):
+    """Save benchmark results as JSON in benchmarks/results/ (or `output`) and return the path."""
+    now = datetime.datetime.now()
+    document = {
+        "kind": kind,
+        "date": now.isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "database": database_info(db_path),
+        "results": results
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{kind}-{now.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(document, file, indent=2, ensure_ascii=False)
+    return output
+
+
+def print_table(results):
+    """Print one line per benchmark with its throughput and latency percentiles."""
+    print(f"{'benchmark':<48} {'count':>7} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, stats in results.items():
+        print(f"{name:<48} {stats['count']:>7} {stats['throughput_per_s']:>10.1f} {stats['p50_ms']:>9.2f} "
+              f"{stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['errors']:>7}")
+
+
+def compare_results(previous_path, results, threshold=0.10):
+    """Compare results with a previous result file and print regressions.
+
+    A benchmark regresses when its p95 grows, or its throughput drops, by more
+    than `threshold`. Returns the number of regressions."""
+    with open(previous_path, encoding="utf-8") as file:
+        previous = json.load(file)["results"]
+
+    regressions = 0
+    print(f"\nComparison with {previous_path} (threshold {threshold:.0%}):")
+    for name, stats in results.items():
+        if name not in previous:
+            continue
+        old = previous[name]
+        p95_change = (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+        throughput_change = ((stats["throughput_per_s"] - old["throughput_per_s"]) / old["throughput_per_s"]
+                             if old["throughput_per_s"] else 0.0)
+        regressed = p95_change > threshold or throughput_change < -threshold
+        if regressed:
+            regressions += 1
+        print(f"  {'REGRESSION' if regressed else 'ok':<10} {name:<48} p95 {p95_change:+.1%}  "
+              f"throughput {throughput_change:+.1%}")
+    return regressions
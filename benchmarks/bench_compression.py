@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Benchmark of the response compression: CPU time against bytes saved.
+
+The JSON of two list endpoints (/api/bon-achats and /api/bon-passage-forfait)
+is built from the database, then compressed with every available encoder
+(gzip always, Brotli and zstd when their package is installed) at several
+levels. For each one the script reports the compression time, the size, and
+the estimated time to send the response over slow and fast mobile links
+(compression time + transfer time).
+
+Usage:
+    python ../database/generate_db.py              # build database/large/db.sqlite once
+    python bench_compression.py --rows 1000 10000 --iterations 10
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+
+import bench_common
+
+sys.path.insert(0, bench_common.BACKEND_DIR)
+import compression  # noqa: E402
+
+# Link speeds in bytes per second: a poor 3G link in the field (400 kbit/s) and a good 4G link (10 Mbit/s)
+LINKS = {"3g": 400_000 // 8, "4g": 10_000_000 // 8}
+
+# Levels tried for each encoding (the middleware uses the first one)
+LEVELS = {"gzip": [compression.GZIP_LEVEL, 1, 9], "br": [compression.BROTLI_QUALITY, 1, 11],
+          "zstd": [compression.ZSTD_LEVEL, 1, 19]}
+
+ENCODER_CLASSES = {"gzip": compression.GzipEncoder, "br": compression.BrotliEncoder,
+                   "zstd": compression.ZstdEncoder}
+
+
+def build_payloads(db_path, row_counts):
+    """JSON bodies like the ones of the list endpoints, for each number of rows."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    payloads = {}
+    for rows in row_counts:
+        for table, endpoint in [("Bon_Achats", "bon-achats"), ("Bon_Passage_Forfait", "bon-passage-forfait")]:
+            cursor = conn.execute(f"SELECT * FROM {table} ORDER BY id LIMIT ?", (rows,))
+            body = json.dumps([dict(row) for row in cursor.fetchall()], ensure_ascii=False).encode("utf-8")
+            payloads[f"{endpoint} ({rows} rows)"] = body
+    conn.close()
+    return payloads
+
+
+def compress(encoder_class, level, body):
+    encoder = encoder_class(level)
+    return encoder.compress(body) + encoder.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the response compression (CPU vs bytes)")
+    parser.add_argument("--db", default=bench_common.DEFAULT_DB_PATH, help="Database to read the payloads from")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000], help="Rows per payload")
+    parser.add_argument("--iterations", type=int, default=10, help="Compressions per encoder and level")
+    parser.add_argument("--output", default=None, help="Result file (default: results/compression-<date>.json)")
+    parser.add_argument("--compare", default=None, help="Previous result file to compare with")
+    args = parser.parse_args()
+
+    print(f"Encoders available: {', '.join(compression.ENCODERS)}")
+    payloads = build_payloads(args.db, args.rows)
+    results = {}
+    for payload_name, body in payloads.items():
+        print(f"\n{payload_name}: {len(body)} bytes")
+        print(f"  {'identity':<10} {'':>5} {len(body):>10} bytes  {'':<8} {'':>15}  " +
+              "  ".join(f"{link}: {len(body) / speed * 1000:8.1f} ms" for link, speed in LINKS.items()))
+        for encoding in compression.ENCODERS:
+            for level in LEVELS[encoding]:
+                timings = []
+                started = time.perf_counter()
+                for _ in range(args.iterations):
+                    start = time.perf_counter()
+                    compressed = compress(ENCODER_CLASSES[encoding], level, body)
+                    timings.append((time.perf_counter() - start) * 1000)
+                elapsed = time.perf_counter() - started
+
+                stats = bench_common.summarize(timings, elapsed)
+                stats["bytes"] = len(compressed)
+                stats["ratio"] = round(len(body) / len(compressed), 2)
+                # Time until the client has the whole response: compression then transfer
+                for link, speed in LINKS.items():
+                    stats[f"send_{link}_ms"] = round(stats["p50_ms"] + len(compressed) / speed * 1000, 1)
+                results[f"{payload_name} {encoding}-{level}"] = stats
+                print(f"  {encoding:<10} {level:>5} {len(compressed):>10} bytes  x{stats['ratio']:<7} "
+                      f"cpu {stats['p50_ms']:7.1f} ms  " +
+                      "  ".join(f"{link}: {stats[f'send_{link}_ms']:8.1f} ms" for link in LINKS))
+
+    print()
+    bench_common.print_table(results)
+    parameters = {"rows": args.rows, "iterations": args.iterations, "encoders": list(compression.ENCODERS),
+                  "links_bytes_per_s": LINKS}
+    path = bench_common.save_results("compression", results, parameters, args.db, args.output)
+    print(f"\nResults saved to {path}")
+
+    if args.compare:
+        regressions = bench_common.compare_results(args.compare, results)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks of the hot FastAPI handlers, called in-process.
+
+Each handler is called directly (without HTTP) with a fresh connection from
+get_db(), exactly as FastAPI would do for a request. Write benchmarks
+(create_bon_passage_forfait, delete_bon_achat) run on a scratch copy of the
+database so the source database is never modified.
+
+Usage:
+    python ../database/generate_db.py              # build database/large/db.sqlite once
+    python bench_handlers.py --iterations 20
+    python bench_handlers.py --compare results/handlers-20250101-120000.json
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import bench_common
+
+
+def call_handler(main, handler, **kwargs):
+    """Call an async handler with a fresh connection, like a real request."""
+    db = main.get_db()
+    conn = next(db)
+    try:
+        return asyncio.run(handler(conn=conn, **kwargs))
+    finally:
+        db.close()
+
+
+def run_benchmark(name, function, iterations, warmup):
+    """Run `function(i)` for warmup + iterations rounds and summarize the timings."""
+    for index in range(warmup):
+        function(index)
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for index in range(warmup, warmup + iterations):
+        start = time.perf_counter()
+        try:
+            function(index)
+        except Exception as error:
+            errors += 1
+            print(f"  {name}: {error}")
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - started
+
+    stats = bench_common.summarize(latencies, elapsed, errors)
+    print(f"  {name}: p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms")
+    return stats
+
+
+def pick_ids(db_path, count):
+    """Pick the ids used by the benchmarks (clients with an active contract, bons with products)."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    client_ids = [row[0] for row in conn.execute(
+        "SELECT client_id FROM Contrat_Forfait WHERE etat = 'Actif' ORDER BY client_id LIMIT ?", (count,))]
+    bon_ids = [row[0] for row in conn.execute(
+        "SELECT DISTINCT bon_achat_id FROM Produits_Bon_Achat ORDER BY bon_achat_id LIMIT ?", (count,))]
+    conn.close()
+    return client_ids, bon_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the hot backend handlers")
+    parser.add_argument("--db", default=bench_common.DEFAULT_DB_PATH, help="Database to benchmark against")
+    parser.add_argument("--iterations", type=int, default=20, help="Measured calls per benchmark")
+    parser.add_argument("--warmup", type=int, default=2, help="Calls before measuring")
+    parser.add_argument("--only", default=None, help="Run only the benchmarks whose name contains this text")
+    parser.add_argument("--output", default=None, help="Result file (default: results/handlers-<date>.json)")
+    parser.add_argument("--compare", default=None, help="Previous result file to compare with")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"Database not found: {args.db} (run database/generate_db.py first)")
+
+    rounds = args.iterations + args.warmup
+    client_ids, bon_ids = pick_ids(args.db, rounds)
+    if len(client_ids) < rounds or len(bon_ids) < rounds:
+        sys.exit("Not enough clients with an active contract or bons d'achat in the database")
+
+    # Write benchmarks modify a scratch copy, never the source database
+    scratch_dir = tempfile.mkdtemp(prefix="vital-bench-")
+    scratch_db = os.path.join(scratch_dir, "db.sqlite")
+    print(f"Copying {args.db} to {scratch_db}")
+    shutil.copyfile(args.db, scratch_db)
+    backend = bench_common.load_backend(scratch_db)
+
+    benchmarks = {
+        # List endpoints used by the pages
+        "get_clients": lambda i: call_handler(backend, backend.get_clients),
+        "get_agents": lambda i: call_handler(backend, backend.get_agents),
+        "get_contrats_forfait": lambda i: call_handler(backend, backend.get_contrats_forfait),
+        "get_bons_passage_forfait": lambda i: call_handler(backend, backend.get_bons_passage_forfait),
+        "get_versements_forfait": lambda i: call_handler(backend, backend.get_versements_forfait),
+        "get_bon_achats": lambda i: call_handler(backend, backend.get_bon_achats),
+        "get_inventaire": lambda i: call_handler(backend, backend.get_inventaire),
+        # Per-client endpoints used by ClientProfile.jsx
+        "get_bons_passage_forfait_by_client": lambda i: call_handler(
+            backend, backend.get_bons_passage_forfait_by_client, client_id=client_ids[i]),
+        "get_versements_forfait_by_client": lambda i: call_handler(
+            backend, backend.get_versements_forfait_by_client, client_id=client_ids[i]),
+        # Write handlers
+        "create_bon_passage_forfait": lambda i: call_handler(
+            backend, backend.create_bon_passage_forfait,
+            bon=backend.BonPassageForfaitModel(date="15/12/2024", client_id=client_ids[i], poids_collecte=120)),
+        "delete_bon_achat": lambda i: call_handler(backend, backend.delete_bon_achat, bon_id=bon_ids[i]),
+    }
+
+    results = {}
+    try:
+        for name, function in benchmarks.items():
+            if args.only and args.only not in name:
+                continue
+            results[name] = run_benchmark(name, function, args.iterations, args.warmup)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print()
+    bench_common.print_table(results)
+    parameters = {"iterations": args.iterations, "warmup": args.warmup}
+    path = bench_common.save_results("handlers", results, parameters, args.db, args.output)
+    print(f"\nResults saved to {path}")
+
+    if args.compare:
+        regressions = bench_common.compare_results(args.compare, results)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
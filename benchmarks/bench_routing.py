@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Benchmark of the route planner used by /api/agents/{id}/tournee.
+
+Random stops are drawn around a city and the nearest-neighbour tour is
+compared with the 2-opt improved tour: route length and computation time.
+No database is needed.
+
+Usage:
+    python bench_routing.py
+    python bench_routing.py --sizes 100 300 500 --iterations 5
+"""
+import argparse
+import random
+import sys
+import time
+
+import bench_common
+
+sys.path.insert(0, bench_common.BACKEND_DIR)
+import routing  # noqa: E402
+
+# Algiers; stops are drawn up to ~30 km around it
+CENTER = (36.75234, 3.04215)
+
+
+def random_stops(rng, count):
+    return [(CENTER[0] + rng.uniform(-0.3, 0.3), CENTER[1] + rng.uniform(-0.3, 0.3)) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the nearest-neighbour + 2-opt route planner")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 300, 500], help="Number of stops")
+    parser.add_argument("--iterations", type=int, default=3, help="Random routes per size")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--output", default=None, help="Result file (default: results/routing-<date>.json)")
+    parser.add_argument("--compare", default=None, help="Previous result file to compare with")
+    args = parser.parse_args()
+
+    print(f"NumPy: {'yes' if routing.numpy is not None else 'no (pure Python)'}")
+    rng = random.Random(args.seed)
+    results = {}
+    for size in args.sizes:
+        timings = {"nearest neighbour": [], "2-opt": []}
+        lengths = {"nearest neighbour": [], "2-opt": []}
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            points = [CENTER] + random_stops(rng, size)
+
+            start = time.perf_counter()
+            matrix = routing.distance_matrix(points)
+            tour = routing.nearest_neighbour_tour(matrix, len(points))
+            timings["nearest neighbour"].append((time.perf_counter() - start) * 1000)
+            lengths["nearest neighbour"].append(routing.route_length(matrix, tour))
+
+            start = time.perf_counter()
+            tour = routing.two_opt(matrix, tour)
+            # The 2-opt time includes the nearest-neighbour tour it starts from
+            timings["2-opt"].append(timings["nearest neighbour"][-1] + (time.perf_counter() - start) * 1000)
+            lengths["2-opt"].append(routing.route_length(matrix, tour))
+        elapsed = time.perf_counter() - started
+
+        for method in timings:
+            stats = bench_common.summarize(timings[method], elapsed)
+            stats["mean_km"] = round(sum(lengths[method]) / len(lengths[method]), 2)
+            results[f"{method} ({size} stops)"] = stats
+        gain = 1 - results[f"2-opt ({size} stops)"]["mean_km"] / results[f"nearest neighbour ({size} stops)"]["mean_km"]
+        print(f"  {size} stops: nearest neighbour {results[f'nearest neighbour ({size} stops)']['mean_km']} km, "
+              f"2-opt {results[f'2-opt ({size} stops)']['mean_km']} km ({gain:.1%} shorter)")
+
+    print()
+    bench_common.print_table(results)
+    parameters = {"sizes": args.sizes, "iterations": args.iterations, "seed": args.seed,
+                  "numpy": routing.numpy is not None}
+    path = bench_common.save_results("routing", results, parameters, None, args.output)
+    print(f"\nResults saved to {path}")
+
+    if args.compare:
+        regressions = bench_common.compare_results(args.compare, results)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of the request validation (backend/validation.py).
+
+Each check is timed against the way models.py did it before: re.match with
+a string pattern, and datetime.strptime for the dd/mm/yyyy dates. Whole
+models are timed too (ContratForfaitModel, which checks two dates and their
+order), against a copy of the previous model, and a list of passages is
+validated the way a response_model=List[...] or a bulk endpoint does.
+No database is needed.
+
+Usage:
+    python bench_validation.py
+    python bench_validation.py --operations 20000 --iterations 10
+"""
+import argparse
+import datetime
+import random
+import re
+import sys
+import time
+
+from pydantic import BaseModel, validator
+
+import bench_common
+
+sys.path.insert(0, bench_common.BACKEND_DIR)
+import models  # noqa: E402
+import validation  # noqa: E402
+
+
+class PreviousContratForfaitModel(BaseModel):
+    """ContratForfaitModel with the previous validators (dates only, the other checks didn't change)."""
+    date_debut: str
+    date_fin: str
+    montant: int
+    prix_exces_poids: int
+    poids_forfait: int
+    client_id: int
+    etat: str = "Actif"
+
+    @validator('date_debut', 'date_fin')
+    def validate_date_format(cls, v):
+        datetime.datetime.strptime(v, '%d/%m/%Y')
+        return v
+
+    @validator('date_fin')
+    def validate_date_fin_greater(cls, v, values):
+        if 'date_debut' in values:
+            debut = datetime.datetime.strptime(values['date_debut'], '%d/%m/%Y')
+            fin = datetime.datetime.strptime(v, '%d/%m/%Y')
+            if fin <= debut:
+                raise ValueError("fin <= debut")
+        return v
+
+
+def random_dates(rng, count):
+    """Dates of the last three years, as the frontend sends them."""
+    start = datetime.date.today() - datetime.timedelta(days=3 * 365)
+    return [(start + datetime.timedelta(days=rng.randrange(3 * 365))).strftime('%d/%m/%Y') for _ in range(count)]
+
+
+def build_cases(rng, operations):
+    """Name -> (function called once per operation, list of arguments)."""
+    dates = random_dates(rng, operations)
+    phones = [f"05{rng.randrange(10 ** 8):08d}" for _ in range(operations)]
+    gps = [f"{36 + rng.random():.5f}, {3 + rng.random():.5f}" for _ in range(operations)]
+    contracts = []
+    for debut in dates:
+        day = datetime.datetime.strptime(debut, '%d/%m/%Y')
+        contracts.append({"date_debut": debut, "date_fin": (day + datetime.timedelta(days=365)).strftime('%d/%m/%Y'),
+                          "montant": 120000, "prix_exces_poids": 1000, "poids_forfait": 100, "client_id": 1})
+    passages = [{"date": date, "client_id": 1, "montant": 5000, "poids_collecte": 15} for date in dates]
+
+    def parse_uncached(value):
+        return validation.parse_date.__wrapped__(value)
+
+    return {
+        "phone re.match(str)": (lambda v: re.match(r'^0\d{9}$', v), phones),
+        "phone precompiled": (validation.PHONE_PATTERN.match, phones),
+        "gps re.match(str)": (lambda v: re.match(r'^(-?\d+\.\d{5}),\s*(-?\d+\.\d{5})$', v), gps),
+        "gps precompiled": (validation.GPS_PATTERN.match, gps),
+        "date strptime": (lambda v: datetime.datetime.strptime(v, '%d/%m/%Y'), dates),
+        "date manual parser (no cache)": (parse_uncached, dates),
+        "date manual parser (cached)": (validation.parse_date, dates),
+        "ContratForfaitModel previous": (lambda v: PreviousContratForfaitModel(**v), contracts),
+        "ContratForfaitModel": (lambda v: models.ContratForfaitModel(**v), contracts),
+        # One operation = one passage of a list validated in one call
+        "validate_batch BonPassageForfaitModel": (
+            lambda v: validation.validate_batch(models.BonPassageForfaitModel, v), [passages]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the request validation")
+    parser.add_argument("--operations", type=int, default=10000, help="Validations per timed run")
+    parser.add_argument("--iterations", type=int, default=5, help="Timed runs per case")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--output", default=None, help="Result file (default: results/validation-<date>.json)")
+    parser.add_argument("--compare", default=None, help="Previous result file to compare with")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = build_cases(rng, args.operations)
+    results = {}
+    print(f"{'case':<40} {'validations/s':>14}")
+    for name, (function, arguments) in cases.items():
+        # Warm-up run (fills the date cache for the cached case)
+        for argument in arguments:
+            function(argument)
+
+        timings = []
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            for argument in arguments:
+                function(argument)
+            timings.append((time.perf_counter() - start) * 1000)
+        elapsed = time.perf_counter() - started
+
+        stats = bench_common.summarize(timings, elapsed)
+        stats["validations_per_s"] = round(args.operations * args.iterations / elapsed)
+        results[name] = stats
+        print(f"{name:<40} {stats['validations_per_s']:>14,}")
+
+    print()
+    bench_common.print_table(results)
+    parameters = {"operations": args.operations, "iterations": args.iterations, "seed": args.seed}
+    path = bench_common.save_results("validation", results, parameters, None, args.output)
+    print(f"\nResults saved to {path}")
+
+    if args.compare:
+        regressions = bench_common.compare_results(args.compare, results)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
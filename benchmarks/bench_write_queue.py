@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Benchmark of the sustained insert throughput: per-request commit against the
+write queue (backend/group_commit.py).
+
+The create_versement_forfait and create_bon_passage_forfait handlers are
+called in-process by --concurrency requests at a time, as the event loop of
+a worker runs them, with a fresh connection from get_db() each. Every request
+is timed from its call to its committed row. Each mode inserts --inserts rows
+on a scratch copy of the database, prepared as the server does at startup
+(migrations, WAL mode), so the source database is never modified.
+
+The cost of a commit is the sync of the -wal file to disk: run it with --dir
+on the disk of the server, a temporary directory may be in memory.
+
+Usage:
+    python ../database/generate_db.py              # build database/large/db.sqlite once
+    python bench_write_queue.py --inserts 2000 --concurrency 50
+    python bench_write_queue.py --dir /data/tmp --compare results/write_queue-20250101-120000.json
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import bench_common
+
+
+def pick_clients(db_path, count):
+    """Clients with an active contract, and that contract (a passage needs one)."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    rows = conn.execute("SELECT client_id, id FROM Contrat_Forfait WHERE etat = 'Actif' ORDER BY client_id LIMIT ?",
+                        (count,)).fetchall()
+    conn.close()
+    return rows
+
+
+async def run_mode(main, name, make_request, inserts, concurrency):
+    """Call the handler `inserts` times, `concurrency` calls at a time, and summarize the latencies."""
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def client():
+        nonlocal next_index, errors
+        while next_index < inserts:
+            index = next_index
+            next_index += 1
+            db = main.get_db()
+            conn = next(db)
+            start = time.perf_counter()
+            try:
+                await make_request(index, conn)
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception as error:
+                errors += 1
+                print(f"  {name}: {error}")
+            finally:
+                db.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    stats = bench_common.summarize(latencies, time.perf_counter() - started, errors)
+    print(f"  {name}: {stats['throughput_per_s']:.0f} inserts/s, p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Insert throughput: per-request commit against the write queue")
+    parser.add_argument("--db", default=bench_common.DEFAULT_DB_PATH, help="Database to copy for the benchmark")
+    parser.add_argument("--dir", default=None, help="Directory of the scratch copy (default: a temporary directory)")
+    parser.add_argument("--inserts", type=int, default=2000, help="Inserts per handler and mode")
+    parser.add_argument("--concurrency", type=int, default=50, help="Requests running at the same time")
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[0, 2],
+                        help="MAX_WAIT_MS values of the write queue to measure")
+    parser.add_argument("--output", default=None, help="Result file (default: results/write_queue-<date>.json)")
+    parser.add_argument("--compare", default=None, help="Previous result file to compare with")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"Database not found: {args.db} (run database/generate_db.py first)")
+    clients = pick_clients(args.db, 1000)
+    if not clients:
+        sys.exit("No client with an active contract in the database")
+
+    scratch_dir = tempfile.mkdtemp(prefix="vital-bench-", dir=args.dir)
+    scratch_db = os.path.join(scratch_dir, "db.sqlite")
+    print(f"Copying {args.db} to {scratch_db}")
+    shutil.copyfile(args.db, scratch_db)
+    backend = bench_common.load_backend(scratch_db)
+    # Migrations, WAL mode and passage schedule, as the server prepares the database at startup
+    backend.prepare_database()
+    group_commit = backend.group_commit
+
+    def versement(index, conn):
+        client_id, contrat_id = clients[index % len(clients)]
+        model = backend.VersementForfaitModel(date="15/12/2024", montant=1000, client_id=client_id, contrat_id=contrat_id)
+        return backend.create_versement_forfait(versement=model, conn=conn)
+
+    def bon_passage(index, conn):
+        client_id, _ = clients[index % len(clients)]
+        model = backend.BonPassageForfaitModel(date="15/12/2024", client_id=client_id, poids_collecte=120)
+        return backend.create_bon_passage_forfait(bon=model, conn=conn)
+
+    handlers = {"versement_forfait": versement, "bon_passage_forfait": bon_passage}
+    modes = [("per_request_commit", None)] + [(f"write_queue_{wait_ms:g}ms", wait_ms) for wait_ms in args.wait_ms]
+
+    results = {}
+    batches = {}
+    try:
+        for mode, wait_ms in modes:
+            queue = None
+            if wait_ms is not None:
+                queue = group_commit.WriteQueue(backend.connect_db, max_wait_ms=wait_ms)
+                queue.start()
+            backend.write_queue = queue
+            try:
+                for handler, make_request in handlers.items():
+                    name = f"{handler}/{mode}"
+                    results[name] = asyncio.run(run_mode(backend, name, make_request, args.inserts, args.concurrency))
+            finally:
+                backend.write_queue = None
+                if queue is not None:
+                    queue.stop()
+                    batches[mode] = round(queue.writes / queue.batches, 1) if queue.batches else 0
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print()
+    bench_common.print_table(results)
+    for mode, size in batches.items():
+        print(f"{mode}: {size} inserts per commit on average")
+    parameters = {"inserts": args.inserts, "concurrency": args.concurrency, "wait_ms": args.wait_ms,
+                  "inserts_per_commit": batches}
+    path = bench_common.save_results("write_queue", results, parameters, args.db, args.output)
+    print(f"\nResults saved to {path}")
+
+    if args.compare:
+        regressions = bench_common.compare_results(args.compare, results)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+Scripted load test replaying the request sequences of the frontend pages.
+
+Virtual users run in threads, each with its own keep-alive HTTP connection,
+and replay the requests that ClientProfile.jsx and Bon_Achats.jsx send when
+a page is opened (and, with --writes, when a record is saved). The server
+must be started separately against the generated database, for example:
+
+    cd backend
+    VITAL_ENV=DEV VITAL_DB_PATH=../database/large/db.sqlite uvicorn main:app --port 8000
+
+Usage:
+    python load_test.py --url http://127.0.0.1:8000 --concurrency 5 --duration 30
+    python load_test.py --scenario bon_achats --writes --compare results/load-20250101-120000.json
+"""
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+import bench_common
+
+
+class ApiClient:
+    """Minimal JSON client over a persistent HTTP connection (one per virtual user)."""
+
+    def __init__(self, base_url, timeout):
+        parsed = urllib.parse.urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.https = parsed.scheme == "https"
+        self.prefix = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self.connection = None
+
+    def _connect(self):
+        if self.https:
+            self.connection = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        else:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None):
+        """Send a request and return (status, decoded JSON body or None)."""
+        if self.connection is None:
+            self._connect()
+        headers = {"Accept": "application/json"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        try:
+            self.connection.request(method, self.prefix + path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            # Reconnect on the next request
+            self.connection.close()
+            self.connection = None
+            raise
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+
+class Recorder:
+    """Thread-safe collection of request and scenario latencies."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def add(self, name, latency_ms, ok):
+        with self.lock:
+            if ok:
+                self.latencies.setdefault(name, []).append(latency_ms)
+            else:
+                self.errors[name] = self.errors.get(name, 0) + 1
+                self.latencies.setdefault(name, [])
+
+
+def timed_request(client, recorder, name, method, path, body=None):
+    """Send a request and record its latency under `name`. Returns the JSON body."""
+    start = time.perf_counter()
+    try:
+        status, data = client.request(method, path, body)
+        ok = 200 <= status < 300
+    except (http.client.HTTPException, OSError):
+        data = None
+        ok = False
+    recorder.add(name, (time.perf_counter() - start) * 1000, ok)
+    return data if ok else None
+
+
+def scenario_client_profile(client, recorder, rng, ids, writes):
+    """Requests sent by ClientProfile.jsx: page load, opening a bon, optionally saving one."""
+    client_id = rng.choice(ids["clients"])
+    timed_request(client, recorder, "GET /clients/{id}", "GET", f"/api/clients/{client_id}")
+    timed_request(client, recorder, "GET /agents", "GET", "/api/agents")
+    timed_request(client, recorder, "GET /produits", "GET", "/api/produits")
+    timed_request(client, recorder, "GET /services", "GET", "/api/services")
+    bons = timed_request(client, recorder, "GET /clients/{id}/bon-passage-forfait", "GET",
+                         f"/api/clients/{client_id}/bon-passage-forfait")
+    timed_request(client, recorder, "GET /clients/{id}/contrats-forfait", "GET",
+                  f"/api/clients/{client_id}/contrats-forfait")
+    timed_request(client, recorder, "GET /clients/{id}/versements-forfait", "GET",
+                  f"/api/clients/{client_id}/versements-forfait")
+
+    # Open the details of one bon de passage
+    if bons:
+        bon_id = rng.choice(bons)["id"]
+        timed_request(client, recorder, "GET /bon-passage-forfait/{id}/produits", "GET",
+                      f"/api/bon-passage-forfait/{bon_id}/produits")
+        timed_request(client, recorder, "GET /bon-passage-forfait/{id}/services", "GET",
+                      f"/api/bon-passage-forfait/{bon_id}/services")
+
+    # Save a new bon de passage with one product and one service, then refresh the list
+    if writes:
+        new_bon = timed_request(client, recorder, "POST /bon-passage-forfait", "POST", "/api/bon-passage-forfait", {
+            "date": "15/12/2024", "client_id": client_id, "poids_collecte": rng.randint(10, 200)})
+        if new_bon:
+            timed_request(client, recorder, "POST /bon-passage-forfait/{id}/produits", "POST",
+                          f"/api/bon-passage-forfait/{new_bon['id']}/produits", {
+                              "produit": "Sacs jaunes DASRI 30L", "qte": 2.0, "prix": 200,
+                              "bon_passage_id": new_bon["id"]})
+            timed_request(client, recorder, "POST /bon-passage-forfait/{id}/services", "POST",
+                          f"/api/bon-passage-forfait/{new_bon['id']}/services", {
+                              "service": "Collecte de déchets médicaux", "qte": 1.0,
+                              "bon_passage_id": new_bon["id"]})
+            timed_request(client, recorder, "GET /clients/{id}/bon-passage-forfait", "GET",
+                          f"/api/clients/{client_id}/bon-passage-forfait")
+
+
+def scenario_bon_achats(client, recorder, rng, ids, writes):
+    """Requests sent by Bon_Achats.jsx: page load, opening a bon, optionally adding and deleting one."""
+    timed_request(client, recorder, "GET /bon-achats", "GET", "/api/bon-achats")
+    timed_request(client, recorder, "GET /fournisseurs", "GET", "/api/fournisseurs")
+    timed_request(client, recorder, "GET /produits", "GET", "/api/produits")
+
+    # Open the details of one bon d'achat
+    bon_id = rng.choice(ids["bons_achat"])
+    timed_request(client, recorder, "GET /bon-achats/{id}/produits", "GET", f"/api/bon-achats/{bon_id}/produits")
+    timed_request(client, recorder, "GET /bon-achats/{id}/versements", "GET", f"/api/bon-achats/{bon_id}/versements")
+
+    # Add a bon d'achat with a product and a versement, refresh the list, then delete it
+    if writes:
+        new_bon = timed_request(client, recorder, "POST /bon-achats", "POST", "/api/bon-achats", {
+            "date": "15/12/2024", "fournisseur": rng.choice(ids["fournisseurs"]),
+            "montant_total": 4000, "montant_verse": 0})
+        if new_bon:
+            bon_id = new_bon["id"]
+            timed_request(client, recorder, "POST /bon-achats/{id}/produits", "POST",
+                          f"/api/bon-achats/{bon_id}/produits", {
+                              "produit": "Carton DASRI 50L", "qte": 20, "prix": 200, "bon_achat_id": bon_id})
+            timed_request(client, recorder, "POST /bon-achats/{id}/versements", "POST",
+                          f"/api/bon-achats/{bon_id}/versements", {
+                              "montant": 2000, "type": "Espèce", "bon_achat_id": bon_id})
+            timed_request(client, recorder, "GET /bon-achats", "GET", "/api/bon-achats")
+            timed_request(client, recorder, "DELETE /bon-achats/{id}", "DELETE", f"/api/bon-achats/{bon_id}")
+
+
+SCENARIOS = {
+    "client_profile": scenario_client_profile,
+    "bon_achats": scenario_bon_achats
+}
+
+
+def load_ids(base_url, timeout):
+    """Fetch the ids the scenarios pick from (clients, bons d'achat, fournisseurs)."""
+    client = ApiClient(base_url, timeout)
+    status, clients = client.request("GET", "/api/clients")
+    if status != 200 or not clients:
+        sys.exit(f"Cannot load clients from {base_url} (status {status})")
+    status, bons = client.request("GET", "/api/bon-achats")
+    status, fournisseurs = client.request("GET", "/api/fournisseurs")
+    return {
+        "clients": [row["id"] for row in clients],
+        "bons_achat": [row["id"] for row in bons or []] or [1],
+        "fournisseurs": [row["nom"] for row in fournisseurs or []] or ["Fournisseur"]
+    }
+
+
+def virtual_user(user_index, args, ids, recorder, deadline):
+    """Run scenarios in a loop until the deadline (or the iteration count) is reached."""
+    rng = random.Random(args.seed + user_index)
+    client = ApiClient(args.url, args.timeout)
+    scenario_names = list(SCENARIOS.keys()) if args.scenario == "all" else [args.scenario]
+
+    iteration = 0
+    while time.perf_counter() < deadline:
+        if args.iterations and iteration >= args.iterations:
+            break
+        name = scenario_names[iteration % len(scenario_names)]
+        start = time.perf_counter()
+        SCENARIOS[name](client, recorder, rng, ids, args.writes)
+        recorder.add(f"scenario {name}", (time.perf_counter() - start) * 1000, True)
+        iteration += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test replaying the frontend request sequences")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the running backend")
+    parser.add_argument("--scenario", default="all", choices=["all"] + list(SCENARIOS.keys()))
+    parser.add_argument("--concurrency", type=int, default=5, help="Number of virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Test duration in seconds")
+    parser.add_argument("--iterations", type=int, default=0, help="Stop each user after N scenarios (0 = no limit)")
+    parser.add_argument("--writes", action="store_true", help="Also replay the save/delete sequences")
+    parser.add_argument("--timeout", type=float, default=60, help="Request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (same seed = same requests)")
+    parser.add_argument("--db", default=bench_common.DEFAULT_DB_PATH,
+                        help="Database used by the server (only recorded in the result file)")
+    parser.add_argument("--output", default=None, help="Result file (default: results/load-<date>.json)")
+    parser.add_argument("--compare", default=None, help="Previous result file to compare with")
+    args = parser.parse_args()
+
+    ids = load_ids(args.url, args.timeout)
+    recorder = Recorder()
+
+    print(f"Running {args.scenario} with {args.concurrency} users for {args.duration}s against {args.url}")
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=virtual_user, args=(index, args, ids, recorder, deadline))
+               for index in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    all_requests = []
+    for name in sorted(recorder.latencies.keys()):
+        latencies = recorder.latencies[name]
+        results[name] = bench_common.summarize(latencies, elapsed, recorder.errors.get(name, 0))
+        if not name.startswith("scenario "):
+            all_requests.extend(latencies)
+    request_errors = sum(count for name, count in recorder.errors.items() if not name.startswith("scenario "))
+    results["all requests"] = bench_common.summarize(all_requests, elapsed, request_errors)
+
+    print()
+    bench_common.print_table(results)
+    parameters = {"url": args.url, "scenario": args.scenario, "concurrency": args.concurrency,
+                  "duration": args.duration, "iterations": args.iterations, "writes": args.writes,
+                  "seed": args.seed}
+    path = bench_common.save_results("load", results, parameters, args.db, args.output)
+    print(f"\nResults saved to {path}")
+
+    if args.compare:
+        regressions = bench_common.compare_results(args.compare, results)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
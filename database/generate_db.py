@@ -0,0 +1,511 @@
+#!/usr/bin/env python
+"""
+Script to generate a large, realistic SQLite database for load tests and benchmarks.
+
+The generated data is deterministic: the same seed and volumes always produce
+the same database. Rows are produced by generators and written in chunks with
+executemany() inside a single transaction, so millions of rows are built in
+a few minutes without holding them all in memory.
+
+Example (production scale, ~10M rows):
+    python generate_db.py --output large/db.sqlite
+
+Example (small database for a quick check):
+    python generate_db.py --scale 0.01 --output small/db.sqlite
+"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import time
+
+# Number of rows sent to executemany() at once
+CHUNK_SIZE = 50000
+
+# Default volumes (production scale)
+DEFAULT_VOLUMES = {
+    "agents": 40,
+    "fournisseurs": 200,
+    "clients": 10000,
+    "contracts": 100000,
+    "passages": 3000000,
+    "versements": 400000,
+    "bons_achat": 300000
+}
+
+# The schema is built by the migrations of database/migrations (backend/migrations.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+import migrations
+
+# Migrations applied before the bulk load: the tables of the data, without the triggers and
+# indexes of the later ones, applied after the load as on an existing database
+BULK_LOAD_VERSION = 5
+
+# Vocabulary used to build realistic names
+PRENOMS = ['Ahmed', 'Mohamed', 'Karim', 'Samira', 'Yacine', 'Amina', 'Nadia', 'Rachid', 'Sofiane', 'Lynda',
+           'Mourad', 'Fatima', 'Bilal', 'Imane', 'Walid', 'Sarah', 'Hichem', 'Meriem', 'Nassim', 'Khadidja']
+NOMS = ['Kader', 'Boumediene', 'Benali', 'Haddad', 'Mansouri', 'Belkacem', 'Brahimi', 'Cherif', 'Djebbar',
+        'Ferhat', 'Guerroudj', 'Hamidi', 'Khelifi', 'Larbi', 'Meziane', 'Ouali', 'Rahmani', 'Saadi',
+        'Taleb', 'Zerrouki', 'Bouzid', 'Amrani', 'Benaissa', 'Chaoui', 'Djaballah']
+
+# (latitude, longitude, name) of the main Algerian cities
+VILLES = [
+    (36.75234, 3.04215, 'Alger'), (35.69906, -0.63475, 'Oran'), (36.36752, 6.61290, 'Constantine'),
+    (36.19112, 5.41373, 'Sétif'), (36.90000, 7.76667, 'Annaba'), (36.47004, 2.82770, 'Blida'),
+    (35.55597, 6.17414, 'Batna'), (36.75587, 5.08433, 'Béjaïa'), (36.71182, 4.04591, 'Tizi Ouzou'),
+    (34.88333, -1.31667, 'Tlemcen'), (35.40417, 8.12417, 'Tébessa'), (34.85038, 5.72805, 'Biskra')
+]
+
+# (type of establishment, specialite) for clients producing medical / industrial waste
+ETABLISSEMENTS = [
+    ('Clinique', 'Santé'), ('Cabinet dentaire', 'Dentisterie'), ('Laboratoire', "Analyses médicales"),
+    ('Pharmacie', 'Pharmacie'), ('Cabinet médical', 'Médecine générale'), ('Centre de radiologie', 'Radiologie'),
+    ('Clinique vétérinaire', 'Vétérinaire'), ('Centre d\'hémodialyse', 'Néphrologie'),
+    ('Usine', 'Industrie'), ('Atelier', 'Mécanique'), ('Hôtel', 'Hôtellerie'), ('Restaurant', 'Restauration')
+]
+
+RUES = ['Rue Didouche Mourad', 'Boulevard Zighout Youcef', 'Rue des Frères Bouadou', 'Avenue Hassiba Ben Bouali',
+        'Rue Larbi Ben M\'hidi', 'Boulevard Mohamed V', 'Rue Abane Ramdane', 'Avenue de l\'ALN']
+
+PRODUITS = ['Conteneur pour déchets 240L', 'Sacs poubelle industriels 100L', 'Kit de nettoyage professionnel',
+            'Boîte à aiguilles 1L', 'Boîte à aiguilles 5L', 'Carton DASRI 50L', 'Fût plastique 60L',
+            'Sacs jaunes DASRI 30L', 'Gants de protection', 'Collecteur de piquants 3L',
+            'Désinfectant de surface 5L', 'Conteneur pour déchets 660L']
+
+SERVICES = [('Collecte de déchets industriels', 'Non'), ('Nettoyage et assainissement', 'Non'),
+            ('Conseil en gestion des déchets', 'Oui'), ('Incinération DASRI', 'Oui'),
+            ('Collecte de déchets médicaux', 'Oui'), ('Destruction d\'archives', 'Oui')]
+
+# Probability of each collection mode (days between passages)
+MODES = [30, 60, 90]
+MODE_WEIGHTS = [0.55, 0.30, 0.15]
+
+# Possible contract durations in months and their probability
+DUREES_MOIS = [3, 6, 12]
+DUREES_WEIGHTS = [0.2, 0.5, 0.3]
+
+# Cache of formatted dates (dd/mm/yyyy), indexed by date ordinal
+_date_cache = {}
+
+
+def format_date(ordinal):
+    """Format a date ordinal as dd/mm/yyyy (cached, this is called millions of times)."""
+    text = _date_cache.get(ordinal)
+    if text is None:
+        text = datetime.date.fromordinal(ordinal).strftime('%d/%m/%Y')
+        _date_cache[ordinal] = text
+    return text
+
+
+def add_months(day, months):
+    """Return the first day of the month `months` months after `day`'s month."""
+    month_index = day.year * 12 + (day.month - 1) + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def allocate(total, weights):
+    """Split `total` items across entries proportionally to `weights`.
+
+    Uses cumulative rounding so the result always sums to exactly `total`."""
+    weight_sum = sum(weights)
+    counts = []
+    cumulative = 0.0
+    emitted = 0
+    for weight in weights:
+        cumulative += total * weight / weight_sum
+        count = int(cumulative) - emitted
+        counts.append(count)
+        emitted += count
+    # Give the rounding leftover (at most 1) to the last entry
+    if counts:
+        counts[-1] += total - emitted
+    return counts
+
+
+def insert_chunked(cursor, sql, rows):
+    """Insert rows coming from a generator in chunks of CHUNK_SIZE."""
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            cursor.executemany(sql, chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        cursor.executemany(sql, chunk)
+        count += len(chunk)
+    return count
+
+
+def phone_number(rng, used):
+    """Generate a unique Algerian mobile number (05, 06 or 07 followed by 8 digits)."""
+    while True:
+        number = rng.choice(['05', '06', '07']) + f"{rng.randrange(10 ** 8):08d}"
+        if number not in used:
+            used.add(number)
+            return number
+
+
+def generate_agents(rng, count):
+    """Generate agents spread around the main cities."""
+    used_phones = set()
+    agents = []
+    for agent_id in range(1, count + 1):
+        lat, lng, _ = VILLES[(agent_id - 1) % len(VILLES)]
+        nom = f"{rng.choice(PRENOMS)} {rng.choice(NOMS)} {agent_id}"
+        telephone = phone_number(rng, used_phones)
+        # Agents are located up to ~20 km around their city; the id keeps GPS values unique
+        gps = f"{lat + rng.uniform(-0.2, 0.2) + agent_id * 1e-5:.5f}, {lng + rng.uniform(-0.2, 0.2):.5f}"
+        regime = rng.choices(['Forfait', 'Réel', 'Forfait & Réel'], [0.6, 0.1, 0.3])[0]
+        notification = rng.choices(['Actif', 'Pause'], [0.85, 0.15])[0]
+        agents.append((agent_id, nom, telephone, telephone, gps, regime, notification))
+    return agents
+
+
+def generate_fournisseurs(rng, count):
+    """Generate suppliers with unique names and phone numbers."""
+    used_phones = set()
+    suffixes = ['SARL', 'EURL', 'SPA', 'Algérie', 'Maghreb', 'Services']
+    fournisseurs = []
+    for fournisseur_id in range(1, count + 1):
+        _, _, ville = rng.choice(VILLES)
+        nom = f"{rng.choice(['Eco', 'Green', 'Enviro', 'Recycl', 'Medi', 'Bio'])}{rng.choice(NOMS)} " \
+              f"{rng.choice(suffixes)} {fournisseur_id}"
+        adresse = f"{rng.randint(1, 120)} {rng.choice(RUES)}, {ville}"
+        fournisseurs.append((fournisseur_id, nom, phone_number(rng, used_phones), adresse))
+    return fournisseurs
+
+
+def generate_clients_and_contracts(rng, agents, client_count, contract_count, today):
+    """Generate clients and their successive contracts.
+
+    Each client gets a chain of consecutive contracts ending around `today`.
+    The last contract is usually 'Actif' (sometimes 'Pause' or 'Terminé'),
+    older ones are 'Terminé', and the client row mirrors the current contract.
+
+    Contracts always start on the 1st of a month and end on the last day of a
+    month, so that the text CHECK (date_fin > date_debut) holds for dd/mm/yyyy.
+    """
+    # Each client has at least one contract; the rest is spread randomly
+    contracts_per_client = [1] * client_count
+    for _ in range(contract_count - client_count):
+        contracts_per_client[rng.randrange(client_count)] += 1
+
+    # Agents are placed city by city (see generate_agents)
+    agents_by_city = {}
+    for agent in agents:
+        agents_by_city.setdefault((agent[0] - 1) % len(VILLES), []).append(agent)
+
+    clients = []
+    contracts = []
+    contract_id = 0
+    for client_index in range(client_count):
+        client_id = client_index + 1
+        etablissement, specialite = rng.choice(ETABLISSEMENTS)
+        city_index = rng.randrange(len(VILLES))
+        lat, lng, ville = VILLES[city_index]
+        nom = f"{etablissement} {rng.choice(NOMS)} {ville} {client_id}"
+        # Clients are located up to ~15 km around their city
+        gps = f"{lat + rng.uniform(-0.15, 0.15):.5f}, {lng + rng.uniform(-0.15, 0.15):.5f}"
+        tel = '0' + f"{rng.randrange(10 ** 9):09d}" if rng.random() < 0.7 else '0' + f"{rng.randrange(10 ** 8):08d}"
+        mode = rng.choices(MODES, MODE_WEIGHTS)[0]
+        # Clients are visited by an agent of their city when there is one
+        agent = rng.choice(agents_by_city.get(city_index, agents))[1]
+
+        # Build the chain of contracts backwards from the current month
+        chain = []
+        end_month = add_months(today, rng.randint(0, 6))
+        for _ in range(contracts_per_client[client_index]):
+            months = rng.choices(DUREES_MOIS, DUREES_WEIGHTS)[0]
+            debut = add_months(end_month, -months)
+            fin = end_month - datetime.timedelta(days=1)
+            chain.append((debut, fin, months))
+            end_month = debut
+        chain.reverse()
+
+        # State of the last contract
+        etat_courant = rng.choices(['Actif', 'Pause', 'Terminé'], [0.8, 0.08, 0.12])[0]
+        poids_forfait = rng.choice([20, 50, 100, 150, 200])
+        prix_exces_poids = rng.choice([100, 200, 300, 500])
+        for position, (debut, fin, months) in enumerate(chain):
+            contract_id += 1
+            etat = etat_courant if position == len(chain) - 1 else 'Terminé'
+            # Monthly price depends on the weight included in the forfait
+            montant = int(poids_forfait * rng.uniform(80, 120)) * months
+            contracts.append((contract_id, debut.toordinal(), fin.toordinal(), montant, prix_exces_poids,
+                              poids_forfait, etat, client_id, mode))
+
+        if etat_courant == 'Terminé':
+            client_row = (client_id, nom, specialite, tel, mode, agent, None, None, None, gps)
+        else:
+            debut, fin, _ = chain[-1]
+            client_row = (client_id, nom, specialite, tel, mode, agent, etat_courant,
+                          debut.strftime('%d/%m/%Y'), fin.strftime('%d/%m/%Y'), gps)
+        clients.append(client_row)
+
+    return clients, contracts
+
+
+def generate_passages(rng, contracts, passage_count, today_ordinal, produit_prices, services):
+    """Generate bons de passage with their product and service lines.
+
+    Passages are spread over contracts proportionally to (contract length / mode),
+    dated at a regular cadence inside each contract, and never in the future.
+    Yields ('passage' | 'produit' | 'service', row) tuples.
+    """
+    weights = [(contract[2] - contract[1]) / contract[8] for contract in contracts]
+    counts = allocate(passage_count, weights)
+    produit_names = list(produit_prices.keys())
+
+    passage_id = 0
+    for contract, count in zip(contracts, counts):
+        if count == 0:
+            continue
+        contract_id, debut, fin, _, prix_exces_poids, poids_forfait, _, client_id, _ = contract
+        last_day = min(fin, today_ordinal)
+        if last_day < debut:
+            last_day = debut
+        step = max(1, (last_day - debut) // count)
+
+        for index in range(count):
+            passage_id += 1
+            day = min(debut + index * step + rng.randint(0, 3), last_day)
+            # Collected weight is around the forfait, sometimes above it
+            poids_collecte = max(1, int(rng.gauss(poids_forfait * 0.9, poids_forfait * 0.25)))
+            exces_poids = max(0, poids_collecte - poids_forfait)
+            montant = exces_poids * prix_exces_poids
+            yield 'passage', (passage_id, format_date(day), montant, exces_poids, poids_collecte,
+                              client_id, contract_id)
+
+            # About a third of the passages deliver products (bags, containers, ...)
+            if rng.random() < 0.35:
+                for _ in range(rng.randint(1, 3)):
+                    produit = rng.choice(produit_names)
+                    yield 'produit', (produit, float(rng.randint(1, 20)), produit_prices[produit], passage_id)
+
+            # Most passages record at least one service
+            if rng.random() < 0.6:
+                for _ in range(rng.randint(1, 2)):
+                    service = rng.choice(services)[0]
+                    qte = float(rng.randint(1, 5)) if rng.random() < 0.7 else None
+                    yield 'service', (service, qte, passage_id)
+
+
+def generate_versements(rng, contracts, versement_count, today_ordinal):
+    """Generate payments on contracts, proportionally to the contract amount."""
+    weights = [contract[3] for contract in contracts]
+    counts = allocate(versement_count, weights)
+
+    for contract, count in zip(contracts, counts):
+        if count == 0:
+            continue
+        contract_id, debut, fin, montant, _, _, _, client_id, _ = contract
+        last_day = min(fin, today_ordinal)
+        if last_day < debut:
+            last_day = debut
+        # Most clients pay the full amount, some are behind
+        total_paye = int(montant * rng.choices([1.0, 0.75, 0.5], [0.7, 0.2, 0.1])[0])
+        part = max(1, total_paye // count)
+        for _ in range(count):
+            day = rng.randint(debut, last_day)
+            yield (format_date(day), part, client_id, contract_id)
+
+
+def generate_bons_achat(rng, bon_count, fournisseurs, produit_prices, first_ordinal, today_ordinal):
+    """Generate purchase orders with product lines and payments.
+
+    Yields ('bon' | 'produit' | 'versement', row) tuples.
+    """
+    produit_names = list(produit_prices.keys())
+    for bon_id in range(1, bon_count + 1):
+        fournisseur = rng.choice(fournisseurs)[1]
+        day = rng.randint(first_ordinal, today_ordinal)
+
+        montant_total = 0.0
+        lines = []
+        for _ in range(rng.randint(1, 5)):
+            produit = rng.choice(produit_names)
+            qte = rng.randint(1, 50)
+            # Prices vary a little over time; about 5% of the lines have no price
+            if rng.random() < 0.05:
+                prix = None
+            else:
+                prix = round(produit_prices[produit] * rng.uniform(0.8, 1.2), 2)
+                montant_total += qte * prix
+            lines.append((produit, qte, prix, bon_id))
+
+        # Payments: paid in full, partially, or not yet
+        versements = []
+        montant_verse = 0.0
+        statut = rng.choices(['paye', 'partiel', 'impaye'], [0.6, 0.25, 0.15])[0]
+        if montant_total > 0 and statut != 'impaye':
+            a_payer = montant_total if statut == 'paye' else round(montant_total * rng.uniform(0.2, 0.8), 2)
+            tranches = rng.randint(1, 3)
+            for index in range(tranches):
+                montant = round(a_payer / tranches, 2)
+                if montant <= 0:
+                    continue
+                type_versement = rng.choices(['Chèque', 'Espèce'], [0.6, 0.4])[0]
+                versements.append((montant, type_versement, bon_id))
+                montant_verse += montant
+
+        yield 'bon', (bon_id, format_date(day), fournisseur, round(montant_total, 2), round(montant_verse, 2))
+        for line in lines:
+            yield 'produit', line
+        for versement in versements:
+            yield 'versement', versement
+
+
+def insert_mixed(cursor, rows, statements):
+    """Insert a stream of (kind, row) tuples into several tables, in chunks.
+
+    Parent rows of a chunk are always written before their child rows."""
+    counts = {kind: 0 for kind in statements}
+    chunks = {kind: [] for kind in statements}
+    order = list(statements.keys())
+    pending = 0
+
+    def flush():
+        for kind in order:
+            if chunks[kind]:
+                cursor.executemany(statements[kind], chunks[kind])
+                counts[kind] += len(chunks[kind])
+                chunks[kind] = []
+
+    for kind, row in rows:
+        chunks[kind].append(row)
+        pending += 1
+        if pending >= CHUNK_SIZE:
+            flush()
+            pending = 0
+    flush()
+    return counts
+
+
+def generate_database(output, volumes, seed, today):
+    """Create the database file `output` with the given volumes."""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    if os.path.exists(output):
+        os.remove(output)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    conn = sqlite3.connect(output)
+    cursor = conn.cursor()
+
+    # Fast bulk loading: no journal, no fsync (the file is rebuilt from scratch anyway)
+    cursor.execute('PRAGMA journal_mode = OFF')
+    cursor.execute('PRAGMA synchronous = OFF')
+    cursor.execute('PRAGMA cache_size = -200000')
+    cursor.execute('PRAGMA temp_store = MEMORY')
+
+    migrations.migrate(conn, target=BULK_LOAD_VERSION)
+
+    cursor.execute('BEGIN')
+
+    # Reference data
+    agents = generate_agents(rng, volumes['agents'])
+    # lat/lng and the spatial index are filled from gps when the backend starts
+    cursor.executemany('INSERT INTO Agents (id, nom, telephone, whatsapp, gps, regime, notification) '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?)', agents)
+
+    cursor.executemany('INSERT INTO Produit (id, designation) VALUES (?, ?)',
+                       [(index + 1, produit) for index, produit in enumerate(PRODUITS)])
+    cursor.executemany('INSERT INTO Service (id, designation, incineration) VALUES (?, ?, ?)',
+                       [(index + 1, service[0], service[1]) for index, service in enumerate(SERVICES)])
+    produit_prices = {produit: rng.choice([150, 200, 500, 1200, 3000, 8000, 15000]) for produit in PRODUITS}
+
+    fournisseurs = generate_fournisseurs(rng, volumes['fournisseurs'])
+    cursor.executemany('INSERT INTO Fournisseur VALUES (?, ?, ?, ?)', fournisseurs)
+
+    # Clients and contracts
+    clients, contracts = generate_clients_and_contracts(
+        rng, agents, volumes['clients'], max(volumes['contracts'], volumes['clients']), today)
+    cursor.executemany('INSERT INTO Client_Forfait (id, nom, specialite, tel, mode, agent, etat_contrat, '
+                       'debut_contrat, fin_contrat, gps) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', clients)
+    insert_chunked(cursor, '''
+        INSERT INTO Contrat_Forfait (id, date_debut, date_fin, montant, prix_exces_poids, poids_forfait, etat, client_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', ((c[0], format_date(c[1]), format_date(c[2]), c[3], c[4], c[5], c[6], c[7]) for c in contracts))
+    print(f"  {len(clients)} clients, {len(contracts)} contrats")
+
+    today_ordinal = today.toordinal()
+
+    # Bons de passage with their lines
+    counts = insert_mixed(cursor, generate_passages(rng, contracts, volumes['passages'], today_ordinal,
+                                                    produit_prices, SERVICES), {
+        'passage': '''INSERT INTO Bon_Passage_Forfait (id, date, montant, exces_poids, poids_collecte, client_id, contrat_id)
+                      VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        'produit': '''INSERT INTO Bon_Passage_Forfait_Produits (produit, qte, prix, bon_passage_id)
+                      VALUES (?, ?, ?, ?)''',
+        'service': '''INSERT INTO Bon_Passage_Forfait_Services (service, qte, bon_passage_id)
+                      VALUES (?, ?, ?)'''
+    })
+    print(f"  {counts['passage']} bons de passage, {counts['produit']} lignes produit, "
+          f"{counts['service']} lignes service")
+
+    # Versements forfait
+    count = insert_chunked(cursor, '''
+        INSERT INTO Versement_Forfait (date, montant, client_id, contrat_id) VALUES (?, ?, ?, ?)
+    ''', generate_versements(rng, contracts, volumes['versements'], today_ordinal))
+    print(f"  {count} versements forfait")
+
+    # Bons d'achat with their lines and payments, over the last 5 years
+    first_ordinal = today_ordinal - 5 * 365
+    counts = insert_mixed(cursor, generate_bons_achat(rng, volumes['bons_achat'], fournisseurs, produit_prices,
+                                                      first_ordinal, today_ordinal), {
+        'bon': '''INSERT INTO Bon_Achats (id, date, fournisseur, montant_total, montant_verse)
+                  VALUES (?, ?, ?, ?, ?)''',
+        'produit': '''INSERT INTO Produits_Bon_Achat (produit, qte, prix, bon_achat_id) VALUES (?, ?, ?, ?)''',
+        'versement': '''INSERT INTO Versement_Bon_Achat (montant, type, bon_achat_id) VALUES (?, ?, ?)'''
+    })
+    print(f"  {counts['bon']} bons d'achat, {counts['produit']} lignes produit, {counts['versement']} versements")
+
+    # Inventory is the total purchased quantity per product, with the last known price
+    cursor.execute('''
+        INSERT INTO Inventaire (produit, qte, prix_dernier)
+        SELECT produit, SUM(qte), MAX(prix) FROM Produits_Bon_Achat
+        WHERE prix IS NOT NULL GROUP BY produit
+    ''')
+
+    conn.commit()
+
+    # The other migrations build their indexes and derived tables from the loaded data. Their backfills
+    # (positions, search index) run when the backend starts
+    applied = migrations.migrate(conn)
+    print(f"  Migrations applied after loading: {applied}")
+    conn.close()
+
+    print(f"Database created successfully at {output} in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a large synthetic VITALECOSYSTEM database")
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          'large', 'db.sqlite'),
+                        help="Path of the database file to create (overwritten)")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed (same seed = same database)")
+    parser.add_argument('--today', default='01/01/2025',
+                        help="Reference date dd/mm/yyyy: current contracts run around this date")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiply every default volume by this factor")
+    for name, value in DEFAULT_VOLUMES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=None,
+                            help=f"Number of {name} (default {value} x scale)")
+    args = parser.parse_args()
+
+    volumes = {}
+    for name, value in DEFAULT_VOLUMES.items():
+        explicit = getattr(args, name)
+        volumes[name] = explicit if explicit is not None else max(1, int(value * args.scale))
+
+    today = datetime.datetime.strptime(args.today, '%d/%m/%Y').date()
+    print(f"Generating database with volumes: {volumes}")
+    generate_database(args.output, volumes, args.seed, today)
+
+
+if __name__ == '__main__':
+    main()
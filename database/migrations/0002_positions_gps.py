@@ -0,0 +1,56 @@
+"""GPS position of the clients, numeric lat/lng columns and their spatial index.
+
+The lat/lng columns of the existing clients are filled by the backfill, in
+batches, so that the migration of a large Client_Forfait table doesn't delay
+the startup.
+"""
+
+import sqlite3
+
+from migrations import add_column
+
+# Latitude and longitude parsed from the "lat, lng" text of the gps column
+_LAT = "CAST(trim(substr(gps, 1, instr(gps, ',') - 1)) AS REAL)"
+_LNG = "CAST(trim(substr(gps, instr(gps, ',') + 1)) AS REAL)"
+
+
+def up(cursor):
+    add_column(cursor, "Client_Forfait", "gps", "TEXT")
+    for table in ["Agents", "Client_Forfait"]:
+        add_column(cursor, table, "lat", "REAL")
+        add_column(cursor, table, "lng", "REAL")
+
+    for table, geo_table in [("Agents", "Agents_Geo"), ("Client_Forfait", "Clients_Geo")]:
+        try:
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {geo_table} "
+                           "USING rtree(id, min_lat, max_lat, min_lng, max_lng)")
+        except sqlite3.OperationalError:
+            # SQLite built without R*Tree: index the numeric columns instead
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table.lower()}_lat_lng ON {table} (lat, lng)")
+
+
+def backfill(cursor, last_id, batch_size):
+    if last_id == 0:
+        # There are only a few agents: they are indexed with the first batch
+        _index_positions(cursor, "Agents", "Agents_Geo", "1 = 1")
+    cursor.execute("SELECT id FROM Client_Forfait WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+    ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        return None
+    _index_positions(cursor, "Client_Forfait", "Clients_Geo", "id BETWEEN ? AND ?", (ids[0], ids[-1]))
+    return ids[-1]
+
+
+def _index_positions(cursor, table, geo_table, condition, parameters=()):
+    """Fill lat/lng from gps and the R*Tree entries of the rows matching `condition`."""
+    cursor.execute(f"""
+        UPDATE {table} SET lat = {_LAT}, lng = {_LNG}
+        WHERE {condition} AND lat IS NULL AND instr(gps, ',') > 0
+    """, parameters)
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (geo_table,))
+    if cursor.fetchone() is not None:
+        cursor.execute(f"DELETE FROM {geo_table} WHERE {condition}", parameters)
+        cursor.execute(f"""
+            INSERT INTO {geo_table} (id, min_lat, max_lat, min_lng, max_lng)
+            SELECT id, lat, lat, lng, lng FROM {table} WHERE {condition} AND lat IS NOT NULL
+        """, parameters)
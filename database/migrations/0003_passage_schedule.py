@@ -0,0 +1,24 @@
+"""Passage_Schedule: next passage due of every active contract (see scheduling.py).
+
+The table is filled by the backend at startup when it is empty.
+"""
+
+
+def up(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Passage_Schedule (
+            contrat_id INTEGER PRIMARY KEY,
+            client_id INTEGER NOT NULL,
+            agent TEXT NOT NULL,
+            mode INTEGER NOT NULL,
+            dernier_passage TEXT,
+            prochain_passage TEXT NOT NULL,
+            fin_contrat TEXT NOT NULL,
+            FOREIGN KEY (contrat_id) REFERENCES Contrat_Forfait(id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedule_agent_prochain ON Passage_Schedule (agent, prochain_passage)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedule_prochain ON Passage_Schedule (prochain_passage)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedule_client ON Passage_Schedule (client_id)")
+    # Needed to find the last passage of a contract without scanning all passages
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bon_passage_contrat ON Bon_Passage_Forfait (contrat_id)")
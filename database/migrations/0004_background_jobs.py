@@ -0,0 +1,23 @@
+"""Job_State (leases of the background jobs) and the index of the open contracts by end date."""
+
+
+def up(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Job_State (
+            name TEXT PRIMARY KEY,
+            owner TEXT,
+            lease_expires_at REAL NOT NULL DEFAULT 0,
+            next_run_at REAL NOT NULL DEFAULT 0,
+            last_started_at REAL,
+            last_finished_at REAL,
+            last_status TEXT,
+            last_result TEXT,
+            last_error TEXT
+        )
+    """)
+    # ISO form of date_fin, written exactly like the queries of contract_expiry.py
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_contrat_fin_ouvert
+        ON Contrat_Forfait ((substr(date_fin, 7, 4) || '-' || substr(date_fin, 4, 2) || '-' || substr(date_fin, 1, 2)))
+        WHERE etat IN ('Actif', 'Pause')
+    """)
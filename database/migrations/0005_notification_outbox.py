@@ -0,0 +1,22 @@
+"""Notification_Outbox: WhatsApp notifications waiting to be sent (see notifications.py)."""
+
+
+def up(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Notification_Outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            agent_id INTEGER,
+            recipient TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            dedup_key TEXT UNIQUE,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sent', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON Notification_Outbox (next_attempt_at) "
+                   "WHERE status = 'pending'")
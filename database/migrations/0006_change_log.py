@@ -0,0 +1,53 @@
+"""Change_Log: one row per change of a business table, for the /api/events feed.
+
+Triggers write the log in the same transaction as the change, so every write
+is logged (request handlers, background jobs, cascades) and a rolled back
+write is not. The id of a log row is the version sent with the event.
+
+The UPDATE triggers watch every column except lat/lng, which only mirror the
+gps column. A later migration adding a column to these tables must recreate
+their UPDATE trigger.
+"""
+
+TABLES = ["Agents", "Produit", "Service", "Inventaire", "Fournisseur", "Bon_Achats", "Produits_Bon_Achat",
+          "Versement_Bon_Achat", "Client_Forfait", "Contrat_Forfait", "Bon_Passage_Forfait",
+          "Bon_Passage_Forfait_Produits", "Bon_Passage_Forfait_Services", "Versement_Forfait"]
+
+# Derived columns, rewritten by the spatial index
+IGNORED_COLUMNS = ["lat", "lng"]
+
+
+def up(cursor):
+    # AUTOINCREMENT: ids of purged rows are never reused, clients resume from their last id
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Change_Log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+            created_at REAL NOT NULL DEFAULT ((julianday('now') - 2440587.5) * 86400.0)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_created ON Change_Log (created_at)")
+
+    for table in TABLES:
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = [row[1] for row in cursor.fetchall() if row[1] not in IGNORED_COLUMNS]
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_{table.lower()}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO Change_Log (table_name, row_id, op) VALUES ('{table}', NEW.id, 'insert');
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_{table.lower()}_update AFTER UPDATE OF {', '.join(columns)} ON {table}
+            BEGIN
+                INSERT INTO Change_Log (table_name, row_id, op) VALUES ('{table}', NEW.id, 'update');
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_{table.lower()}_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO Change_Log (table_name, row_id, op) VALUES ('{table}', OLD.id, 'delete');
+            END
+        """)
@@ -0,0 +1,86 @@
+"""Full-text search index (FTS5) over the clients, fournisseurs, produits and services.
+
+One FTS5 table, Recherche, holds a title and details per record. The rowid
+encodes the source: source id * 4 + the type number of TYPES, so triggers
+find the entry of a record without scanning the index. The unicode61
+tokenizer folds case and accents ("algerie" finds "Algérie") and the
+prefix index answers the "alg*" queries of search-as-you-type.
+
+Triggers keep the index in sync in the same transaction as the change. The
+existing records are indexed by the backfill, in batches.
+"""
+
+import sqlite3
+
+# type: (number in the rowid, table, title column, details expression, indexed columns)
+TYPES = {
+    "client": (0, "Client_Forfait", "nom", "COALESCE({row}specialite, '')", "nom, specialite"),
+    "fournisseur": (1, "Fournisseur", "nom", "COALESCE({row}adresse, '') || ' ' || COALESCE({row}telephone, '')",
+                    "nom, adresse, telephone"),
+    "produit": (2, "Produit", "designation", "''", "designation"),
+    "service": (3, "Service", "designation", "''", "designation"),
+}
+
+
+def up(cursor):
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS Recherche USING fts5(
+                titre, details,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        """)
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: /api/search falls back to LIKE queries
+        return
+
+    for number, table, title, details, columns in TYPES.values():
+        new_details = details.format(row="NEW.")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS recherche_{table.lower()}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO Recherche (rowid, titre, details) VALUES (NEW.id * 4 + {number}, NEW.{title}, {new_details});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS recherche_{table.lower()}_update AFTER UPDATE OF {columns} ON {table}
+            BEGIN
+                DELETE FROM Recherche WHERE rowid = OLD.id * 4 + {number};
+                INSERT INTO Recherche (rowid, titre, details) VALUES (NEW.id * 4 + {number}, NEW.{title}, {new_details});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS recherche_{table.lower()}_delete AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM Recherche WHERE rowid = OLD.id * 4 + {number};
+            END
+        """)
+
+
+def backfill(cursor, last_id, batch_size):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'Recherche'")
+    if cursor.fetchone() is None:
+        return None
+    if last_id == 0:
+        # Fournisseurs, produits and services are short lists: indexed with the first batch
+        for name in ["fournisseur", "produit", "service"]:
+            _index_rows(cursor, name, "1 = 1")
+    cursor.execute("SELECT id FROM Client_Forfait WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+    ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        return None
+    _index_rows(cursor, "client", "id BETWEEN ? AND ?", (ids[0], ids[-1]))
+    return ids[-1]
+
+
+def _index_rows(cursor, name, condition, parameters=()):
+    """(Re)index the records of one type matching `condition`."""
+    number, table, title, details, _ = TYPES[name]
+    # Records created since the migration are already indexed by the triggers
+    cursor.execute(f"DELETE FROM Recherche WHERE rowid IN (SELECT id * 4 + {number} FROM {table} WHERE {condition})",
+                   parameters)
+    cursor.execute(f"""
+        INSERT INTO Recherche (rowid, titre, details)
+        SELECT id * 4 + {number}, {title}, {details.format(row='')} FROM {table} WHERE {condition}
+    """, parameters)
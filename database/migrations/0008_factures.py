@@ -0,0 +1,57 @@
+"""Monthly invoices of the forfait contracts.
+
+Facturation holds one row per billed month (periode "yyyy-mm") with the
+progress of its run, so that a run interrupted by a crash resumes where it
+stopped. Facture has one invoice per contract and month (UNIQUE, so a batch
+repeated after a crash can't bill a contract twice) and Facture_Ligne its
+lines. pdf_path stays NULL until the PDF is written.
+"""
+
+
+def up(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Facturation (
+            periode TEXT PRIMARY KEY,
+            etat TEXT NOT NULL DEFAULT 'en_cours' CHECK (etat IN ('en_cours', 'terminee')),
+            dernier_contrat_id INTEGER NOT NULL DEFAULT 0,
+            nombre_factures INTEGER NOT NULL DEFAULT 0,
+            debut REAL NOT NULL,
+            fin REAL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Facture (
+            id INTEGER PRIMARY KEY,
+            numero TEXT NOT NULL UNIQUE,
+            periode TEXT NOT NULL,
+            date_emission TEXT NOT NULL,
+            contrat_id INTEGER NOT NULL,
+            client_id INTEGER NOT NULL,
+            montant_forfait INTEGER NOT NULL,
+            montant_exces INTEGER NOT NULL,
+            montant_produits INTEGER NOT NULL,
+            montant_total INTEGER NOT NULL,
+            pdf_path TEXT,
+            UNIQUE (contrat_id, periode),
+            FOREIGN KEY (contrat_id) REFERENCES Contrat_Forfait(id),
+            FOREIGN KEY (client_id) REFERENCES Client_Forfait(id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Facture_Ligne (
+            id INTEGER PRIMARY KEY,
+            facture_id INTEGER NOT NULL,
+            designation TEXT NOT NULL,
+            qte REAL NOT NULL,
+            prix_unitaire INTEGER NOT NULL,
+            montant INTEGER NOT NULL,
+            FOREIGN KEY (facture_id) REFERENCES Facture(id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_facture_client ON Facture (client_id, periode)")
+    # PDFs still to write, per month
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_facture_sans_pdf ON Facture (periode, id) WHERE pdf_path IS NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_facture_ligne_facture ON Facture_Ligne (facture_id)")
+    # Product lines of the passages of a batch of contracts
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bon_passage_produits_bon "
+                   "ON Bon_Passage_Forfait_Produits (bon_passage_id)")
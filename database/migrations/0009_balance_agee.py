@@ -0,0 +1,27 @@
+"""Indexes of the aged balance report (see backend/receivables.py).
+
+The dates are stored as dd/mm/yyyy text, which doesn't sort. These indexes
+are on the ISO form of the dates, the expression of scheduling.iso_date_sql:
+SQLite uses an index on an expression only for queries written with the same
+expression. They hold the amounts too, so the report reads only the indexes.
+
+- per client: the amounts charged or paid up to a date;
+- per date: the passages of the last 90 days, without reading the older ones.
+The passages without an amount (no excess weight) are left out.
+"""
+
+
+def _iso(column):
+    """Same text as scheduling.iso_date_sql."""
+    return f"(substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2))"
+
+
+def up(cursor):
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_contrat_client_debut "
+                   f"ON Contrat_Forfait (client_id, {_iso('date_debut')}, montant)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_bon_passage_client_jour "
+                   f"ON Bon_Passage_Forfait (client_id, {_iso('date')}, montant) WHERE montant > 0")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_bon_passage_jour_client "
+                   f"ON Bon_Passage_Forfait ({_iso('date')}, client_id, montant) WHERE montant > 0")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_versement_client_jour "
+                   f"ON Versement_Forfait (client_id, {_iso('date')}, montant)")
@@ -0,0 +1,87 @@
+"""Monthly purchase rollups (see backend/purchases.py).
+
+- Achat_Mensuel: per month ("yyyy-mm") and product, the quantity bought, the
+  amount and the prices of the lines of the bons d'achat of the month
+  (qte_prix: the quantity of the lines with a price, which the amount covers).
+- Achat_Versement_Mensuel: per month of the bon, fournisseur and type
+  (Chèque / Espèce), the payments made.
+
+Triggers don't update them: they only record in Achat_Mois_Modifie the
+months whose bons, lines or payments changed, and
+purchases.refresh_monthly_purchases() computes these months again (a month
+is a few thousand bons, read with the index on their month). Every month is
+marked as changed here, so the first refresh fills the tables.
+
+The index on (fournisseur, ISO date, amounts) of the bons covers the
+payables report; its date is the expression of scheduling.iso_date_sql.
+"""
+
+
+def _month(column):
+    """Same text as purchases.month_sql."""
+    return f"(substr({column}, 7, 4) || '-' || substr({column}, 4, 2))"
+
+
+def _iso(column):
+    """Same text as scheduling.iso_date_sql."""
+    return f"(substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2))"
+
+
+def up(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Achat_Mensuel (
+            mois TEXT NOT NULL,
+            produit TEXT NOT NULL,
+            qte REAL NOT NULL,
+            qte_prix REAL NOT NULL,
+            montant REAL NOT NULL,
+            lignes INTEGER NOT NULL,
+            prix_min REAL,
+            prix_max REAL,
+            PRIMARY KEY (mois, produit)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Achat_Versement_Mensuel (
+            mois TEXT NOT NULL,
+            fournisseur TEXT NOT NULL,
+            type TEXT NOT NULL,
+            montant REAL NOT NULL,
+            PRIMARY KEY (mois, fournisseur, type)
+        )
+    """)
+    cursor.execute("CREATE TABLE IF NOT EXISTS Achat_Mois_Modifie (mois TEXT PRIMARY KEY)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_bon_achats_mois ON Bon_Achats ({_month('date')})")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_bon_achats_fournisseur "
+                   f"ON Bon_Achats (fournisseur, {_iso('date')}, montant_total, montant_verse)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_produits_bon_achat_bon ON Produits_Bon_Achat (bon_achat_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_versement_bon_achat_bon ON Versement_Bon_Achat (bon_achat_id, type, montant)")
+
+    # Month of the bon of a line or payment (nothing when the bon was deleted: its own trigger
+    # records the month). An updated row may have moved to another bon: both months are recorded.
+    for table in ["Produits_Bon_Achat", "Versement_Bon_Achat"]:
+        for event, rows in [("INSERT", ["NEW"]), ("UPDATE", ["OLD", "NEW"]), ("DELETE", ["OLD"])]:
+            statements = "\n".join(f"INSERT OR IGNORE INTO Achat_Mois_Modifie (mois) "
+                                   f"SELECT {_month('date')} FROM Bon_Achats WHERE id = {row}.bon_achat_id;"
+                                   for row in rows)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS achat_mensuel_{table.lower()}_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    {statements}
+                END
+            """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS achat_mensuel_bon_achats_update AFTER UPDATE OF date, fournisseur ON Bon_Achats
+        BEGIN
+            INSERT OR IGNORE INTO Achat_Mois_Modifie (mois) VALUES ({_month('OLD.date')});
+            INSERT OR IGNORE INTO Achat_Mois_Modifie (mois) VALUES ({_month('NEW.date')});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS achat_mensuel_bon_achats_delete AFTER DELETE ON Bon_Achats
+        BEGIN
+            INSERT OR IGNORE INTO Achat_Mois_Modifie (mois) VALUES ({_month('OLD.date')});
+        END
+    """)
+
+    cursor.execute(f"INSERT OR IGNORE INTO Achat_Mois_Modifie (mois) SELECT DISTINCT {_month('date')} FROM Bon_Achats")
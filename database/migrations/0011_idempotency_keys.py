@@ -0,0 +1,23 @@
+"""Idempotency_Key: the responses of the POST requests sent with an Idempotency-Key header
+(see backend/idempotency.py).
+
+A key is recorded before its request runs (status NULL while it runs), with a
+fingerprint of the request, and gets the response once it is sent: its status,
+its headers (a JSON list of [name, value] pairs, replayed with the body) and
+its body. Keys older than the TTL are deleted by the job
+"purge_cles_idempotence".
+"""
+
+
+def up(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Idempotency_Key (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            status INTEGER,
+            headers TEXT,
+            body BLOB,
+            created_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_key_created ON Idempotency_Key (created_at)")
@@ -0,0 +1,30 @@
+"""Version of the clients, contracts and bons d'achat (see backend/versioning.py).
+
+The version starts at 1. The PUT handlers add 1 in their UPDATE, and a trigger
+adds 1 on the other updates of the row, so the changes made by the jobs and
+by the other requests (a contract update changes its client) count too. The derived columns don't change the version:
+lat/lng, rewritten by the spatial index, and the montant_verse of a bon,
+the sum of its versements (recomputed by every update of the bon).
+"""
+
+from migrations import add_column
+
+TABLES = ["Client_Forfait", "Contrat_Forfait", "Bon_Achats"]
+
+# Derived columns, and the version itself
+IGNORED_COLUMNS = ["lat", "lng", "montant_verse", "version"]
+
+
+def up(cursor):
+    for table in TABLES:
+        add_column(cursor, table, "version", "INTEGER NOT NULL DEFAULT 1")
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = [row[1] for row in cursor.fetchall() if row[1] not in IGNORED_COLUMNS]
+        # Not fired again by its own UPDATE: version isn't one of the watched columns
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS version_{table.lower()} AFTER UPDATE OF {', '.join(columns)} ON {table}
+            WHEN NEW.version = OLD.version
+            BEGIN
+                UPDATE {table} SET version = OLD.version + 1 WHERE id = NEW.id;
+            END
+        """)
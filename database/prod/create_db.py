@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 import sqlite3
 import os
+import sys
 
 # This script is run from database/prod directory, so no need to create other directories
 # Just create the database in the current directory
@@ -9,19 +10,20 @@ cursor = conn.cursor()
 
 cursor.execute('PRAGMA foreign_keys = ON;')
 
-cursor.execute('DROP TABLE IF EXISTS Agents')
+# The tables are created and updated by the migrations of database/migrations
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend'))
+import migrations
+
+applied = migrations.migrate(conn)
+print(f"Migrations applied: {applied}")
+
+
+def insert_if_empty(table, statement, rows):
+    """Insert the sample rows of a table, only if the table is still empty."""
+    cursor.execute(f'SELECT COUNT(*) FROM {table}')
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany(statement, rows)
 
-cursor.execute('''
-CREATE TABLE Agents (
-    id INTEGER PRIMARY KEY,
-    nom TEXT NOT NULL UNIQUE,
-    telephone TEXT NOT NULL UNIQUE,
-    whatsapp TEXT NOT NULL UNIQUE,
-    gps TEXT NOT NULL UNIQUE,
-    regime TEXT NOT NULL,
-    notification TEXT NOT NULL
-)
-''')
 
 # Insert mock data for Agents
 agents_data = [
@@ -30,19 +32,11 @@ agents_data = [
     (3, 'Karim Benali', '0770123456', '0770123456', '36.36752, 6.61290', 'Forfait & Réel', 'Actif')
 ]
 
-cursor.executemany('''
+insert_if_empty('Agents', '''
 INSERT INTO Agents (id, nom, telephone, whatsapp, gps, regime, notification)
 VALUES (?, ?, ?, ?, ?, ?, ?)
 ''', agents_data)
 
-cursor.execute('DROP TABLE IF EXISTS Produit')
-cursor.execute('''
-CREATE TABLE Produit (
-    id INTEGER PRIMARY KEY,
-    designation TEXT NOT NULL UNIQUE
-)
-''')
-
 # Insert mock data for Products
 produit_data = [
     (1, 'Conteneur pour déchets 240L'),
@@ -50,20 +44,11 @@ produit_data = [
     (3, 'Kit de nettoyage professionnel')
 ]
 
-cursor.executemany('''
+insert_if_empty('Produit', '''
 INSERT INTO Produit (id, designation)
 VALUES (?, ?)
 ''', produit_data)
 
-cursor.execute('DROP TABLE IF EXISTS Service')
-cursor.execute('''
-CREATE TABLE Service (
-    id INTEGER PRIMARY KEY,
-    designation TEXT NOT NULL UNIQUE,
-    incineration TEXT NOT NULL CHECK (incineration IN ('Oui', 'Non'))
-)
-''')
-
 # Insert mock data for Services
 service_data = [
     (1, 'Collecte de déchets industriels', 'Non'),
@@ -71,21 +56,11 @@ service_data = [
     (3, 'Conseil en gestion des déchets', 'Oui')
 ]
 
-cursor.executemany('''
+insert_if_empty('Service', '''
 INSERT INTO Service (id, designation, incineration)
 VALUES (?, ?, ?)
 ''', service_data)
 
-cursor.execute('DROP TABLE IF EXISTS Inventaire')
-cursor.execute('''
-CREATE TABLE Inventaire (
-    id INTEGER PRIMARY KEY,
-    produit TEXT NOT NULL UNIQUE,
-    qte INTEGER NOT NULL CHECK (qte > 0),
-    prix_dernier REAL NOT NULL CHECK (prix_dernier > 0)
-)
-''')
-
 # Insert mock data for Inventory
 inventaire_data = [
     (1, 'Conteneur pour déchets 240L', 10, 15000.00),
@@ -93,21 +68,11 @@ inventaire_data = [
     (3, 'Kit de nettoyage professionnel', 5, 8000.00)
 ]
 
-cursor.executemany('''
+insert_if_empty('Inventaire', '''
 INSERT INTO Inventaire (id, produit, qte, prix_dernier)
 VALUES (?, ?, ?, ?)
 ''', inventaire_data)
 
-cursor.execute('DROP TABLE IF EXISTS Fournisseur')
-cursor.execute('''
-CREATE TABLE Fournisseur (
-    id INTEGER PRIMARY KEY,
-    nom TEXT NOT NULL UNIQUE,
-    telephone TEXT NOT NULL UNIQUE,
-    adresse TEXT NOT NULL
-)
-''')
-
 # Insert mock data for Suppliers
 fournisseur_data = [
     (1, 'EcoSolutions Algérie', '0555789123', '15 Rue Didouche Mourad, Alger'),
@@ -116,22 +81,11 @@ fournisseur_data = [
     (4, 'RecyclAlgeria', '0555123789', '42 Avenue Hassiba Ben Bouali, Alger')
 ]
 
-cursor.executemany('''
+insert_if_empty('Fournisseur', '''
 INSERT INTO Fournisseur (id, nom, telephone, adresse)
 VALUES (?, ?, ?, ?)
 ''', fournisseur_data)
 
-cursor.execute('DROP TABLE IF EXISTS Bon_Achats')
-cursor.execute('''
-CREATE TABLE Bon_Achats (
-    id INTEGER PRIMARY KEY,
-    date TEXT NOT NULL,
-    fournisseur TEXT NOT NULL,
-    montant_total REAL DEFAULT 0,
-    montant_verse REAL DEFAULT 0
-)
-''')
-
 # Insert mock data for Purchase Orders
 bon_achats_data = [
     (1, '15/03/2024', 'EcoSolutions Algérie', 15200.00, 0),
@@ -146,23 +100,11 @@ bon_achats_data = [
     (10, '03/04/2024', 'GreenTech SARL', 25000.00, 0)
 ]
 
-cursor.executemany('''
+insert_if_empty('Bon_Achats', '''
 INSERT INTO Bon_Achats (id, date, fournisseur, montant_total, montant_verse)
 VALUES (?, ?, ?, ?, ?)
 ''', bon_achats_data)
 
-cursor.execute('DROP TABLE IF EXISTS Produits_Bon_Achat')
-cursor.execute('''
-CREATE TABLE Produits_Bon_Achat (
-    id INTEGER PRIMARY KEY,
-    produit TEXT NOT NULL,
-    qte INTEGER NOT NULL CHECK (qte > 0),
-    prix REAL CHECK (prix IS NULL OR prix > 0),
-    bon_achat_id INTEGER NOT NULL,
-    FOREIGN KEY (bon_achat_id) REFERENCES Bon_Achats(id) ON DELETE CASCADE
-)
-''')
-
 # Insert mock data for Purchase Order Products
 produits_bon_achat_data = [
     (1, 'Conteneur pour déchets 240L', 5, 15000.00, 1),
@@ -177,67 +119,25 @@ produits_bon_achat_data = [
     (10, 'Conteneur pour déchets 240L', 2, 15000.00, 9)
 ]
 
-cursor.executemany('''
+insert_if_empty('Produits_Bon_Achat', '''
 INSERT INTO Produits_Bon_Achat (id, produit, qte, prix, bon_achat_id)
 VALUES (?, ?, ?, ?, ?)
 ''', produits_bon_achat_data)
 
-cursor.execute('DROP TABLE IF EXISTS Versement_Bon_Achat')
-cursor.execute('''
-CREATE TABLE Versement_Bon_Achat (
-    id INTEGER PRIMARY KEY,
-    montant REAL NOT NULL CHECK (montant > 0),
-    type TEXT NOT NULL CHECK (type IN ('Chèque', 'Espèce')),
-    bon_achat_id INTEGER NOT NULL,
-    FOREIGN KEY (bon_achat_id) REFERENCES Bon_Achats(id) ON DELETE CASCADE
-)
-''')
-
-cursor.execute('DROP TABLE IF EXISTS Client_Forfait')
-cursor.execute('''
-CREATE TABLE Client_Forfait (
-    id INTEGER PRIMARY KEY,
-    nom TEXT NOT NULL,
-    specialite TEXT,
-    tel TEXT NOT NULL,
-    mode INTEGER NOT NULL CHECK (mode IN (30, 60, 90)),
-    agent TEXT NOT NULL,
-    etat_contrat TEXT CHECK (etat_contrat IS NULL OR etat_contrat IN ('Actif', 'Pause', 'Terminé')),
-    debut_contrat TEXT,
-    fin_contrat TEXT
-)
-''')
-
 # Insert mock data for Clients
 client_data = [
-    (1, 'Algérie Telecom', 'Télécommunications', '023456789', 30, 'Ahmed Kader', None, None, None),
-    (2, 'SEAAL', 'Services des eaux', '021234567', 60, 'Samira Boumediene', None, None, None),
-    (3, 'Clinique El Azhar', 'Santé', '0555123456', 90, 'Karim Benali', None, None, None),
-    (4, 'El Watan', 'Presse', '0661234567', 30, 'Ahmed Kader', None, None, None),
-    (5, 'Air Algérie', 'Transport aérien', '021987654', 60, 'Samira Boumediene', None, None, None)
+    (1, 'Algérie Telecom', 'Télécommunications', '023456789', 30, 'Ahmed Kader', None, None, None, '36.76390, 3.05850'),
+    (2, 'SEAAL', 'Services des eaux', '021234567', 60, 'Samira Boumediene', None, None, None, '35.69710, -0.63080'),
+    (3, 'Clinique El Azhar', 'Santé', '0555123456', 90, 'Karim Benali', None, None, None, '36.36510, 6.61470'),
+    (4, 'El Watan', 'Presse', '0661234567', 30, 'Ahmed Kader', None, None, None, '36.74480, 3.06920'),
+    (5, 'Air Algérie', 'Transport aérien', '021987654', 60, 'Samira Boumediene', None, None, None, '35.70420, -0.64910')
 ]
 
-cursor.executemany('''
-INSERT INTO Client_Forfait (id, nom, specialite, tel, mode, agent, etat_contrat, debut_contrat, fin_contrat)
-VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+insert_if_empty('Client_Forfait', '''
+INSERT INTO Client_Forfait (id, nom, specialite, tel, mode, agent, etat_contrat, debut_contrat, fin_contrat, gps)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
 ''', client_data)
 
-cursor.execute('DROP TABLE IF EXISTS Contrat_Forfait')
-cursor.execute('''
-CREATE TABLE Contrat_Forfait (
-    id INTEGER PRIMARY KEY,
-    date_debut TEXT NOT NULL,
-    date_fin TEXT NOT NULL,
-    montant INTEGER NOT NULL CHECK (montant > 0),
-    prix_exces_poids INTEGER NOT NULL CHECK (prix_exces_poids > 0),
-    poids_forfait INTEGER NOT NULL CHECK (poids_forfait > 0),
-    etat TEXT NOT NULL DEFAULT 'Actif' CHECK (etat IN ('Actif', 'Pause', 'Terminé')),
-    client_id INTEGER NOT NULL,
-    FOREIGN KEY (client_id) REFERENCES Client_Forfait(id) ON DELETE CASCADE,
-    CHECK (date_fin > date_debut)
-)
-''')
-
 # Insert mock data for Contracts
 contrat_data = [
     # Terminated contracts for Algérie Telecom (Client ID 1)
@@ -264,63 +164,15 @@ contrat_data = [
     ('01/07/2023', '31/12/2023', 240000, 1200, 100, 'Terminé', 5)
 ]
 
-cursor.executemany('''
+insert_if_empty('Contrat_Forfait', '''
 INSERT INTO Contrat_Forfait (date_debut, date_fin, montant, prix_exces_poids, poids_forfait, etat, client_id)
 VALUES (?, ?, ?, ?, ?, ?, ?)
 ''', contrat_data)
 
-cursor.execute('DROP TABLE IF EXISTS Bon_Passage_Forfait')
-cursor.execute('''
-CREATE TABLE Bon_Passage_Forfait (
-    id INTEGER PRIMARY KEY,
-    date TEXT NOT NULL,
-    montant INTEGER NOT NULL CHECK (montant >= 0),
-    exces_poids INTEGER NOT NULL CHECK (exces_poids >= 0),
-    poids_collecte INTEGER NOT NULL CHECK (poids_collecte > 0),
-    client_id INTEGER NOT NULL,
-    contrat_id INTEGER NOT NULL,
-    FOREIGN KEY (client_id) REFERENCES Client_Forfait(id) ON DELETE CASCADE,
-    FOREIGN KEY (contrat_id) REFERENCES Contrat_Forfait(id) ON DELETE CASCADE
-)
-''')
-
-cursor.execute('DROP TABLE IF EXISTS Bon_Passage_Forfait_Produits')
-cursor.execute('''
-CREATE TABLE Bon_Passage_Forfait_Produits (
-    id INTEGER PRIMARY KEY,
-    produit TEXT NOT NULL,
-    qte REAL NOT NULL CHECK (qte > 0),
-    prix INTEGER NOT NULL CHECK (prix > 0),
-    bon_passage_id INTEGER NOT NULL,
-    FOREIGN KEY (bon_passage_id) REFERENCES Bon_Passage_Forfait(id) ON DELETE CASCADE
-)
-''')
-
-cursor.execute('DROP TABLE IF EXISTS Bon_Passage_Forfait_Services')
-cursor.execute('''
-CREATE TABLE Bon_Passage_Forfait_Services (
-    id INTEGER PRIMARY KEY,
-    service TEXT NOT NULL,
-    qte REAL CHECK (qte IS NULL OR qte > 0),
-    bon_passage_id INTEGER NOT NULL,
-    FOREIGN KEY (bon_passage_id) REFERENCES Bon_Passage_Forfait(id) ON DELETE CASCADE
-)
-''')
-
-cursor.execute('DROP TABLE IF EXISTS Versement_Forfait')
-cursor.execute('''
-CREATE TABLE Versement_Forfait (
-    id INTEGER PRIMARY KEY,
-    date TEXT NOT NULL,
-    montant INTEGER NOT NULL CHECK (montant > 0),
-    client_id INTEGER NOT NULL,
-    contrat_id INTEGER NOT NULL,
-    FOREIGN KEY (client_id) REFERENCES Client_Forfait(id) ON DELETE CASCADE,
-    FOREIGN KEY (contrat_id) REFERENCES Contrat_Forfait(id) ON DELETE CASCADE
-)
-''')
-
 conn.commit()
+
+# Fill the columns added by the migrations for the sample rows
+migrations.run_backfills(conn, seconds=60)
 conn.close()
 
-print("Database created successfully at database/prod/db.sqlite") 
\ No newline at end of file
+print("Database up to date at database/prod/db.sqlite") 
\ No newline at end of file
@@ -0,0 +1,61 @@
+// Write Brotli (.br) and gzip (.gz) variants of the built files, next to them.
+// The backend serves the variant matching the browser's Accept-Encoding, so
+// nothing has to be compressed while answering a request.
+// Run after "vite build" (see the "build" script in package.json).
+import fs from 'node:fs'
+import path from 'node:path'
+import zlib from 'node:zlib'
+
+const distDir = path.resolve('dist')
+
+// Text files compress well; images and fonts are already compressed
+const compressibleExtensions = ['.html', '.js', '.css', '.svg', '.json', '.txt']
+
+// Small files are not worth it: the headers would be bigger than the savings
+const minimumSize = 1024
+
+function listFiles(directory) {
+  const files = []
+  for (const entry of fs.readdirSync(directory, { withFileTypes: true })) {
+    const entryPath = path.join(directory, entry.name)
+    if (entry.isDirectory()) {
+      files.push(...listFiles(entryPath))
+    } else {
+      files.push(entryPath)
+    }
+  }
+  return files
+}
+
+let originalBytes = 0
+let brotliBytes = 0
+for (const file of listFiles(distDir)) {
+  if (!compressibleExtensions.includes(path.extname(file))) {
+    continue
+  }
+  const content = fs.readFileSync(file)
+  if (content.length < minimumSize) {
+    continue
+  }
+
+  // Build time is free: use the highest compression levels
+  const brotli = zlib.brotliCompressSync(content, {
+    params: {
+      [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY,
+      [zlib.constants.BROTLI_PARAM_SIZE_HINT]: content.length,
+    },
+  })
+  const gzip = zlib.gzipSync(content, { level: zlib.constants.Z_BEST_COMPRESSION })
+
+  // Only keep a variant when it is actually smaller
+  if (brotli.length < content.length) {
+    fs.writeFileSync(file + '.br', brotli)
+  }
+  if (gzip.length < content.length) {
+    fs.writeFileSync(file + '.gz', gzip)
+  }
+  originalBytes += content.length
+  brotliBytes += Math.min(brotli.length, content.length)
+}
+
+console.log(`Compressed assets: ${originalBytes} bytes -> ${brotliBytes} bytes with Brotli`)
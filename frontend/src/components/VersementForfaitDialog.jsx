@@ -23,6 +23,7 @@ import { DatePicker } from '@mui/x-date-pickers/DatePicker';
 import { format } from 'date-fns';
 import fr from 'date-fns/locale/fr';
 import { API_URL } from '../App';
+import useIdempotencyKey from '../hooks/useIdempotencyKey';
 
 /**
  * Dialog component for creating or updating a versement forfait
@@ -48,6 +49,9 @@ const VersementForfaitDialog = ({
   
   // State for loading status
   const [loading, setLoading] = useState(false);
+
+  // Key of the creation: the payment is recorded once, even when the submission is retried
+  const idempotencyKey = useIdempotencyKey();
   
   // State for form errors
   const [errors, setErrors] = useState({});
@@ -149,15 +153,17 @@ const VersementForfaitDialog = ({
         });
       } else {
         // Create new versement
+        const body = JSON.stringify({
+          ...formData,
+          date: formattedDate,
+        });
         response = await fetch(`${API_URL}/versements-forfait`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
+            'Idempotency-Key': idempotencyKey.keyFor(body),
           },
-          body: JSON.stringify({
-            ...formData,
-            date: formattedDate,
-          }),
+          body,
         });
       }
       
@@ -167,6 +173,7 @@ const VersementForfaitDialog = ({
       }
       
       // Show success message and close dialog
+      idempotencyKey.reset();
       showSnackbar('Versement sauvegardé avec succès', 'success');
       onSave(await response.json(), isEditMode);
       onClose();
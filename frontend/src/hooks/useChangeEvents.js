@@ -0,0 +1,36 @@
+import { useEffect, useRef } from 'react';
+import { API_URL } from '../App';
+
+// Subscribe to the change feed of the backend (/api/events).
+// `onChange` receives each event: { table, id, op, version }, op being 'insert', 'update' or 'delete'.
+// `onReset` is called when the backend could not replay the missed changes: the data must be reloaded.
+// EventSource reconnects by itself and sends the last event id, so no change is lost on a short disconnection.
+export default function useChangeEvents(tables, onChange, onReset) {
+  // Keep the latest handlers without reopening the stream on every render
+  const onChangeRef = useRef(onChange);
+  const onResetRef = useRef(onReset);
+  onChangeRef.current = onChange;
+  onResetRef.current = onReset;
+
+  const tablesKey = tables.join(',');
+
+  useEffect(() => {
+    const source = new EventSource(`${API_URL}/events?tables=${encodeURIComponent(tablesKey)}`);
+
+    source.onmessage = (message) => {
+      try {
+        onChangeRef.current(JSON.parse(message.data));
+      } catch (error) {
+        console.error('Error handling change event:', error);
+      }
+    };
+
+    source.addEventListener('reset', () => {
+      if (onResetRef.current) {
+        onResetRef.current();
+      }
+    });
+
+    return () => source.close();
+  }, [tablesKey]);
+}
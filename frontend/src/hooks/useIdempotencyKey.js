@@ -0,0 +1,34 @@
+import { useCallback, useRef } from 'react';
+
+// A random key, from crypto.randomUUID() when the page allows it (it requires https or localhost)
+function newKey() {
+  if (window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  const bytes = window.crypto.getRandomValues(new Uint8Array(16));
+  return Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
+// Idempotency-Key of the POST requests of a form (see backend/idempotency.py).
+// `keyFor(body)` gives the key of a request body: the same one while the same body is sent again
+// (a retry after a lost response is answered with the first response instead of writing twice),
+// a new one when the form changed. A submission sending several requests gets a key for each body;
+// `position` tells apart the requests of a submission that may have the same body (two equal payments).
+// `reset()` after a success, so that the next submission is a new one.
+export default function useIdempotencyKey() {
+  const keys = useRef(new Map());
+
+  const keyFor = useCallback((body, position = 0) => {
+    const request = `${position}:${body}`;
+    if (!keys.current.has(request)) {
+      keys.current.set(request, newKey());
+    }
+    return keys.current.get(request);
+  }, []);
+
+  const reset = useCallback(() => {
+    keys.current = new Map();
+  }, []);
+
+  return { keyFor, reset };
+}
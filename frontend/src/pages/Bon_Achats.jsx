@@ -37,6 +37,7 @@ import { DatePicker } from '@mui/x-date-pickers/DatePicker';
 import { format } from 'date-fns';
 import fr from 'date-fns/locale/fr';
 import { API_URL } from '../App';
+import useIdempotencyKey from '../hooks/useIdempotencyKey';
 
 const Bon_Achats = () => {
   const [bonAchats, setBonAchats] = useState([]);
@@ -53,6 +54,9 @@ const Bon_Achats = () => {
   const [loading, setLoading] = useState(true);
   const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' });
   const [error, setError] = useState(null);
+  // Keys of the POSTs of the form: a save retried after a lost response doesn't write the bon,
+  // its products or its versements twice
+  const idempotencyKey = useIdempotencyKey();
   const [editableFields, setEditableFields] = useState({
     date: false,
     fournisseur: false,
@@ -308,9 +312,14 @@ const Bon_Achats = () => {
           headers: {
             'Content-Type': 'application/json',
           },
-          body: JSON.stringify(bonData),
+          // Version read: the update is refused (409) if the bon changed since
+          body: JSON.stringify({ ...bonData, version: selectedBon.version }),
         });
 
+        if (updateResponse.status === 409) {
+          const errorData = await updateResponse.json();
+          throw new Error(errorData.detail);
+        }
         if (!updateResponse.ok) throw new Error('Erreur lors de la mise à jour du bon d\'achat');
         
         // Get all existing versements
@@ -337,14 +346,19 @@ const Bon_Achats = () => {
             });
           }
         }
+
+        // The lines were deleted: they are added again with new keys (a replayed response wouldn't add them)
+        idempotencyKey.reset();
       } else {
         // Adding a new bon d'achat
+        const body = JSON.stringify(bonData);
         const response = await fetch(`${API_URL}/bon-achats`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
+            'Idempotency-Key': idempotencyKey.keyFor(body),
           },
-          body: JSON.stringify(bonData),
+          body,
         });
 
         if (!response.ok) throw new Error('Erreur lors de l\'enregistrement');
@@ -355,18 +369,20 @@ const Bon_Achats = () => {
 
       // Save products
       const validProducts = formData.produits.filter(p => p.produit && p.qte);
-      for (const product of validProducts) {
+      for (const [index, product] of validProducts.entries()) {
+        const body = JSON.stringify({
+          produit: product.produit,
+          qte: parseInt(product.qte),
+          prix: product.prix ? parseFloat(product.prix) : null,
+          bon_achat_id: bonId
+        });
         await fetch(`${API_URL}/bon-achats/${bonId}/produits`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
+            'Idempotency-Key': idempotencyKey.keyFor(body, index),
           },
-          body: JSON.stringify({
-            produit: product.produit,
-            qte: parseInt(product.qte),
-            prix: product.prix ? parseFloat(product.prix) : null,
-            bon_achat_id: bonId
-          }),
+          body,
         });
       }
 
@@ -377,18 +393,21 @@ const Bon_Achats = () => {
       // Log the versements being saved
       console.log('Valid versements to save:', validVersements);
       
-      for (const versement of validVersements) {
+      let versementFailed = false;
+      for (const [index, versement] of validVersements.entries()) {
         try {
+          const body = JSON.stringify({
+            montant: parseFloat(versement.montant),
+            type: versement.type,
+            bon_achat_id: bonId
+          });
           const versementResponse = await fetch(`${API_URL}/bon-achats/${bonId}/versements`, {
             method: 'POST',
             headers: {
               'Content-Type': 'application/json',
+              'Idempotency-Key': idempotencyKey.keyFor(body, index),
             },
-            body: JSON.stringify({
-              montant: parseFloat(versement.montant),
-              type: versement.type,
-              bon_achat_id: bonId
-            }),
+            body,
           });
           
           if (!versementResponse.ok) {
@@ -401,10 +420,15 @@ const Bon_Achats = () => {
         } catch (error) {
           console.error('Error in versement save:', error);
           showSnackbar(`Erreur lors de l'enregistrement d'un versement: ${error.message}`, 'error');
+          versementFailed = true;
           // Continue with other versements even if one fails
         }
       }
 
+      // Keys kept after a failed versement: saving again doesn't repeat the versements written
+      if (!versementFailed) {
+        idempotencyKey.reset();
+      }
       showSnackbar(
         selectedBon 
           ? 'Bon d\'achat modifié avec succès' 
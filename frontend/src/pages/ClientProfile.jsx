@@ -52,6 +52,8 @@ import fr from 'date-fns/locale/fr';
 import { useParams, useNavigate } from 'react-router-dom';
 import VersementForfaitDialog from '../components/VersementForfaitDialog';
 import { API_URL } from '../App';
+import useChangeEvents from '../hooks/useChangeEvents';
+import useIdempotencyKey from '../hooks/useIdempotencyKey';
 
 /**
  * ClientProfile component displays a full page with client details, editable fields,
@@ -225,6 +227,90 @@ const ClientProfile = () => {
     }
   }, [id]);
 
+  // Contract state of the client, kept by the backend (contract saved or deleted here,
+  // contract expired by the nightly job, or changed from another browser)
+  const refreshContractState = async () => {
+    try {
+      const clientResponse = await fetch(`${API_URL}/clients/${id}`);
+      if (!clientResponse.ok) {
+        throw new Error(`Erreur HTTP: ${clientResponse.status}`);
+      }
+      const updatedClientData = await clientResponse.json();
+      // The form takes the new version only when the contract fields alone changed: after a change
+      // of the other fields (from another browser), saving the form is refused (409) instead of undoing it
+      const otherFieldsChanged = client !== null && ['nom', 'specialite', 'tel', 'mode', 'agent', 'gps']
+        .some(name => client[name] !== updatedClientData[name]);
+      setClient(updatedClientData);
+
+      // Only the contract fields: the other fields may be being edited in the form
+      setFormData(prev => ({
+        ...prev,
+        etat_contrat: updatedClientData.etat_contrat,
+        debut_contrat: updatedClientData.debut_contrat ? parse(updatedClientData.debut_contrat, 'dd/MM/yyyy', new Date()) : null,
+        fin_contrat: updatedClientData.fin_contrat ? parse(updatedClientData.fin_contrat, 'dd/MM/yyyy', new Date()) : null,
+        version: otherFieldsChanged ? prev.version : updatedClientData.version
+      }));
+    } catch (error) {
+      console.error('Error refreshing client contract state:', error);
+    }
+  };
+
+  // Listen to the changes of this client instead of re-fetching it after each action
+  useChangeEvents(['Client_Forfait'], (event) => {
+    if (event.id === Number(id) && event.op === 'update') {
+      refreshContractState();
+    }
+  }, refreshContractState);
+
+  // Keys of the bon de passage POSTs: a submission retried after a lost response doesn't create the bon twice
+  const bonPassageIdempotencyKey = useIdempotencyKey();
+
+  // Send the consommables and the services of a bon de passage (one bulk request per list)
+  const saveBonPassageLines = async (bonPassageId) => {
+    const lines = [
+      {
+        path: 'produits',
+        label: 'des produits',
+        items: bonPassageData.consommables.map(consommable => ({
+          produit: consommable.produit,
+          qte: parseFloat(consommable.qte),
+          prix: parseInt(consommable.prix),
+          bon_passage_id: bonPassageId
+        }))
+      },
+      {
+        path: 'services',
+        label: 'des services',
+        items: bonPassageData.services.map(service => ({
+          service: service.service,
+          qte: service.qte ? parseFloat(service.qte) : null,
+          bon_passage_id: bonPassageId
+        }))
+      }
+    ];
+
+    for (const { path, label, items } of lines) {
+      if (items.length === 0) {
+        continue;
+      }
+      const body = JSON.stringify(items);
+      const response = await fetch(`${API_URL}/bon-passage-forfait/${bonPassageId}/${path}/lot`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Idempotency-Key': bonPassageIdempotencyKey.keyFor(body),
+        },
+        body,
+      });
+
+      if (!response.ok) {
+        const errorText = await response.text();
+        console.error(`Error adding ${path}:`, errorText);
+        throw new Error(`Erreur lors de l'ajout ${label}: ${errorText}`);
+      }
+    }
+  };
+
   // Fetch bons de passage for the client
   const fetchBonsPassage = async (clientId) => {
     try {
@@ -346,6 +432,7 @@ const ClientProfile = () => {
       }
       
       const updatedClient = await response.json();
+      setClient(updatedClient);
       
       // Update the form data with the response
       setFormData({
@@ -505,18 +592,20 @@ const ClientProfile = () => {
       console.log(`Total montant: ${totalMontant} (includes excess weight cost)`);
       
       // Create bon passage with explicit non-null values
+      const bonPassageBody = JSON.stringify({
+        client_id: bonPassageData.client_id,
+        date: format(bonPassageData.date, 'yyyy-MM-dd'),
+        poids_collecte: poidsCollecte,
+        exces_poids: excesPoids,
+        montant: totalMontant
+      });
       const bonPassageResponse = await fetch(`${API_URL}/bon-passage-forfait`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': bonPassageIdempotencyKey.keyFor(bonPassageBody),
         },
-        body: JSON.stringify({
-          client_id: bonPassageData.client_id,
-          date: format(bonPassageData.date, 'yyyy-MM-dd'),
-          poids_collecte: poidsCollecte,
-          exces_poids: excesPoids,
-          montant: totalMontant
-        }),
+        body: bonPassageBody,
       });
 
       if (!bonPassageResponse.ok) {
@@ -530,57 +619,10 @@ const ClientProfile = () => {
 
       console.log('Created bon passage with ID:', bonPassageId);
 
-      // Add consommables
-      for (const consommable of bonPassageData.consommables) {
-        const produitData = {
-          produit: consommable.produit,
-          qte: parseFloat(consommable.qte),
-          prix: parseInt(consommable.prix),
-          bon_passage_id: bonPassageId
-        };
-        
-        console.log('Sending produit data:', produitData);
-        
-        const produitResponse = await fetch(`${API_URL}/bon-passage-forfait/${bonPassageId}/produits`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(produitData),
-        });
-        
-        if (!produitResponse.ok) {
-          const errorText = await produitResponse.text();
-          console.error('Error adding produit:', errorText);
-          throw new Error(`Erreur lors de l'ajout du produit: ${errorText}`);
-        }
-      }
-
-      // Add services
-      for (const service of bonPassageData.services) {
-        const serviceData = {
-          service: service.service,
-          qte: service.qte ? parseFloat(service.qte) : null,
-          bon_passage_id: bonPassageId
-        };
-        
-        console.log('Sending service data:', serviceData);
-        
-        const serviceResponse = await fetch(`${API_URL}/bon-passage-forfait/${bonPassageId}/services`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(serviceData),
-        });
-        
-        if (!serviceResponse.ok) {
-          const errorText = await serviceResponse.text();
-          console.error('Error adding service:', errorText);
-          throw new Error(`Erreur lors de l'ajout du service: ${errorText}`);
-        }
-      }
+      // Add consommables and services, each list in one request
+      await saveBonPassageLines(bonPassageId);
 
+      bonPassageIdempotencyKey.reset();
       showSnackbar('Bon de passage créé avec succès', 'success');
       handleCloseBonPassageDialog();
       fetchBonsPassage(client.id);
@@ -734,18 +776,20 @@ const ClientProfile = () => {
       }
 
       // Create new bon passage with modified data
+      const createBody = JSON.stringify({
+        date: formattedDate,
+        client_id: client.id,
+        montant: totalMontant,
+        exces_poids: bonPassageData.exces_poids,
+        poids_collecte: poidsCollecte
+      });
       const createResponse = await fetch(`${API_URL}/bon-passage-forfait`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': bonPassageIdempotencyKey.keyFor(createBody),
         },
-        body: JSON.stringify({
-          date: formattedDate,
-          client_id: client.id,
-          montant: totalMontant,
-          exces_poids: bonPassageData.exces_poids,
-          poids_collecte: poidsCollecte
-        }),
+        body: createBody,
       });
 
       if (!createResponse.ok) {
@@ -755,49 +799,10 @@ const ClientProfile = () => {
       const newBonPassage = await createResponse.json();
       const bonPassageId = newBonPassage.id;
 
-      // Add consommables
-      for (const consommable of bonPassageData.consommables) {
-        const produitData = {
-          produit: consommable.produit,
-          qte: parseFloat(consommable.qte),
-          prix: parseInt(consommable.prix),
-          bon_passage_id: bonPassageId
-        };
-        
-        const produitResponse = await fetch(`${API_URL}/bon-passage-forfait/${bonPassageId}/produits`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(produitData),
-        });
-        
-        if (!produitResponse.ok) {
-          throw new Error(`Erreur lors de l'ajout du produit: ${produitResponse.status}`);
-        }
-      }
-
-      // Add services
-      for (const service of bonPassageData.services) {
-        const serviceData = {
-          service: service.service,
-          qte: service.qte ? parseFloat(service.qte) : null,
-          bon_passage_id: bonPassageId
-        };
-        
-        const serviceResponse = await fetch(`${API_URL}/bon-passage-forfait/${bonPassageId}/services`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(serviceData),
-        });
-        
-        if (!serviceResponse.ok) {
-          throw new Error(`Erreur lors de l'ajout du service: ${serviceResponse.status}`);
-        }
-      }
+      // Add consommables and services, each list in one request
+      await saveBonPassageLines(bonPassageId);
 
+      bonPassageIdempotencyKey.reset();
       showSnackbar('Bon de passage modifié avec succès', 'success');
       handleCloseViewBonPassageDialog();
       fetchBonsPassage(client.id);
@@ -867,7 +872,9 @@ const ClientProfile = () => {
       prix_exces_poids: contract.prix_exces_poids,
       poids_forfait: contract.poids_forfait,
       client_id: contract.client_id,
-      etat: contract.etat
+      etat: contract.etat,
+      // Version read: the update is refused (409) if the contract changed since
+      version: contract.version
     });
     setOpenContractDialog(true);
   };
@@ -932,21 +939,7 @@ const ClientProfile = () => {
       
       // Refresh contracts list
       await fetchContracts(client.id);
-      
-      // Update client data to reflect contract changes
-      const clientResponse = await fetch(`${API_URL}/clients/${client.id}`);
-      if (!clientResponse.ok) {
-        throw new Error(`Erreur HTTP: ${clientResponse.status}`);
-      }
-      const updatedClientData = await clientResponse.json();
-      setClient(updatedClientData);
-      
-      // Update form data with fresh client data
-      setFormData({
-        ...updatedClientData,
-        debut_contrat: updatedClientData.debut_contrat ? parse(updatedClientData.debut_contrat, 'dd/MM/yyyy', new Date()) : null,
-        fin_contrat: updatedClientData.fin_contrat ? parse(updatedClientData.fin_contrat, 'dd/MM/yyyy', new Date()) : null
-      });
+      // The contract state of the client arrives through the change feed (useChangeEvents)
 
       setContractData({
         date_debut: new Date(),
@@ -989,21 +982,7 @@ const ClientProfile = () => {
       
       // Refresh contracts list
       await fetchContracts(client.id);
-      
-      // Update client data to reflect contract changes
-      const clientResponse = await fetch(`${API_URL}/clients/${client.id}`);
-      if (!clientResponse.ok) {
-        throw new Error(`Erreur HTTP: ${clientResponse.status}`);
-      }
-      const updatedClientData = await clientResponse.json();
-      setClient(updatedClientData);
-      
-      // Update form data with fresh client data
-      setFormData({
-        ...updatedClientData,
-        debut_contrat: updatedClientData.debut_contrat ? parse(updatedClientData.debut_contrat, 'dd/MM/yyyy', new Date()) : null,
-        fin_contrat: updatedClientData.fin_contrat ? parse(updatedClientData.fin_contrat, 'dd/MM/yyyy', new Date()) : null
-      });
+      // The contract state of the client arrives through the change feed (useChangeEvents)
       
       showSnackbar('Contrat supprimé avec succès', 'success');
     } catch (error) {